@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import os
 import json
 
 st.title("Mechanism Simulator")
@@ -14,7 +15,7 @@ st.markdown("""
 """)
 
 st.title("Leaderboard:")
-st.write("Here you can see the times of the PC's trying to simulate various configurations. Rendering times will only be ranked if you use default settings (simulation resolution = 5.00 and framerate = 240).")
+st.write("Here you can see the times of the PC's simulating and animating the configurations at the default settings (simulation resolution = 5.00 and framerate = 240): median of the full sweep plus GIF encode from the benchmark suite. Run `python -m modules.cli bench` to add your PC.")
 
 # Load leaderboard data from JSON file
 with open('leaderboard.json', 'r') as file:
@@ -39,4 +40,30 @@ filtered_df['Rank'] = range(1, len(filtered_df) + 1)
 filtered_df = filtered_df.reset_index()
 filtered_df = filtered_df[['Rank', 'PC', 'Time']]
 
-st.table(filtered_df.set_index('Rank'))
\ No newline at end of file
+st.table(filtered_df.set_index('Rank'))
+
+# Stage by stage results of the benchmark reports (benchmarks/<PC>.json), to spot which stage got slower
+reports = []
+if os.path.isdir('benchmarks'):
+    for file_name in sorted(f for f in os.listdir('benchmarks') if f.endswith('.json')):
+        with open(os.path.join('benchmarks', file_name), 'r') as file:
+            reports.append(json.load(file))
+
+if reports:
+    st.subheader("Benchmark stages")
+    benchmarks = sorted({name for report in reports for name in report['results']})
+    selected_benchmark = st.selectbox("Select Benchmark", benchmarks,
+                                      index=benchmarks.index(selected_config) if selected_config in benchmarks else 0)
+    rows = []
+    for report in reports:
+        stages = report['results'].get(selected_benchmark, {})
+        for stage, summary in stages.items():
+            if isinstance(summary, dict):
+                rows.append({'PC': report['fingerprint']['machine'], 'Stage': stage, 'Median [ms]': summary['median'] * 1e3,
+                             'P90 [ms]': summary['p90'] * 1e3, 'Run': report['created']})
+    stage_df = pd.DataFrame(rows)
+    if not stage_df.empty:
+        st.table(stage_df.pivot(index='Stage', columns='PC', values='Median [ms]').reindex(stage_df['Stage'].unique()))
+        with st.expander("Details"):
+            st.dataframe(stage_df, hide_index=True)
+            st.json({report['fingerprint']['machine']: report['fingerprint'] for report in reports}, expanded=False)
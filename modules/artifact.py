@@ -0,0 +1,227 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from mechanism import Mechanism
+from json2config import load_mechanism_from_dict
+from solver import AnalyticSolver
+
+# compiled mechanism artifacts: a configuration is parsed and validated once, its arrays (joints, rods, flags, reference rod
+# lengths, dyad solve order and structural analysis) are written as one uncompressed .npz named by the hash of the JSON content.
+# Loading an artifact reads the arrays back without JSON parsing, validation or structural analysis; artifacts are kept in
+# memory (least recently used first out beyond ARTIFACT_CACHE_BUDGET) and in ARTIFACT_DIR, an edited configuration gets a new
+# hash and is compiled again.
+
+# increased whenever the arrays of an artifact change, older artifacts are compiled again
+ARTIFACT_VERSION = 1
+ARTIFACT_DIR = os.path.join(".cache", "mechanisms")
+# memory budget of the artifacts kept in memory in bytes, evicted ones are read from ARTIFACT_DIR again
+ARTIFACT_CACHE_BUDGET = 64 * 1024 ** 2
+ARRAYS = ["positions", "rod_indices", "pinned", "rotating", "rotation_centers", "ref_rod_lengths", "solve_order_joints",
+          "solve_order_values", "names", "structure", "version"]
+
+def hash_config_file(config_path: str):
+    # content hash, so an edited configuration with the same file name is compiled (and solved) again
+    with open(config_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def compile_config(config: dict):
+    # parsed configuration -> artifact arrays {name: array}, validated like load_mechanism_from_config
+    mechanism = load_mechanism_from_dict(config)
+    structure = mechanism.analyze_structure()
+    solver = AnalyticSolver(mechanism)
+    order = solver.solve_order
+    return {
+        "positions": mechanism.get_joint_coords_array(),
+        "rod_indices": mechanism.rod_indices,
+        "pinned": mechanism.pinned,
+        "rotating": mechanism.rotating,
+        "rotation_centers": mechanism.rotation_centers,
+        "ref_rod_lengths": solver.ref_rod_lengths,
+        # (joint, parent a, parent b) and (length a, length b, branch) of every dyad step
+        "solve_order_joints": np.array([step[:3] for step in order], dtype=np.int64).reshape(-1, 3),
+        "solve_order_values": np.array([step[3:] for step in order], dtype=float).reshape(-1, 3),
+        "names": np.array([joint["joint_name"] for joint in config["joints"] if joint["joint_name"] != config.get("rotation_center")]),
+        "structure": np.array(json.dumps(structure, default=int)),
+        "version": np.array(ARTIFACT_VERSION),
+    }
+
+def mechanism_from_artifact(artifact: dict):
+    # new mechanism (its own position array) with the structural analysis and solve order of the artifact
+    mechanism = Mechanism.from_arrays(artifact["positions"], artifact["rod_indices"], artifact["pinned"], artifact["rotating"],
+                                      artifact["rotation_centers"])
+    mechanism.structure = json.loads(str(artifact["structure"]))
+    mechanism.solve_order = [(int(j), int(a), int(b), float(r_a), float(r_b), float(branch)) for (j, a, b), (r_a, r_b, branch)
+                             in zip(artifact["solve_order_joints"].tolist(), artifact["solve_order_values"].tolist())]
+    return mechanism
+
+def save_artifact(artifact: dict, path: str):
+    # written to a temporary file first and renamed, so a concurrent reader never sees a half written artifact
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(suffix=".npz", dir=directory)
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, **artifact)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return path
+
+def artifact_size(artifact: dict): # bytes of the arrays
+    return sum(array.nbytes for array in artifact.values())
+
+def read_artifact(path: str):
+    # {name: array} or None for a missing, unreadable or outdated artifact
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if set(data.files) != set(ARRAYS) or int(data["version"]) != ARTIFACT_VERSION:
+                return None
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+
+class ArtifactCache:
+    # compiled artifacts by content hash, on disk and in an LRU cache in memory
+    def __init__(self, directory: str = ARTIFACT_DIR, budget: int = ARTIFACT_CACHE_BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.artifacts = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.compiled = 0 # configurations compiled by this cache (neither in memory nor on disk)
+        self.disk_loads = 0
+
+    def artifact_path(self, config_hash: str):
+        return os.path.join(self.directory, f"{config_hash}.npz")
+
+    def get_artifact(self, config_path: str):
+        config_hash = hash_config_file(config_path)
+        with self.lock:
+            artifact = self.artifacts.get(config_hash)
+            if artifact is not None:
+                self.artifacts.move_to_end(config_hash)
+                return artifact
+        artifact = read_artifact(self.artifact_path(config_hash))
+        if artifact is not None:
+            self.disk_loads += 1
+        else:
+            with open(config_path, "r") as f:
+                artifact = compile_config(json.load(f))
+            self.compiled += 1
+            try:
+                save_artifact(artifact, self.artifact_path(config_hash))
+            except OSError:
+                pass # read-only checkout: the artifact stays in memory only (and is compiled again once evicted)
+        for array in artifact.values():
+            array.setflags(write=False) # shared by all mechanisms built from it
+        with self.lock:
+            if config_hash in self.artifacts: # compiled by another thread meanwhile
+                return self.artifacts[config_hash]
+            self.artifacts[config_hash] = artifact
+            self.size += artifact_size(artifact)
+            # evict the least recently used artifacts until the budget is kept (the newest one always stays)
+            while self.size > self.budget and len(self.artifacts) > 1:
+                _, evicted = self.artifacts.popitem(last=False)
+                self.size -= artifact_size(evicted)
+            return artifact
+
+    def load_mechanism(self, config_path: str):
+        # same mechanism as load_mechanism_from_config, from the compiled artifact of the configuration
+        return mechanism_from_artifact(self.get_artifact(config_path))
+
+    def clear(self):
+        with self.lock:
+            self.artifacts.clear()
+            self.size = 0
+
+# artifact cache of the process (pages, trajectory cache, worker processes)
+_artifact_cache = ArtifactCache()
+
+def load_mechanism(config_path: str):
+    return _artifact_cache.load_mechanism(config_path)
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/artifact.py
+    import time
+    import shutil
+    from json2config import load_mechanism_from_config
+    config_dir = "configurations"
+    test_dir = tempfile.mkdtemp()
+    try:
+        cache = ArtifactCache(test_dir)
+        angles = np.deg2rad(np.arange(0, 361, 1.0))
+        for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+            config_path = os.path.join(config_dir, config_file)
+            reference = load_mechanism_from_config(config_path)
+            mechanism = cache.load_mechanism(config_path)
+            # same arrays, structure and solve order as the mechanism from the JSON, so the same sweep
+            for name in ("positions", "rod_indices", "pinned", "rotating", "rotation_centers", "rotation_radii"):
+                assert np.array_equal(getattr(mechanism, name), getattr(reference, name)), f"{name} differs!"
+            assert mechanism.analyze_structure() == json.loads(json.dumps(reference.analyze_structure(), default=int)), "Structure differs!"
+            assert mechanism.solve_order == AnalyticSolver(reference).solve_order, "Solve order differs!"
+            assert np.array_equal(AnalyticSolver(mechanism).sweep(angles), AnalyticSolver(reference).sweep(angles)), "Sweep differs!"
+            # every load is a new mechanism, solving one does not move the others
+            AnalyticSolver(mechanism).solve(1.0)
+            assert np.array_equal(cache.load_mechanism(config_path).positions, load_mechanism_from_config(config_path).positions), \
+                "Mechanisms share positions!"
+
+            repeats = 20
+            start_time = time.perf_counter()
+            for _ in range(repeats):
+                AnalyticSolver(load_mechanism_from_config(config_path))
+            json_time = (time.perf_counter() - start_time) / repeats
+            start_time = time.perf_counter()
+            for _ in range(repeats):
+                AnalyticSolver(cache.load_mechanism(config_path))
+            memory_time = (time.perf_counter() - start_time) / repeats
+            start_time = time.perf_counter()
+            for _ in range(repeats):
+                AnalyticSolver(ArtifactCache(test_dir).load_mechanism(config_path))
+            disk_time = (time.perf_counter() - start_time) / repeats
+            print(f"{config_file:45s} mechanism + solver from JSON {json_time * 1000:6.2f} ms, "
+                  f"from artifact in memory {memory_time * 1000:6.2f} ms, on disk {disk_time * 1000:6.2f} ms")
+        assert cache.compiled == len(os.listdir(test_dir)) == 3 and cache.disk_loads == 0, "Configurations compiled more than once!"
+        assert cache.size == sum(artifact_size(artifact) for artifact in cache.artifacts.values()), "Cache size is off!"
+
+        # a budget for a single artifact keeps only the most recently used one in memory, the others are read from disk again
+        small_cache = ArtifactCache(test_dir, budget=1)
+        config_paths = [os.path.join(config_dir, f) for f in sorted(os.listdir(config_dir)) if f.endswith(".json")]
+        for config_path in config_paths + config_paths[:1]:
+            small_cache.load_mechanism(config_path)
+        assert len(small_cache.artifacts) == 1 and small_cache.disk_loads == 4 and small_cache.compiled == 0, "Eviction failed!"
+
+        # an edited configuration is compiled again, an outdated or broken artifact is replaced
+        config_path = os.path.join(test_dir, "edited.json")
+        with open(os.path.join(config_dir, "Viergelenkkette_configuration.json")) as f:
+            config = json.load(f)
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        first = cache.load_mechanism(config_path)
+        next(joint for joint in config["joints"] if not (joint["pinned"] or joint["rotating_joint"]))["x"] += 1.0
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        assert not np.array_equal(cache.load_mechanism(config_path).positions, first.positions), "Edited configuration not compiled!"
+        with open(cache.artifact_path(hash_config_file(config_path)), "wb") as f:
+            f.write(b"broken")
+        fresh = ArtifactCache(test_dir)
+        assert np.array_equal(fresh.load_mechanism(config_path).positions, load_mechanism_from_config(config_path).positions) \
+            and fresh.compiled == 1, "Broken artifact not replaced!"
+
+        # invalid configurations fail like in load_mechanism_from_config and leave no artifact
+        config["rods"] = config["rods"][:-1]
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        try:
+            cache.load_mechanism(config_path)
+            raise AssertionError("Invalid configuration compiled!")
+        except ValueError as e:
+            print(f"invalid configuration: {e}")
+        assert not os.path.exists(cache.artifact_path(hash_config_file(config_path))), "Artifact of an invalid configuration!"
+    finally:
+        shutil.rmtree(test_dir)
+    print("All tests passed!")
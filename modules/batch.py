@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from artifact import load_mechanism
+from solver import AnalyticSolver, create_solver
+
+# frames per work item, small enough to balance the load, large enough to keep the batched solve efficient
+CHUNK_FRAMES = 512
+
+# mechanisms and solvers built by this worker process, keyed by (config path, solver name)
+_worker_solvers = {}
+
+def get_worker_solver(config_path: str, solver_name: str):
+    # every worker builds each mechanism only once and reuses it for all of its chunks,
+    # the numeric solver uses continuation, so chunks arriving in any order stay on the assembly branch
+    key = (config_path, solver_name)
+    if key not in _worker_solvers:
+        _worker_solvers[key] = create_solver(load_mechanism(config_path), solver_name)
+    return _worker_solvers[key]
+
+def solve_chunk(config_path: str, solver_name: str, shm_name: str, shape: tuple, start: int, angles: np.ndarray):
+    # solve one angle chunk and write it straight into the shared result array of the sweep
+    solver = get_worker_solver(config_path, solver_name)
+    coords = solver.sweep(np.deg2rad(angles))
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        result = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        result[start:start + len(angles)] = coords
+    finally:
+        shm.close()
+    return start, len(angles)
+
+def sweep_angles(start_deg: float, end_deg: float, resolution: float):
+    # same frame count as the CSV export of the Visualization page
+    num_frames = int((end_deg - start_deg) / resolution) + 1
+    return np.linspace(start_deg, end_deg, num_frames)
+
+def run_sweeps(config_paths: list[str], resolutions: list[float], start_deg: float = 0, end_deg: float = 360,
+               solver_name: str = "analytic", workers: int = None, chunk_frames: int = CHUNK_FRAMES):
+    # solve every (configuration, resolution) pair, split into angle chunks over a process pool
+    # returns {(config path, resolution): (angles in degrees, coords (frames x joints x 2))}
+    sweeps = {}
+    try:
+        for config_path in config_paths:
+            n = load_mechanism(config_path).n
+            for resolution in resolutions:
+                angles = sweep_angles(start_deg, end_deg, resolution)
+                shape = (len(angles), n, 2)
+                shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+                sweeps[(config_path, resolution)] = (angles, shape, shm)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for (config_path, _), (angles, shape, shm) in sweeps.items():
+                for start in range(0, len(angles), chunk_frames):
+                    futures.append(executor.submit(solve_chunk, config_path, solver_name, shm.name, shape, start, angles[start:start + chunk_frames]))
+            for future in futures:
+                future.result()  # re-raise errors of the workers
+
+        results = {}
+        for key, (angles, shape, shm) in sweeps.items():
+            results[key] = (angles, np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy())
+        return results
+    finally:
+        for _, _, shm in sweeps.values():
+            shm.close()
+            shm.unlink()
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/batch.py
+    from json2config import load_mechanism_from_config
+    import time
+    config_dir = "configurations"
+    config_paths = [os.path.join(config_dir, f) for f in sorted(os.listdir(config_dir)) if f.endswith(".json")]
+    resolutions = [1.0, 0.5, 0.1]
+
+    start_time = time.perf_counter()
+    results = run_sweeps(config_paths, resolutions)
+    print(f"Parallel: {time.perf_counter() - start_time:.3f} s with {os.cpu_count()} CPUs")
+
+    start_time = time.perf_counter()
+    for (config_path, resolution), (angles, coords) in results.items():
+        serial = AnalyticSolver(load_mechanism_from_config(config_path)).sweep(np.deg2rad(angles))
+        assert np.allclose(serial, coords), f"Batch result differs for {config_path} at {resolution}°"
+    print(f"Serial:   {time.perf_counter() - start_time:.3f} s")
+
+    numeric = run_sweeps(config_paths[:1], [1.0], solver_name="numeric", chunk_frames=64)
+    (angles, coords), = numeric.values()
+    assert np.allclose(coords, results[(config_paths[0], 1.0)][1], atol=1e-6), "Numeric batch result differs"
+    print("All tests passed!")
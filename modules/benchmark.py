@@ -0,0 +1,359 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import numpy as np
+import scipy
+from scipy.optimize import least_squares
+from mechanism import Mechanism
+from json2config import load_mechanism_from_config
+from solver import NumericSolver, AnalyticSolver
+from render import calculate_solved_coords, get_axis_limits, draw_frame, generate_animation
+from export import export_trajectory
+from artifact import ArtifactCache
+from generator import generate
+import raster
+
+# stage by stage benchmark suite (python -m modules.cli bench): every stage runs warmup times untimed and then repeats times
+# timed, the report holds the median and percentiles of the repeats together with a fingerprint of the machine, so runs of
+# different machines and commits can be compared stage by stage
+BENCHMARK_WARMUP = 1
+BENCHMARK_REPEATS = 5
+BENCHMARK_PERCENTILES = (10, 50, 90)
+# default settings of the Visualization page, the leaderboard ranks the sweep and the GIF encode at these settings
+LEADERBOARD_RESOLUTION = 5.0
+LEADERBOARD_FRAMERATE = 240
+# synthetic mechanisms: copies of the free joints of a shipped configuration on the same crank and ground joints
+SCALE_COPIES = (10, 100)
+SCALE_CONFIG = "configurations/Strandbeest-Bein_configuration.json"
+CONFIG_STAGES = ("load", "solve", "sweep", "export_csv", "render_frame", "gif")
+SCALE_STAGES = ("build", "solve", "sweep")
+# generated mechanisms (modules/generator.py) from tens to thousands of joints: how loading, solving, memory and rendering scale
+SCALING_KINDS = ("chain", "walker")
+SCALING_JOINTS = (10, 100, 1000, 10000)
+GENERATED_STAGES = ("load_json", "load_artifact", "solve", "sweep", "render_frame")
+REPORT_DIR = "benchmarks"
+LEADERBOARD_PATH = "leaderboard.json"
+
+def legacy_solve(solver: NumericSolver, angle: float):
+    # solve path before the vectorized residual: per rod python loop and finite difference jacobian
+    mechanism = solver.mechanism
+    mechanism.update_rotating_joint_position(angle)
+
+    def calculate_differences(free_joint_positions):
+        for idx, joint_index in enumerate(solver.moveable_joints):
+            mechanism.joints[joint_index].x = free_joint_positions[2 * idx]
+            mechanism.joints[joint_index].y = free_joint_positions[2 * idx + 1]
+        differences = []
+        for i, rod in enumerate(mechanism.rods):
+            pos_start = np.array([rod.start.x, rod.start.y])
+            pos_end = np.array([rod.end.x, rod.end.y])
+            differences.append(np.linalg.norm(pos_start - pos_end) - solver.ref_rod_lengths[i])
+        return differences
+
+    initial_guess = []
+    for i in solver.moveable_joints:
+        joint = mechanism.joints[i]
+        initial_guess.extend([joint.x, joint.y])
+    result = least_squares(calculate_differences, initial_guess)
+    calculate_differences(result.x)
+
+def solves_per_second(config_path: str, solve_function, num_frames: int = 73, solver_class=NumericSolver):
+    # time a full 0° to 360° sweep on a freshly loaded mechanism
+    mechanism = load_mechanism_from_config(config_path)
+    solver = solver_class(mechanism)
+    angles = np.deg2rad(np.linspace(0, 360, num_frames))
+    start_time = time.perf_counter()
+    for angle in angles:
+        solve_function(solver, angle)
+    time_taken = time.perf_counter() - start_time
+    return num_frames / time_taken
+
+def sweep_seconds(config_path: str, solver_class, resolution: float = 0.1):
+    # time one batched 0° to 360° sweep at the given resolution (degrees per step)
+    mechanism = load_mechanism_from_config(config_path)
+    solver = solver_class(mechanism)
+    angles = np.deg2rad(np.linspace(0, 360, int(360 / resolution) + 1))
+    start_time = time.perf_counter()
+    solver.sweep(angles)
+    return time.perf_counter() - start_time
+
+def compare_solvers(config_dir: str = "configurations", num_frames: int = 73):
+    results = {}
+    for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+        config_path = os.path.join(config_dir, config_file)
+        before = solves_per_second(config_path, legacy_solve, num_frames)
+        after = solves_per_second(config_path, NumericSolver.solve, num_frames)
+        analytic = solves_per_second(config_path, AnalyticSolver.solve, num_frames, AnalyticSolver)
+        results[config_file] = {"before": before, "after": after, "analytic": analytic}
+    return results
+
+def machine_name():
+    # COMPUTERNAME only exists on windows, the network name of the machine works everywhere
+    return platform.node() or os.getenv("COMPUTERNAME", "Unknown")
+
+def machine_fingerprint():
+    try:
+        import numba # optional, compiles the solver kernels
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "machine": machine_name(),
+        "system": platform.system(),
+        "release": platform.release(),
+        "architecture": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "numba": numba_version,
+    }
+
+def time_repeats(function, warmup: int = BENCHMARK_WARMUP, repeats: int = BENCHMARK_REPEATS):
+    # (repeats,) wall clock seconds of function(), after warmup untimed calls (imports, caches, compiled kernels)
+    for _ in range(warmup):
+        function()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times[i] = time.perf_counter() - start_time
+    return times
+
+def summarize(times):
+    summary = {f"p{q}": float(np.percentile(times, q)) for q in BENCHMARK_PERCENTILES}
+    summary.update(median=float(np.median(times)), min=float(np.min(times)), max=float(np.max(times)),
+                   mean=float(np.mean(times)), repeats=len(times))
+    return summary
+
+def replicate_mechanism(mechanism: Mechanism, copies: int):
+    # the pinned and rotating joints once, all other joints and their rods copies times (independent legs on one crank)
+    positions = mechanism.get_joint_coords_array()
+    fixed = [i for i, joint in enumerate(mechanism.joints) if joint.pinned or joint.rotate_center is not None]
+    joints = {i: Mechanism.Joint(*positions[i], pinned=mechanism.joints[i].pinned, rotates_around=mechanism.joints[i].rotate_center)
+              for i in fixed}
+    all_joints, rods = list(joints.values()), []
+    for _ in range(copies):
+        copy = dict(joints)
+        for i in range(mechanism.n):
+            if i not in copy:
+                copy[i] = Mechanism.Joint(*positions[i])
+                all_joints.append(copy[i])
+        rods += [Mechanism.Rod(copy[s_idx], copy[e_idx]) for s_idx, e_idx in mechanism.rod_indices.tolist()]
+    return Mechanism(all_joints, rods)
+
+def benchmark_config(config_path: str, warmup: int = BENCHMARK_WARMUP, repeats: int = BENCHMARK_REPEATS,
+                     resolution: float = LEADERBOARD_RESOLUTION, framerate: float = LEADERBOARD_FRAMERATE, stages=CONFIG_STAGES):
+    # {stage: summary} for one shipped configuration, with the frame counts of the Visualization page
+    mechanism = load_mechanism_from_config(config_path)
+    solver = AnalyticSolver(mechanism)
+    num_frames = int(360 / resolution)
+    coords, angles = calculate_solved_coords(mechanism, solver, 0, 360, num_frames)
+    x_lim, y_lim = get_axis_limits(coords)
+    output_dir = tempfile.mkdtemp(prefix="benchmark_")
+    functions = {
+        "load": lambda: load_mechanism_from_config(config_path),
+        "solve": lambda: solver.solve(np.deg2rad(45.0)),
+        "sweep": lambda: calculate_solved_coords(mechanism, solver, 0, 360, num_frames),
+        "export_csv": lambda: export_trajectory(coords, angles, os.path.join(output_dir, "moving_coords.csv"), "csv"),
+        "render_frame": lambda: draw_frame(mechanism, coords[0], x_lim, y_lim, os.path.join(output_dir, "frame.png")),
+        "gif": lambda: generate_animation(mechanism, coords, 1000 / framerate, os.path.join(output_dir, "animation.gif")),
+    }
+    try:
+        return {stage: summarize(time_repeats(functions[stage], warmup, repeats)) for stage in stages}
+    finally:
+        shutil.rmtree(output_dir)
+
+def benchmark_scaled(copies: int, config_path: str = SCALE_CONFIG, warmup: int = BENCHMARK_WARMUP, repeats: int = BENCHMARK_REPEATS,
+                     resolution: float = LEADERBOARD_RESOLUTION, stages=SCALE_STAGES):
+    # {stage: summary} for a synthetic mechanism of copies legs: building the solver, one solve and one sweep
+    base = load_mechanism_from_config(config_path)
+    mechanism = replicate_mechanism(base, copies)
+    solver = AnalyticSolver(mechanism)
+    num_frames = int(360 / resolution)
+    functions = {
+        "build": lambda: AnalyticSolver(replicate_mechanism(base, copies)),
+        "solve": lambda: solver.solve(np.deg2rad(45.0)),
+        "sweep": lambda: calculate_solved_coords(mechanism, solver, 0, 360, num_frames),
+    }
+    results = {stage: summarize(time_repeats(functions[stage], warmup, repeats)) for stage in stages}
+    results["joints"] = mechanism.n
+    return results
+
+def peak_memory(function):
+    # largest amount of python and numpy memory in bytes that is allocated at once while function() runs
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_generated(config: dict, warmup: int = BENCHMARK_WARMUP, repeats: int = BENCHMARK_REPEATS,
+                        resolution: float = LEADERBOARD_RESOLUTION, stages=GENERATED_STAGES):
+    # {stage: summary} for a generated configuration, written to a temporary folder like a configuration of the Config page:
+    # mechanism + solver from the JSON and from its compiled artifact on disk, one solve, one sweep and one raster frame
+    output_dir = tempfile.mkdtemp(prefix="benchmark_")
+    config_path = os.path.join(output_dir, "generated_configuration.json")
+    with open(config_path, "w") as file:
+        json.dump(config, file)
+    artifact_dir = os.path.join(output_dir, "artifacts")
+    ArtifactCache(artifact_dir).get_artifact(config_path) # compiled once, every timed load reads it back
+    mechanism = load_mechanism_from_config(config_path)
+    solver = AnalyticSolver(mechanism)
+    num_frames = int(360 / resolution)
+    coords, _ = calculate_solved_coords(mechanism, solver, 0, 360, num_frames)
+    x_lim, y_lim = get_axis_limits(coords)
+    functions = {
+        "load_json": lambda: AnalyticSolver(load_mechanism_from_config(config_path)),
+        "load_artifact": lambda: AnalyticSolver(ArtifactCache(artifact_dir).load_mechanism(config_path)),
+        "solve": lambda: solver.solve(np.deg2rad(45.0)),
+        "sweep": lambda: calculate_solved_coords(mechanism, solver, 0, 360, num_frames),
+        "render_frame": lambda: raster.draw_frame(mechanism, coords[0], x_lim, y_lim, os.path.join(output_dir, "frame.png")),
+    }
+    try:
+        results = {stage: summarize(time_repeats(functions[stage], warmup, repeats)) for stage in stages}
+
+        def load_and_sweep():
+            loaded = ArtifactCache(artifact_dir).load_mechanism(config_path)
+            calculate_solved_coords(loaded, AnalyticSolver(loaded), 0, 360, num_frames)
+
+        results.update(joints=mechanism.n, rods=mechanism.m, peak_memory=peak_memory(load_and_sweep))
+        return results
+    finally:
+        shutil.rmtree(output_dir)
+
+def run_scaling(kinds=SCALING_KINDS, joints=SCALING_JOINTS, seed: int = 0, warmup: int = BENCHMARK_WARMUP,
+                repeats: int = BENCHMARK_REPEATS, resolution: float = LEADERBOARD_RESOLUTION):
+    # report of generated mechanisms of every kind and size, in the layout of run_suite
+    results = {}
+    for kind in kinds:
+        for num_joints in joints:
+            results[f"{kind}_{num_joints}"] = benchmark_generated(generate(kind, num_joints, seed), warmup, repeats, resolution)
+    return {
+        "fingerprint": machine_fingerprint(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {"warmup": warmup, "repeats": repeats, "resolution": resolution, "kinds": list(kinds), "joints": list(joints),
+                     "seed": seed},
+        "results": results,
+    }
+
+def print_scaling(report, file=sys.stdout):
+    # one row per generated mechanism: median of every stage and the peak memory of load + sweep
+    stages = [stage for stage in GENERATED_STAGES if stage in next(iter(report["results"].values()), {})]
+    print(f"{'Mechanism':15s} {'joints':>7s} {'rods':>7s} " + " ".join(f"{stage + ' [ms]':>18s}" for stage in stages)
+          + f" {'memory [MB]':>12s}", file=file)
+    for name, results in report["results"].items():
+        print(f"{name:15s} {results['joints']:7d} {results['rods']:7d} "
+              + " ".join(f"{results[stage]['median'] * 1e3:18.2f}" for stage in stages)
+              + f" {results['peak_memory'] / 1024 ** 2:12.2f}", file=file)
+
+def run_suite(config_dir: str = "configurations", copies=SCALE_COPIES, warmup: int = BENCHMARK_WARMUP, repeats: int = BENCHMARK_REPEATS,
+              resolution: float = LEADERBOARD_RESOLUTION, framerate: float = LEADERBOARD_FRAMERATE, config_files=None):
+    # report of all shipped configurations (or the given ones) and the synthetic mechanisms, ready for json.dump
+    config_files = config_files or sorted(os.path.join(config_dir, f) for f in os.listdir(config_dir) if f.endswith(".json"))
+    results = {}
+    for config_path in config_files:
+        results[os.path.basename(config_path)] = benchmark_config(config_path, warmup, repeats, resolution, framerate)
+    for count in copies:
+        results[f"scaled_{count}"] = benchmark_scaled(count, warmup=warmup, repeats=repeats, resolution=resolution)
+    return {
+        "fingerprint": machine_fingerprint(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {"warmup": warmup, "repeats": repeats, "resolution": resolution, "framerate": framerate, "copies": list(copies)},
+        "results": results,
+    }
+
+def report_path(report, report_dir: str = REPORT_DIR): # one report per machine, a new run replaces the last one
+    return os.path.join(report_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", report["fingerprint"]["machine"]) + ".json")
+
+def save_report(report, path: str = None):
+    path = path or report_path(report)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=4)
+    return path
+
+def load_reports(report_dir: str = REPORT_DIR):
+    if not os.path.isdir(report_dir):
+        return []
+    reports = []
+    for file_name in sorted(f for f in os.listdir(report_dir) if f.endswith(".json")):
+        with open(os.path.join(report_dir, file_name), "r") as file:
+            reports.append(json.load(file))
+    return reports
+
+def update_leaderboard(report, leaderboard_path: str = LEADERBOARD_PATH):
+    # the leaderboard keeps the best median sweep + GIF encode per configuration and machine (the pipeline of the
+    # Visualization page at its default settings), runs at other settings are not ranked
+    settings = report["settings"]
+    if settings["resolution"] != LEADERBOARD_RESOLUTION or settings["framerate"] != LEADERBOARD_FRAMERATE:
+        return None
+    leaderboard = {}
+    if os.path.exists(leaderboard_path):
+        with open(leaderboard_path, "r") as file:
+            leaderboard = json.load(file)
+    machine = report["fingerprint"]["machine"]
+    for config_name, stages in report["results"].items():
+        if "sweep" not in stages or "gif" not in stages or config_name.startswith("scaled_"):
+            continue
+        time_taken = stages["sweep"]["median"] + stages["gif"]["median"]
+        entries = leaderboard.setdefault(config_name, {})
+        if machine not in entries or entries[machine] > time_taken:
+            entries[machine] = time_taken
+    with open(leaderboard_path, "w") as file:
+        json.dump(leaderboard, file, indent=4)
+    return leaderboard_path
+
+def print_report(report, file=sys.stdout):
+    fingerprint = report["fingerprint"]
+    print(f"{fingerprint['machine']} ({fingerprint['system']} {fingerprint['architecture']}, {fingerprint['cpu_count']} CPUs, "
+          f"python {fingerprint['python']}, numpy {fingerprint['numpy']}), {report['settings']['repeats']} repeats", file=file)
+    print(f"{'Benchmark':45s} {'stage':>13s} {'median [ms]':>12s} {'p10 [ms]':>10s} {'p90 [ms]':>10s}", file=file)
+    for name, stages in report["results"].items():
+        for stage, summary in stages.items():
+            if isinstance(summary, dict):
+                print(f"{name:45s} {stage:>13s} {summary['median'] * 1e3:12.2f} {summary['p10'] * 1e3:10.2f} {summary['p90'] * 1e3:10.2f}", file=file)
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/benchmark.py
+    results = compare_solvers()
+    print(f"{'Configuration':45s} {'before [1/s]':>14s} {'after [1/s]':>14s} {'speedup':>9s} {'analytic [1/s]':>15s}")
+    for config_file, result in results.items():
+        speedup = result["after"] / result["before"]
+        print(f"{config_file:45s} {result['before']:14.1f} {result['after']:14.1f} {speedup:8.1f}x {result['analytic']:15.1f}")
+
+    # batched sweep at 0.1° compared with the per angle loop at 5° (73 solves)
+    print(f"\n{'Configuration':45s} {'loop 5° [s]':>14s} {'numeric 0.1° [s]':>17s} {'analytic 0.1° [s]':>18s}")
+    for config_file, result in results.items():
+        config_path = os.path.join("configurations", config_file)
+        numeric = sweep_seconds(config_path, NumericSolver)
+        analytic = sweep_seconds(config_path, AnalyticSolver)
+        print(f"{config_file:45s} {73 / result['before']:14.3f} {numeric:17.3f} {analytic:18.3f}")
+
+    # stage by stage suite on one configuration and a small synthetic mechanism, report and leaderboard in a temporary folder
+    report = run_suite(copies=(2,), warmup=1, repeats=3, config_files=["configurations/Viergelenkkette_configuration.json"])
+    print()
+    print_report(report)
+    stages = report["results"]["Viergelenkkette_configuration.json"]
+    assert set(stages) == set(CONFIG_STAGES) and set(report["results"]["scaled_2"]) == set(SCALE_STAGES) | {"joints"}, "Stage missing!"
+    assert all(s["p10"] <= s["median"] <= s["p90"] and s["repeats"] == 3 for s in stages.values()), "Percentiles are not ordered!"
+    directory = tempfile.mkdtemp(prefix="benchmark_report_")
+    path = save_report(report, report_path(report, directory))
+    assert load_reports(directory) == [report], "Report does not read back!"
+    leaderboard_path = os.path.join(directory, "leaderboard.json")
+    update_leaderboard(report, leaderboard_path)
+    with open(leaderboard_path, "r") as file:
+        leaderboard = json.load(file)
+    assert list(leaderboard) == ["Viergelenkkette_configuration.json"] and machine_name() in leaderboard["Viergelenkkette_configuration.json"], \
+        "Leaderboard entry missing!"
+    shutil.rmtree(directory)
+    print("All tests passed!")
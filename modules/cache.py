@@ -0,0 +1,136 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from artifact import hash_config_file, load_mechanism
+from solver import create_solver
+from render import calculate_solved_coords, get_axis_limits
+from table import TrajectoryTable
+
+# default memory budget of the trajectory cache in bytes
+CACHE_BUDGET = 256 * 1024 ** 2
+
+class TrajectoryCache:
+    # content-addressed LRU cache of solved sweeps: (config hash, start, end, frames, solver) -> trajectory
+    def __init__(self, budget: int = CACHE_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.tables = {} # (config hash, solver) -> TrajectoryTable for single frame queries
+        self.lock = threading.Lock()
+
+    def make_key(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, solver_name: str = "analytic"):
+        return (hash_config_file(config_path), float(start_deg), float(end_deg), int(num_frames), solver_name)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def contains(self, key): # without counting a hit or a miss
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, coords: np.ndarray, angles: np.ndarray):
+        # cached arrays are shared between callers, so they are made read-only
+        coords.setflags(write=False)
+        angles.setflags(write=False)
+        entry = {"coords": coords, "angles": angles, "axis_limits": None}
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)["coords"].nbytes
+            self.entries[key] = entry
+            self.size += coords.nbytes
+            # evict the least recently used sweeps until the budget is kept (the newest one always stays)
+            while self.size > self.budget and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted["coords"].nbytes
+        return entry
+
+    def get_entry(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, solver_name: str = "analytic"):
+        key = self.make_key(config_path, start_deg, end_deg, num_frames, solver_name)
+        entry = self.get(key)
+        if entry is None:
+            mechanism = load_mechanism(config_path)
+            solver = create_solver(mechanism, solver_name)
+            coords, angles = calculate_solved_coords(mechanism, solver, start_deg, end_deg, num_frames)
+            entry = self.put(key, coords, angles)
+        return entry
+
+    def get_or_solve(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, solver_name: str = "analytic"):
+        # returns (coords (frames x joints x 2), angles in degrees), solved only on a cache miss
+        entry = self.get_entry(config_path, start_deg, end_deg, num_frames, solver_name)
+        return entry["coords"], entry["angles"]
+
+    def get_axis_limits(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, solver_name: str = "analytic"):
+        entry = self.get_entry(config_path, start_deg, end_deg, num_frames, solver_name)
+        if entry["axis_limits"] is None:
+            entry["axis_limits"] = get_axis_limits(entry["coords"])
+        return entry["axis_limits"]
+
+    def lookup_frame(self, config_path: str, angle_deg: float, solver_name: str = "analytic"):
+        # joint positions at the angle from any cached sweep of the same configuration, or None
+        config_hash = hash_config_file(config_path)
+        with self.lock:
+            for key, entry in reversed(self.entries.items()):
+                if key[0] != config_hash or key[4] != solver_name:
+                    continue
+                matches = np.flatnonzero(np.isclose(entry["angles"], angle_deg))
+                if len(matches) > 0:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["coords"][matches[0]]
+            self.misses += 1
+        return None
+
+    def get_table(self, config_path: str, solver_name: str = "analytic"):
+        # interpolation table of the configuration, built on the first frame query (a few kB, not counted in the budget)
+        key = (hash_config_file(config_path), solver_name)
+        with self.lock:
+            table = self.tables.get(key)
+        if table is None:
+            table = TrajectoryTable(load_mechanism(config_path), solver_name)
+            with self.lock:
+                table = self.tables.setdefault(key, table)
+        return table
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tables.clear()
+            self.size = 0
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/cache.py
+    import time
+    config_file = "configurations/Strandbeest-Bein-Doppel_configuration.json"
+    cache = TrajectoryCache()
+
+    start_time = time.perf_counter()
+    coords, angles = cache.get_or_solve(config_file, 0, 360, 361)
+    miss_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    cached_coords, _ = cache.get_or_solve(config_file, 0, 360, 361)
+    hit_time = time.perf_counter() - start_time
+    print(f"miss: {miss_time:.4f} s, hit: {hit_time:.6f} s")
+    assert cached_coords is coords and cache.hits == 1 and cache.misses == 1, "Cache hit failed!"
+
+    frame = cache.lookup_frame(config_file, 90.0)
+    assert frame is not None and np.allclose(frame, coords[90]), "Frame lookup failed!"
+    assert cache.lookup_frame(config_file, 90.5) is None, "Frame lookup should miss!"
+    assert cache.get_axis_limits(config_file, 0, 360, 361) == get_axis_limits(coords), "Axis limits failed!"
+    table = cache.get_table(config_file)
+    assert cache.get_table(config_file) is table and np.allclose(table.pose(np.deg2rad(90)), coords[90], atol=1e-5), "Table lookup failed!"
+
+    # a budget for a single sweep evicts the least recently used one
+    small_cache = TrajectoryCache(budget=coords.nbytes)
+    small_cache.get_or_solve(config_file, 0, 360, 361)
+    small_cache.get_or_solve(config_file, 0, 180, 181)
+    assert len(small_cache.entries) == 1 and small_cache.size <= coords.nbytes, "Eviction failed!"
+    print("All tests passed!")
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))) # modules import each other without the package prefix
+
+from json2config import load_mechanism_from_config
+from solver import create_solver
+import render
+import raster
+from render import calculate_solved_coords, get_axis_limits, ffmpeg_available
+from export import FORMATS, export_sweep, export_trajectory
+from store import sweep_to_store
+from diagnostics import adaptive_sweep
+import benchmark
+
+# headless batch runner: python -m modules.cli sweep|frame|animate|export CONFIG [CONFIG ...]
+# benchmark suite: python -m modules.cli bench [CONFIG ...]
+# scaling of generated mechanisms: python -m modules.cli scale [--kinds chain walker] [--joints 10 100 1000 10000]
+
+# drawing backends: matplotlib with axes and title, raster without decorations but much faster
+BACKENDS = {
+    "matplotlib": render,
+    "raster": raster,
+}
+
+def config_stem(config_path):
+    return os.path.splitext(os.path.basename(config_path))[0]
+
+def num_frames(start_deg, end_deg, resolution):
+    # same frame count as the CSV export of the Visualization page
+    return int((end_deg - start_deg) / resolution) + 1
+
+def run_sweep(args, mechanism, solver, stem):
+    if args.store:
+        # solved straight into chunked files on disk, for sweeps that do not fit into memory
+        angles = np.linspace(args.start, args.end, num_frames(args.start, args.end, args.resolution))
+        store = sweep_to_store(solver, angles, os.path.join(args.output_dir, f"{stem}_sweep"), metadata={"name": stem, "solver": args.solver})
+        return store.directory
+    if args.adaptive:
+        # finer steps only around dead points and branch flips, the saved angles are not uniform
+        angles = np.deg2rad(np.linspace(args.start, args.end, num_frames(args.start, args.end, args.resolution)))
+        angles, solved_coords, diagnostics = adaptive_sweep(solver, angles)
+        if args.save:
+            return export_trajectory(solved_coords, np.rad2deg(angles), os.path.join(args.output_dir, f"{stem}_sweep.npz"))
+        return f"{len(angles)} frames, {diagnostics.summary()}"
+    solved_coords, angles = calculate_solved_coords(mechanism, solver, args.start, args.end, num_frames(args.start, args.end, args.resolution))
+    if args.save:
+        path = os.path.join(args.output_dir, f"{stem}_sweep.npy")
+        np.save(path, solved_coords)
+        return path
+    return f"{len(angles)} frames"
+
+def run_frame(args, mechanism, solver, stem):
+    # axis limits of the full cycle, so frames of different angles line up
+    full_coords, _ = calculate_solved_coords(mechanism, solver, 0, 360, 361)
+    x_lim, y_lim = get_axis_limits(full_coords)
+    solver.solve(np.deg2rad(args.angle))
+    path = os.path.join(args.output_dir, f"{stem}_frame_{args.angle:g}.png")
+    return BACKENDS[args.backend].draw_frame(mechanism, mechanism.get_joint_coords_array(), x_lim, y_lim, path)
+
+def run_animate(args, mechanism, solver, stem):
+    # at least one frame, also for an angle range shorter than one step
+    frames = max(1, int((args.end - args.start) / args.resolution))
+    solved_coords, _ = calculate_solved_coords(mechanism, solver, args.start, args.end, frames)
+    path = os.path.join(args.output_dir, f"{stem}_animation.{args.format}")
+    if args.format == "gif":
+        return BACKENDS[args.backend].generate_animation(mechanism, solved_coords, 1000 / args.framerate, path)
+    return BACKENDS[args.backend].generate_video(mechanism, solved_coords, args.framerate, path)
+
+def run_export(args, mechanism, solver, stem):
+    # solved and written chunk by chunk, so dense sweeps of large mechanisms never sit in memory as a whole
+    angles = np.linspace(args.start, args.end, num_frames(args.start, args.end, args.resolution))
+    path = os.path.join(args.output_dir, f"{stem}_moving_coords.{args.format}")
+    return export_sweep(solver, angles, path, args.format, crank_speed=args.crank_speed)
+
+COMMANDS = {
+    "sweep": run_sweep,
+    "frame": run_frame,
+    "animate": run_animate,
+    "export": run_export,
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m modules.cli", description="Mechanism simulation without the Streamlit UI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in COMMANDS:
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("configs", nargs="+", help="configuration JSON files")
+        subparser.add_argument("--output-dir", default="outputs", help="folder for the written files")
+        subparser.add_argument("--solver", choices=["analytic", "numeric"], default="analytic")
+        subparser.add_argument("--start", type=float, default=0.0, help="start angle (°)")
+        subparser.add_argument("--end", type=float, default=360.0, help="end angle (°)")
+        subparser.add_argument("--resolution", type=float, default=5.0, help="degrees per step")
+        if command == "sweep":
+            subparser.add_argument("--save", action="store_true", help="save the coordinates as .npy")
+            subparser.add_argument("--store", action="store_true", help="write the sweep into an on-disk trajectory store (chunked .npy files)")
+            subparser.add_argument("--adaptive", action="store_true", help="refine the steps around dead points and branch flips (--save writes .npz with the angles)")
+        if command == "frame":
+            subparser.add_argument("--angle", type=float, default=0.0, help="frame angle (°)")
+        if command in ("frame", "animate"):
+            subparser.add_argument("--backend", choices=list(BACKENDS), default="matplotlib", help="raster skips the axes for speed")
+        if command == "animate":
+            subparser.add_argument("--framerate", type=float, default=240, help="frames per second")
+            subparser.add_argument("--format", choices=["gif", "mp4", "webm"], default="gif", help="mp4 and webm need ffmpeg")
+        if command == "export":
+            subparser.add_argument("--format", choices=FORMATS, default="csv", help="parquet and arrow need pyarrow")
+            subparser.add_argument("--crank-speed", type=float, default=None, help="crank speed (rad/s), adds joint velocities and accelerations")
+    subparser = subparsers.add_parser("bench")
+    subparser.add_argument("configs", nargs="*", help="configuration JSON files (default: all in configurations)")
+    subparser.add_argument("--warmup", type=int, default=benchmark.BENCHMARK_WARMUP, help="untimed runs per stage")
+    subparser.add_argument("--repeats", type=int, default=benchmark.BENCHMARK_REPEATS, help="timed runs per stage")
+    subparser.add_argument("--copies", type=int, nargs="*", default=list(benchmark.SCALE_COPIES), help="legs of the synthetic mechanisms")
+    subparser.add_argument("--resolution", type=float, default=benchmark.LEADERBOARD_RESOLUTION, help="degrees per step")
+    subparser.add_argument("--framerate", type=float, default=benchmark.LEADERBOARD_FRAMERATE, help="frames per second of the GIF")
+    subparser.add_argument("--output", default=None, help="report JSON (default: benchmarks/<machine>.json)")
+    subparser.add_argument("--no-leaderboard", action="store_true", help="do not enter the results into leaderboard.json")
+    subparser = subparsers.add_parser("scale")
+    subparser.add_argument("--kinds", nargs="+", choices=list(benchmark.SCALING_KINDS), default=list(benchmark.SCALING_KINDS),
+                           help="generated mechanisms: dyad chains and Strandbeest walkers")
+    subparser.add_argument("--joints", type=int, nargs="+", default=list(benchmark.SCALING_JOINTS), help="approximate joint counts")
+    subparser.add_argument("--seed", type=int, default=0, help="seed of the random dyad chains")
+    subparser.add_argument("--warmup", type=int, default=benchmark.BENCHMARK_WARMUP, help="untimed runs per stage")
+    subparser.add_argument("--repeats", type=int, default=benchmark.BENCHMARK_REPEATS, help="timed runs per stage")
+    subparser.add_argument("--resolution", type=float, default=benchmark.LEADERBOARD_RESOLUTION, help="degrees per step")
+    subparser.add_argument("--output", default=None, help="also write the report JSON")
+    return parser
+
+def run_bench(args):
+    report = benchmark.run_suite(copies=args.copies, warmup=args.warmup, repeats=args.repeats, resolution=args.resolution,
+                                 framerate=args.framerate, config_files=args.configs or None)
+    benchmark.print_report(report)
+    print(f"report -> {benchmark.save_report(report, args.output)}")
+    if not args.no_leaderboard and benchmark.update_leaderboard(report):
+        print(f"leaderboard -> {benchmark.LEADERBOARD_PATH}")
+
+def run_scale(args):
+    report = benchmark.run_scaling(args.kinds, args.joints, args.seed, args.warmup, args.repeats, args.resolution)
+    benchmark.print_scaling(report)
+    if args.output:
+        print(f"report -> {benchmark.save_report(report, args.output)}")
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        return run_bench(args)
+    if args.command == "scale":
+        return run_scale(args)
+    if args.resolution <= 0:
+        parser.error("--resolution must be larger than 0")
+    if args.command != "frame" and args.end <= args.start:
+        parser.error("--end must be larger than --start")
+    if args.command == "animate" and args.format != "gif" and not ffmpeg_available():
+        parser.error(f"--format {args.format} needs ffmpeg on the PATH")
+    os.makedirs(args.output_dir, exist_ok=True)
+    for config_path in args.configs:
+        start_time = time.perf_counter()
+        mechanism = load_mechanism_from_config(config_path)
+        solver = create_solver(mechanism, args.solver)
+        result = COMMANDS[args.command](args, mechanism, solver, config_stem(config_path))
+        time_taken = time.perf_counter() - start_time
+        print(f"{args.command} {config_path}: {time_taken:.3f} s -> {result}")
+
+if __name__ == "__main__":
+    main()
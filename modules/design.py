@@ -0,0 +1,291 @@
+import os
+import copy
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from json2config import load_mechanism_from_dict
+from solver import AnalyticSolver, NumericSolver, circle_intersection, newton_sweep
+
+# design space exploration: variants of a base configuration in which some joint coordinates are parameters, scored on the
+# path of one joint (the foot) over a crank revolution. Mechanisms that consist of dyads are solved for a whole batch of
+# variants at once (every dyad step is one circle intersection over variants x angles), all others numerically, warm started
+# from the solution of a neighbouring variant.
+#   parameters   [{"joint": name, "axis": "x" or "y", "lower": value, "upper": value}, ...]
+#   values       (variants x parameters) coordinates of the parameter joints
+
+# crank angles per revolution that a variant is scored on
+DESIGN_ANGLES = 72
+# variants solved together in one vectorized batch (and sent to a worker process at once)
+DESIGN_BATCH = 1024
+# share of the revolution in which the foot is on the ground: the lowest points of its path
+CONTACT_FRACTION = 0.4
+# largest rod length error of a numerically solved variant that still counts as assembled
+DESIGN_RESIDUAL_LIMIT = 1e-6
+
+def foot_metrics(foot_paths, contact_fraction: float = CONTACT_FRACTION):
+    # (variants x frames x 2) foot paths -> {"stride", "flatness", "lift"} with (variants,) arrays:
+    #   stride     horizontal length of the ground contact
+    #   flatness   standard deviation of the height during the ground contact (0 is a straight line)
+    #   lift       height of the step over the ground
+    x, y = foot_paths[..., 0], foot_paths[..., 1]
+    contact = np.argsort(y, axis=1)[:, :max(2, int(round(contact_fraction * foot_paths.shape[1])))]
+    contact_x, contact_y = np.take_along_axis(x, contact, axis=1), np.take_along_axis(y, contact, axis=1)
+    return {
+        "stride": contact_x.max(axis=1) - contact_x.min(axis=1),
+        "flatness": contact_y.std(axis=1),
+        "lift": y.max(axis=1) - y.min(axis=1),
+    }
+
+class FootObjective:
+    # score to minimize: -stride + flatness_weight * flatness - lift_weight * lift, variants with less lift than min_lift
+    # are rejected (a class instead of a closure, so it can be sent to worker processes)
+    def __init__(self, flatness_weight: float = 10.0, lift_weight: float = 0.0, min_lift: float = 0.0):
+        self.flatness_weight = flatness_weight
+        self.lift_weight = lift_weight
+        self.min_lift = min_lift
+
+    def __call__(self, metrics):
+        score = -metrics["stride"] + self.flatness_weight * metrics["flatness"] - self.lift_weight * metrics["lift"]
+        return np.where(metrics["lift"] >= self.min_lift, score, np.inf)
+
+class DesignSpace:
+    def __init__(self, config: dict, parameters: list[dict], foot: str = None, objective=None, num_angles: int = DESIGN_ANGLES):
+        self.config = config
+        self.parameters = parameters
+        self.objective = objective or FootObjective()
+        self.num_angles = num_angles
+        self.mechanism = load_mechanism_from_dict(config)
+        # joint names in the order of the mechanism (the rotation center is not a joint)
+        self.names = [joint["joint_name"] for joint in config["joints"] if joint["joint_name"] != config.get("rotation_center")]
+        for parameter in parameters:
+            if parameter["joint"] not in self.names or parameter["axis"] not in ("x", "y"):
+                raise ValueError(f"Invalid design parameter {parameter} (the rotation center can not be a parameter).")
+        self.joint_index = np.array([self.names.index(parameter["joint"]) for parameter in parameters], dtype=int)
+        self.axis = np.array([0 if parameter["axis"] == "x" else 1 for parameter in parameters], dtype=int)
+        self.lower = np.array([parameter["lower"] for parameter in parameters], dtype=float)
+        self.upper = np.array([parameter["upper"] for parameter in parameters], dtype=float)
+        self.base_positions = self.mechanism.get_joint_coords_array()
+        self.base_values = self.base_positions[self.joint_index, self.axis]
+
+        free_joints = np.flatnonzero(~(self.mechanism.pinned | self.mechanism.rotating))
+        # the lowest free joint of the base configuration, unless the foot is given
+        self.foot = self.names.index(foot) if foot is not None else int(free_joints[np.argmin(self.base_positions[free_joints, 1])])
+        self.free_joints = free_joints
+        self.angles = np.linspace(0, 2 * np.pi, num_angles, endpoint=False)
+        # dyad steps (joint, parent a, parent b) of the base configuration; their lengths and branches differ per variant
+        solver = AnalyticSolver(self.mechanism)
+        self.steps = None if solver.fallback_solver is not None else [step[:3] for step in solver.solve_order]
+
+    def spec(self): # arguments that rebuild this design space in a worker process
+        return self.config, self.parameters, self.names[self.foot], self.objective, self.num_angles
+
+    def sample(self, count: int, rng=None):
+        # (count x parameters) latin hypercube sample of the parameter bounds: every parameter range is split into count
+        # strata and every stratum is used once
+        rng = np.random.default_rng(rng)
+        strata = np.argsort(rng.random((len(self.parameters), count)), axis=1).T
+        return self.lower + (strata + rng.random(strata.shape)) / count * (self.upper - self.lower)
+
+    def positions(self, values): # (variants x parameters) -> (variants x joints x 2) initial poses of the variants
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        positions = np.repeat(self.base_positions[None], len(values), axis=0)
+        positions[:, self.joint_index, self.axis] = values
+        return positions
+
+    def variant_config(self, values):
+        # configuration (JSON dict) of one variant, for saving it next to the shipped ones
+        config = copy.deepcopy(self.config)
+        joints = {joint["joint_name"]: joint for joint in config["joints"]}
+        for parameter, value in zip(self.parameters, np.asarray(values, dtype=float).tolist()):
+            joints[parameter["joint"]][parameter["axis"]] = value
+        return config
+
+    def solve(self, values, warm_start=None):
+        # (variants x parameters) -> trajectories (variants x angles x joints x 2) and (variants,) assembled flags;
+        # warm_start: trajectory (angles x joints x 2) of a neighbouring variant for the numeric solve
+        if self.steps is not None:
+            return self.solve_dyads(values)
+        return self.solve_numeric(values, warm_start)
+
+    def solve_dyads(self, values):
+        initial = self.positions(values)
+        V = len(initial)
+        trajectories = np.repeat(initial[:, None], self.num_angles, axis=1)
+        # cranks: radius and center of every variant, at the absolute crank angle like the mechanism
+        rotating = self.mechanism.rotating_indices
+        centers = self.mechanism.rotation_centers
+        radii = np.hypot(*(initial[:, rotating] - centers).transpose(2, 0, 1)) # (variants x cranks)
+        directions = np.stack([np.cos(self.angles), np.sin(self.angles)], axis=-1)
+        trajectories[:, :, rotating] = centers + radii[:, None, :, None] * directions[None, :, None, :]
+        valid = np.ones(V, dtype=bool)
+        for joint, a, b in self.steps:
+            r_a = np.hypot(*(initial[:, joint] - initial[:, a]).T)[:, None]
+            r_b = np.hypot(*(initial[:, joint] - initial[:, b]).T)[:, None]
+            base, arm = initial[:, b] - initial[:, a], initial[:, joint] - initial[:, a]
+            branch = np.where(base[:, 0] * arm[:, 1] - base[:, 1] * arm[:, 0] >= 0, 1.0, -1.0)[:, None]
+            pa, pb = trajectories[:, :, a], trajectories[:, :, b]
+            d = np.hypot(*(pb - pa).transpose(2, 0, 1))
+            pb = np.where((d > 0)[..., None], pb, pa + 1.0)
+            trajectories[:, :, joint], assembled = circle_intersection(pa, pb, r_a, r_b, branch)
+            # a variant that can not be assembled at some angle (circles apart or parents on top of each other) is invalid
+            valid &= np.all((d > 0) & assembled, axis=1)
+        return trajectories, valid
+
+    def solve_numeric(self, values, warm_start=None):
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        trajectories = np.empty((len(values), self.num_angles, self.mechanism.n, 2))
+        valid = np.ones(len(values), dtype=bool)
+        rod_start, rod_end = self.mechanism.rod_indices[:, 0], self.mechanism.rod_indices[:, 1]
+        for i, initial in enumerate(self.positions(values)):
+            mechanism = load_mechanism_from_dict(self.variant_config(values[i]))
+            if warm_start is None:
+                # continued from the initial pose of the variant: the angles in turning order from its crank angle on
+                crank = initial[mechanism.rotating_indices[0]] - mechanism.rotation_centers[0]
+                order = np.argsort((self.angles - np.arctan2(crank[1], crank[0])) % (2 * np.pi))
+                trajectories[i][order] = NumericSolver(mechanism, continuation=True).sweep(self.angles[order])
+            else:
+                # the neighbour's trajectory as initial guess of every frame, only a few newton steps are left
+                trajectory = trajectories[i]
+                trajectory[:] = warm_start
+                rotating, rotating_positions = mechanism.calculate_rotating_joint_positions(self.angles)
+                trajectory[:, rotating] = rotating_positions
+                trajectory[:, self.mechanism.pinned] = initial[self.mechanism.pinned]
+                ref_rod_lengths = np.hypot(*(initial[rod_start] - initial[rod_end]).T)
+                newton_sweep(trajectory, self.free_joints, rod_start, rod_end, ref_rod_lengths)
+            L = trajectories[i][:, rod_start] - trajectories[i][:, rod_end]
+            ref_rod_lengths = np.hypot(*(initial[rod_start] - initial[rod_end]).T)
+            valid[i] = np.abs(np.hypot(L[..., 0], L[..., 1]) - ref_rod_lengths).max() <= DESIGN_RESIDUAL_LIMIT
+        return trajectories, valid
+
+    def evaluate(self, values, warm_start=None):
+        # (variants x parameters) -> scores (variants,) (inf for variants that can not be assembled), metrics, trajectories
+        trajectories, valid = self.solve(values, warm_start)
+        metrics = foot_metrics(trajectories[:, :, self.foot])
+        scores = np.where(valid, self.objective(metrics), np.inf)
+        return scores, metrics, trajectories
+
+# design spaces built by this worker process, keyed by their JSON spec
+_worker_spaces = {}
+
+def evaluate_chunk(spec, values):
+    config, parameters, foot, objective, num_angles = spec
+    key = json.dumps([config, parameters, foot, num_angles], sort_keys=True) + repr(vars(objective))
+    if key not in _worker_spaces:
+        _worker_spaces[key] = DesignSpace(config, parameters, foot, objective, num_angles)
+    scores, metrics, _ = _worker_spaces[key].evaluate(values)
+    return scores, metrics
+
+def evaluate_designs(space: DesignSpace, values, batch_size: int = DESIGN_BATCH, workers: int = None):
+    # many variants (variants x parameters) in batches -> scores (variants,), metrics {name: (variants,)};
+    # the batches go to a process pool (workers None: one per CPU), with a single worker they are solved in this process
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    batches = [values[start:start + batch_size] for start in range(0, len(values), batch_size)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if workers <= 1:
+        results = [space.evaluate(batch)[:2] for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(evaluate_chunk, [space.spec()] * len(batches), batches))
+    scores = np.concatenate([scores for scores, _ in results])
+    metrics = {name: np.concatenate([batch_metrics[name] for _, batch_metrics in results]) for name in results[0][1]}
+    return scores, metrics
+
+def optimize(space: DesignSpace, start=None, step: float = 0.1, min_step: float = 1e-3, max_evaluations: int = 5000):
+    # local pattern search: all 2p neighbours (every parameter one step up and down, as one batch) are solved warm started
+    # from the trajectory of the current design; it moves to the best improving neighbour, otherwise the step is halved.
+    # step and min_step are fractions of the parameter ranges -> {"values", "score", "metrics", "evaluations", "history"}
+    values = np.asarray(space.base_values if start is None else start, dtype=float)
+    scores, metrics, trajectories = space.evaluate(values)
+    score, trajectory, evaluations = scores[0], trajectories[0], 1
+    history = [float(score)]
+    span = space.upper - space.lower
+    directions = np.concatenate([np.eye(len(values)), -np.eye(len(values))])
+    while step >= min_step and evaluations < max_evaluations:
+        candidates = np.clip(values + step * directions * span, space.lower, space.upper)
+        candidate_scores, candidate_metrics, candidate_trajectories = space.evaluate(candidates, warm_start=trajectory)
+        evaluations += len(candidates)
+        best = int(np.argmin(candidate_scores))
+        if candidate_scores[best] < score:
+            values, score, trajectory = candidates[best], candidate_scores[best], candidate_trajectories[best]
+            metrics = {name: metric[best:best + 1] for name, metric in candidate_metrics.items()}
+            history.append(float(score))
+        else:
+            step /= 2
+    return {"values": values, "score": float(score), "metrics": {name: float(metric[0]) for name, metric in metrics.items()},
+            "evaluations": evaluations, "history": history}
+
+def search(space: DesignSpace, samples: int = 10000, starts: int = 4, rng=None, workers: int = None, **optimize_options):
+    # global sample of the design space, then a local optimization from each of the best few samples -> best optimize result
+    values = space.sample(samples, rng)
+    scores, _ = evaluate_designs(space, values, workers=workers)
+    results = [optimize(space, values[i], **optimize_options) for i in np.argsort(scores)[:starts] if np.isfinite(scores[i])]
+    best = min(results, key=lambda result: result["score"])
+    best["evaluations"] = samples + sum(result["evaluations"] for result in results)
+    return best
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/design.py
+    import time
+    config_path = "configurations/Strandbeest-Bein_configuration.json"
+    with open(config_path, "r") as file:
+        config = json.load(file)
+    # every free joint and the crank joint may move by 10 % of the leg size in x and y
+    coordinates = {joint["joint_name"]: (joint["x"], joint["y"]) for joint in config["joints"]}
+    parameters = [{"joint": name, "axis": axis, "lower": coordinates[name][i] - 8.0, "upper": coordinates[name][i] + 8.0}
+                  for name in ("I", "C", "F", "H", "K") for i, axis in enumerate(("x", "y"))]
+    space = DesignSpace(config, parameters, foot="N", objective=FootObjective(flatness_weight=10.0, min_lift=5.0))
+
+    # batched dyads against the analytic solver of every variant configuration
+    values = space.sample(64, rng=0)
+    trajectories, valid = space.solve(values)
+    for i in np.flatnonzero(valid)[:5]:
+        reference = AnalyticSolver(load_mechanism_from_dict(space.variant_config(values[i]))).sweep(space.angles)
+        assert np.allclose(trajectories[i], reference, atol=1e-9), "Batched variant differs from the analytic solver!"
+    print(f"{valid.sum()} of {len(values)} sampled variants can be assembled")
+
+    # thousands of variants, in this process and on a process pool
+    values = space.sample(8192, rng=1)
+    start_time = time.perf_counter()
+    scores, metrics = evaluate_designs(space, values, workers=1)
+    time_taken = time.perf_counter() - start_time
+    print(f"{len(values)} variants in {time_taken:.2f} s ({len(values) / time_taken:.0f} variants/s), best score {np.min(scores):.2f}")
+    pool_scores, _ = evaluate_designs(space, values[:2048], batch_size=512, workers=2)
+    assert np.array_equal(pool_scores, scores[:2048]), "Process pool results differ!"
+
+    # local optimization from the shipped leg
+    base_score = space.evaluate(space.base_values)[0][0]
+    start_time = time.perf_counter()
+    result = optimize(space)
+    print(f"optimized leg: score {base_score:.2f} -> {result['score']:.2f} with {result['evaluations']} evaluations in "
+          f"{time.perf_counter() - start_time:.2f} s, {result['metrics']}")
+    assert result["score"] < base_score and np.all(np.diff(result["history"]) < 0), "Optimization did not improve the leg!"
+    assert np.all((result["values"] >= space.lower) & (result["values"] <= space.upper)), "Optimum outside the bounds!"
+    load_mechanism_from_dict(space.variant_config(result["values"])) # the optimum is a valid configuration
+
+    # a triad (three joints solved together) has no dyad solve order: numeric solve, warm started between neighbours
+    triad_config = {
+        "configuration_name": "Triad",
+        "rotation_center": "M",
+        "joints": [
+            {"joint_name": "M", "x": 15.0, "y": -10.0, "pinned": True, "rotating_joint": False},
+            {"joint_name": "G1", "x": 0.0, "y": 0.0, "pinned": True, "rotating_joint": False},
+            {"joint_name": "G2", "x": 30.0, "y": 0.0, "pinned": True, "rotating_joint": False},
+            {"joint_name": "Cr", "x": 15.0, "y": -5.0, "pinned": False, "rotating_joint": True},
+            {"joint_name": "A", "x": 5.0, "y": 12.0, "pinned": False, "rotating_joint": False},
+            {"joint_name": "B", "x": 25.0, "y": 14.0, "pinned": False, "rotating_joint": False},
+            {"joint_name": "D", "x": 16.0, "y": 20.0, "pinned": False, "rotating_joint": False},
+        ],
+        "rods": [{"start_joint": s, "end_joint": e} for s, e in
+                 (("A", "B"), ("B", "D"), ("D", "A"), ("A", "G1"), ("B", "G2"), ("D", "Cr"))],
+    }
+    triad_space = DesignSpace(triad_config, [{"joint": "D", "axis": "y", "lower": 18.0, "upper": 22.0},
+                                             {"joint": "B", "axis": "x", "lower": 23.0, "upper": 27.0}], foot="D")
+    assert triad_space.steps is None, "Triad solved as dyads!"
+    values = np.array([[20.5, 25.2], [19.6, 24.7]])
+    cold, cold_valid = triad_space.solve(values)
+    warm, warm_valid = triad_space.solve(values, warm_start=triad_space.solve(triad_space.base_values)[0][0])
+    assert cold_valid.all() and warm_valid.all() and np.allclose(cold, warm, atol=1e-8), "Warm started solve differs!"
+    result = optimize(triad_space, max_evaluations=60)
+    print(f"triad: score {triad_space.evaluate(triad_space.base_values)[0][0]:.3f} -> {result['score']:.3f} "
+          f"with {result['evaluations']} evaluations")
+    print("All tests passed!")
@@ -0,0 +1,177 @@
+import numpy as np
+from mechanism import Mechanism
+from solver import SPARSE_THRESHOLD, NEWTON_MEMORY, SINGULAR_CONDITION, AnalyticSolver, restart_solver
+
+# per frame health of a solved sweep and adaptive refinement around dead points and assembly branch flips:
+#   condition   condition number of the rod constraint jacobian of the free joints (near a dead point it goes to infinity)
+#   residual    largest rod length error (a failed solve)
+#   branch      side of every dyad joint relative to the line through its two parents (a sign change is a flip to the
+#               mirrored assembly)
+
+# largest rod length error of a frame that counts as solved
+RESIDUAL_LIMIT = 1e-6
+# flagged angle intervals are subdivided until they are this narrow
+REFINE_MIN_STEP = np.deg2rad(0.01)
+
+def branch_triples(solver):
+    # (joint, parent a, parent b) of every dyad step the joints are placed by, as (t x 3) array; the dyad steps of the
+    # analytic solver, also for other solvers (like design.py). Joints that are not placed by a dyad have no such line
+    # of two parents and are not checked.
+    solve_order = solver.solve_order if isinstance(solver, AnalyticSolver) else AnalyticSolver(solver.mechanism).solve_order
+    return np.array([step[:3] for step in solve_order], dtype=int).reshape(-1, 3)
+
+def branch_signs(positions, triples): # (N x joints x 2) -> (N x t) side of every triple, +1 / -1 (0 when collinear)
+    pa, pb, pj = positions[:, triples[:, 1]], positions[:, triples[:, 2]], positions[:, triples[:, 0]]
+    base, arm = pb - pa, pj - pa
+    return np.sign(base[..., 0] * arm[..., 1] - base[..., 1] * arm[..., 0]).astype(np.int8)
+
+class SweepDiagnostics:
+    def __init__(self, solver, angles, positions, condition_limit: float = SINGULAR_CONDITION, residual_limit: float = RESIDUAL_LIMIT):
+        mechanism = solver.mechanism
+        self.angles = np.asarray(angles, dtype=float)
+        positions = np.asarray(positions, dtype=float)
+        self.condition_limit = condition_limit
+        self.residual_limit = residual_limit
+        rod_start, rod_end = mechanism.rod_indices[:, 0], mechanism.rod_indices[:, 1]
+        free_joints = np.flatnonzero(~(mechanism.pinned | mechanism.rotating))
+
+        L = positions[:, rod_start] - positions[:, rod_end]
+        lengths = np.linalg.norm(L, axis=2)
+        self.residual = np.abs(lengths - solver.ref_rod_lengths).max(axis=1, initial=0.0)
+        self.condition = self.calculate_conditions(mechanism, L, lengths, free_joints)
+
+        triples = branch_triples(solver)
+        self.branch = branch_signs(positions, triples)
+        changed = (self.branch[1:] != self.branch[:-1]) & (self.branch[1:] != 0) & (self.branch[:-1] != 0)
+        # frame at which a new assembly branch starts (compared with the frame before)
+        self.flips = np.flatnonzero(changed.any(axis=1)) + 1
+        self.flipped_joints = [triples[changed[f - 1], 0].tolist() for f in self.flips]
+        self.singular = np.flatnonzero(self.condition > condition_limit)
+        self.failed = np.flatnonzero(self.residual > residual_limit)
+
+    def calculate_conditions(self, mechanism, L, lengths, free_joints):
+        # singular values of the batched jacobians (frames x m x 2k) = rod unit vectors times A_free
+        k, m = len(free_joints), mechanism.m
+        conditions = np.full(len(L), np.nan)
+        if k == 0 or m == 0 or 2 * k > SPARSE_THRESHOLD:
+            return conditions # a dense svd per frame is too expensive for large mechanisms
+        free_columns = np.stack([2 * free_joints, 2 * free_joints + 1], axis=1).ravel()
+        A_free = mechanism.A[:, free_columns].toarray().reshape(m, 2, 2 * k)
+        units = np.divide(L, lengths[..., None], out=np.zeros_like(L), where=lengths[..., None] > 0)
+        chunk_size = max(1, NEWTON_MEMORY // (8 * m * 2 * k * 2))
+        for start in range(0, len(L), chunk_size):
+            J = np.einsum("fmc,mcj->fmj", units[start:start + chunk_size], A_free)
+            singular_values = np.linalg.svd(J, compute_uv=False)
+            smallest = singular_values[:, -1] if m >= 2 * k else np.zeros(len(J)) # fewer rods than coordinates: not determined
+            conditions[start:start + chunk_size] = singular_values[:, 0] / np.maximum(smallest, 1e-300)
+        return conditions
+
+    def flagged_intervals(self):
+        # end frames i of the angle intervals (i - 1, i) that need a finer step:
+        # both sides of near singular and failed frames, the interval in which the branch flipped
+        ends = set(self.flips.tolist())
+        for f in np.concatenate([self.singular, self.failed]).tolist():
+            ends.update((f, f + 1))
+        return sorted(i for i in ends if 0 < i < len(self.angles))
+
+    def index(self):
+        # list of events {"frame", "angle" (degrees), "kind", "condition", "residual"} in frame order
+        events = [(f, "near_singular") for f in self.singular.tolist()] + [(f, "branch_flip") for f in self.flips.tolist()] \
+               + [(f, "residual") for f in self.failed.tolist()]
+        return [{"frame": f, "angle": float(np.rad2deg(self.angles[f])), "kind": kind,
+                 "condition": float(self.condition[f]), "residual": float(self.residual[f])} for f, kind in sorted(events)]
+
+    def summary(self):
+        parts = []
+        for kind, frames in (("near singular", self.singular), ("branch flips", self.flips), ("failed", self.failed)):
+            if len(frames) > 0:
+                angles = np.rad2deg(self.angles[frames])
+                parts.append(f"{kind} at {len(frames)} frames ({angles.min():.2f}° to {angles.max():.2f}°)")
+        return "; ".join(parts) if parts else "no dead points, branch flips or failed frames"
+
+def adaptive_sweep(solver, angles, min_step: float = REFINE_MIN_STEP, subdivisions: int = 4, max_passes: int = 20,
+                   condition_limit: float = SINGULAR_CONDITION, residual_limit: float = RESIDUAL_LIMIT):
+    # sweep on the given (coarse) angles in radians, then subdivide only the intervals around dead points, branch flips
+    # and failed frames -> (angles, positions, diagnostics), the returned angles are no longer uniform
+    angles = np.asarray(angles, dtype=float)
+    positions = solver.sweep(angles)
+    triples = branch_triples(solver)
+    for _ in range(max_passes):
+        diagnostics = SweepDiagnostics(solver, angles, positions, condition_limit, residual_limit)
+        refine = [i for i in diagnostics.flagged_intervals() if abs(angles[i] - angles[i - 1]) > min_step]
+        if not refine:
+            break
+        refine = set(refine)
+        new_angles, new_positions = [angles[:1]], [positions[:1]]
+        for i in range(1, len(angles)):
+            if i not in refine:
+                new_angles.append(angles[i:i + 1])
+                new_positions.append(positions[i:i + 1])
+                continue
+            # re-solve the interval in smaller steps, starting from the (already refined) pose before it
+            restart_solver(solver, new_angles[-1][-1], new_positions[-1][-1])
+            sub_angles = np.linspace(angles[i - 1], angles[i], subdivisions + 1)[1:]
+            sub_positions = solver.sweep(sub_angles)
+            new_angles.append(sub_angles)
+            new_positions.append(sub_positions)
+            if i + 1 < len(angles) and np.any(branch_signs(sub_positions[-1:], triples) != branch_signs(positions[i:i + 1], triples)):
+                # the coarse step had jumped to the other assembly branch: the rest of the sweep follows the refined pose
+                positions = positions.copy()
+                positions[i + 1:] = solver.sweep(angles[i + 1:])
+        angles, positions = np.concatenate(new_angles), np.concatenate(new_positions)
+    return angles, positions, SweepDiagnostics(solver, angles, positions, condition_limit, residual_limit)
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/diagnostics.py
+    import os
+    from json2config import load_mechanism_from_config
+    from solver import NumericSolver
+
+    # the configurations pass no dead point
+    config_dir = "configurations"
+    for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+        solver = AnalyticSolver(load_mechanism_from_config(os.path.join(config_dir, config_file)))
+        angles = np.deg2rad(np.arange(0, 361, 1.0))
+        diagnostics = SweepDiagnostics(solver, angles, solver.sweep(angles))
+        print(f"{config_file:45s} condition {np.nanmin(diagnostics.condition):6.1f} to {np.nanmax(diagnostics.condition):6.1f}: {diagnostics.summary()}")
+        assert len(diagnostics.index()) == 0, "Unexpected event in a configuration!"
+
+    # joints with more than two rods are checked against the two parents they are placed from
+    leg_path = os.path.join(config_dir, "Strandbeest-Bein_configuration.json")
+    leg = AnalyticSolver(load_mechanism_from_config(leg_path))
+    assert branch_triples(leg).tolist() == [list(step[:3]) for step in leg.solve_order], "Branch triples are not the dyads!"
+    assert np.array_equal(branch_triples(NumericSolver(load_mechanism_from_config(leg_path))), branch_triples(leg)), \
+        "Branch triples depend on the solver!"
+
+    def toggle_four_bar(gap):
+        # crank (radius 1) at the origin, rocker pinned at (3, 0), coupler + rocker = 4 + gap:
+        # at 180° coupler and rocker are almost stretched, a dead point of the rocker
+        half = (4 + gap) / 2
+        crank = Mechanism.Joint(1.0, 0.0, rotates_around=(0.0, 0.0))
+        coupler = Mechanism.Joint(2.0, np.sqrt(half ** 2 - 1.0))
+        ground = Mechanism.Joint(3.0, 0.0, pinned=True)
+        return Mechanism([crank, coupler, ground], [Mechanism.Rod(crank, coupler), Mechanism.Rod(coupler, ground)])
+
+    angles = np.deg2rad(np.arange(0, 361, 10.0))
+    for solver in (AnalyticSolver(toggle_four_bar(1e-6)), NumericSolver(toggle_four_bar(1e-6), continuation=True)):
+        coarse = SweepDiagnostics(solver, angles, solver.sweep(angles))
+        restart_solver(solver, angles[0], solver.sweep(angles[:1])[0])
+        refined_angles, positions, diagnostics = adaptive_sweep(solver, angles)
+        name = type(solver).__name__
+        print(f"{name:15s} coarse: {coarse.summary()}")
+        print(f"{name:15s} refined {len(angles)} -> {len(refined_angles)} frames: {diagnostics.summary()}")
+        near_dead_point = np.rad2deg(refined_angles[diagnostics.singular])
+        assert len(near_dead_point) > 0 and np.all(np.abs(near_dead_point - 180) < 5), "Dead point not found!"
+        assert len(diagnostics.failed) == 0 and len(diagnostics.flips) == 0, "Refined sweep left the assembly branch!"
+        assert np.min(np.diff(refined_angles)) <= REFINE_MIN_STEP * 1.01 and len(refined_angles) < 200, "Refinement not local!"
+
+    # a pose mirrored over the line crank - ground is the other assembly branch
+    positions = solver.sweep(angles)
+    crank, ground = positions[10:20, 0], positions[10:20, 2]
+    direction = (ground - crank) / np.linalg.norm(ground - crank, axis=1)[:, None]
+    relative = positions[10:20, 1] - crank
+    positions[10:20, 1] = crank + 2 * np.sum(relative * direction, axis=1)[:, None] * direction - relative
+    diagnostics = SweepDiagnostics(solver, angles, positions)
+    assert diagnostics.flips.tolist() == [10, 20] and diagnostics.flipped_joints == [[1], [1]], "Branch flips not found!"
+    assert len(diagnostics.failed) == 0 and {10, 20} <= set(diagnostics.flagged_intervals()), "Flips not flagged for refinement!"
+    print("All tests passed!")
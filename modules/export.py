@@ -0,0 +1,302 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+from solver import iter_sweep
+from kinematics import Kinematics
+
+# columnar trajectory export: (frames x joints x 2) arrays are written chunk by chunk as .npy, .npz, Parquet, Arrow or CSV,
+# so a sweep can be streamed to disk while it is solved and never has to be held as python rows;
+# joint velocities and accelerations can be exported alongside the positions
+
+# rows per written chunk (CSV formatting, Parquet row groups)
+EXPORT_CHUNK_ROWS = 65536
+# 12 significant digits resolve the coordinates far below the solver tolerance and format about 3x faster than repr,
+# "%r" writes the shortest exact representation like the former csv.writer export
+CSV_FLOAT_FORMAT = "%.12g"
+
+FORMATS = ["csv", "npy", "npz", "parquet", "arrow"]
+COLUMNS = ["joint_nr", "angle", "x_pos", "y_pos"]
+KINEMATIC_COLUMNS = ["x_vel", "y_vel", "x_acc", "y_acc"]
+KINEMATIC_MEMBERS = ["velocities", "accelerations"]
+MIME_TYPES = {
+    "csv": "text/csv",
+    "npy": "application/octet-stream",
+    "npz": "application/zip",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+def format_from_path(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown export format '{extension}', expected one of {FORMATS}.")
+    return extension
+
+def temp_export_path(format, prefix="moving_coords_"): # unique file per request, so concurrent sessions do not overwrite each other
+    handle, path = tempfile.mkstemp(suffix=f".{format}", prefix=prefix)
+    os.close(handle)
+    return path
+
+def chunk_frames_for(num_joints): # frames per chunk for about EXPORT_CHUNK_ROWS rows
+    return max(1, EXPORT_CHUNK_ROWS // max(num_joints, 1))
+
+def long_columns(values, angles, first_frame=0): # (frames x joints x F) -> joint_nr, angle and F value columns (one row per frame and joint)
+    frames, n = values.shape[:2]
+    joint_nr = np.tile(np.arange(n, dtype=np.int32), frames)
+    angle = np.repeat(angles[first_frame:first_frame + frames], n)
+    return [joint_nr, angle] + [values[..., i].ravel() for i in range(values.shape[2])]
+
+def write_npy_header(file, shape): # header of a C ordered float64 array, the data follows as raw bytes
+    np.lib.format.write_array_header_2_0(file, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float64)), "fortran_order": False, "shape": shape})
+
+class TrajectoryWriter:
+    # streams the coordinates of a sweep with known angles into a file: writer.write(coords chunk) in frame order,
+    # with kinematics=True every chunk also carries the joint velocities and accelerations
+    def __init__(self, path, angles, num_joints, format=None, float_format=CSV_FLOAT_FORMAT, kinematics=False):
+        self.path = path
+        self.format = format or format_from_path(path)
+        self.angles = np.asarray(angles, dtype=float)
+        self.num_joints = num_joints
+        self.kinematics = kinematics
+        self.columns = COLUMNS + (KINEMATIC_COLUMNS if kinematics else [])
+        self.csv_row = ",".join(["%d"] + [float_format] * (len(self.columns) - 1)) + "\r\n"
+        self.frame = 0
+        self.shape = (len(self.angles), num_joints, 2)
+        self.archive = None
+        self.table_writer = None
+        self.spills = {} # npz members that are streamed into temporary files next to the archive
+        if self.format == "csv":
+            self.file = open(path, "w", newline="")
+            self.file.write(",".join(self.columns) + "\r\n") # same columns and line ends as the former csv.writer export
+        elif self.format == "npy":
+            # one array, the last axis holds x, y (and vx, vy, ax, ay with kinematics)
+            self.file = open(path, "wb")
+            write_npy_header(self.file, (len(self.angles), num_joints, len(self.columns) - 2))
+        elif self.format == "npz":
+            # the angles are known up front, the coordinates are streamed into the second archive member
+            self.archive = zipfile.ZipFile(path, "w", allowZip64=True)
+            with self.archive.open("angles.npy", "w") as member:
+                np.lib.format.write_array(member, self.angles)
+            self.file = self.archive.open("coords.npy", "w", force_zip64=True)
+            write_npy_header(self.file, self.shape)
+            # a zip archive can only write one member at a time, the others are added when the writer is closed
+            for name in (KINEMATIC_MEMBERS if kinematics else []):
+                spill = tempfile.TemporaryFile()
+                write_npy_header(spill, self.shape)
+                self.spills[name] = spill
+        elif self.format in ("parquet", "arrow"):
+            import pyarrow as pa # optional, only needed for the columnar table formats
+            self.schema = pa.schema([("joint_nr", pa.int32())] + [(name, pa.float64()) for name in self.columns[1:]])
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                # dictionary encoding only pays off for the repeating joint numbers and angles
+                self.table_writer = pq.ParquetWriter(path, self.schema, use_dictionary=["joint_nr", "angle"])
+            else:
+                self.table_writer = pa.ipc.new_file(path, self.schema)
+        else:
+            raise ValueError(f"Unknown export format '{self.format}', expected one of {FORMATS}.")
+
+    def write(self, coords, velocities=None, accelerations=None): # (frames x joints x 2) arrays of the next frames of the sweep
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        if coords.shape[1:] != (self.num_joints, 2) or self.frame + len(coords) > len(self.angles):
+            raise ValueError(f"Chunk of shape {coords.shape} does not fit the trajectory of shape {self.shape} at frame {self.frame}.")
+        if self.kinematics and (velocities is None or accelerations is None):
+            raise ValueError("This writer exports kinematics, velocities and accelerations are required.")
+        values = np.concatenate([coords, velocities, accelerations], axis=2) if self.kinematics else coords
+        if self.format == "npy":
+            self.file.write(values.tobytes())
+        elif self.format == "npz":
+            self.file.write(coords.tobytes())
+            for name, array in zip(KINEMATIC_MEMBERS, (velocities, accelerations)):
+                if name in self.spills:
+                    self.spills[name].write(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        elif self.format == "csv":
+            self.write_csv(values)
+        else:
+            import pyarrow as pa
+            columns = long_columns(values, self.angles, self.frame)
+            batch = pa.RecordBatch.from_arrays([pa.array(column) for column in columns], schema=self.schema)
+            if self.format == "parquet":
+                self.table_writer.write_batch(batch)
+            else:
+                self.table_writer.write(batch)
+        self.frame += len(coords)
+
+    def write_csv(self, values):
+        # one format string for a whole block of rows instead of a csv.writer call per row
+        rows_per_block = chunk_frames_for(self.num_joints) * self.num_joints
+        columns = long_columns(values, self.angles, self.frame)
+        table = np.empty((len(columns[0]), len(columns)), dtype=object)
+        for i, column in enumerate(columns):
+            table[:, i] = column.tolist()
+        for start in range(0, len(table), rows_per_block):
+            block = table[start:start + rows_per_block]
+            self.file.write((self.csv_row * len(block)) % tuple(block.ravel()))
+
+    def close(self):
+        if self.frame != len(self.angles):
+            raise ValueError(f"Only {self.frame} of {len(self.angles)} frames were written to {self.path}.")
+        if self.table_writer is not None:
+            self.table_writer.close()
+        else:
+            self.file.close()
+        for name, spill in self.spills.items():
+            spill.seek(0)
+            with self.archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                shutil.copyfileobj(spill, member)
+            spill.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def abort(self): # close the file handles after an error, the incomplete file is removed
+        try:
+            if self.table_writer is not None:
+                self.table_writer.close()
+            else:
+                self.file.close()
+            for spill in self.spills.values():
+                spill.close()
+            if self.archive is not None:
+                self.archive.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def export_trajectory(solved_coords, angles, path, format=None, float_format=CSV_FLOAT_FORMAT, velocities=None, accelerations=None):
+    # writes an already solved trajectory (array or TrajectoryStore, read chunk by chunk), returns the path;
+    # velocities and accelerations (frames x joints x 2) are exported as extra columns when given
+    if not hasattr(solved_coords, "shape"):
+        solved_coords = np.asarray(solved_coords)
+    kinematics = velocities is not None
+    chunk_frames = chunk_frames_for(solved_coords.shape[1])
+    with TrajectoryWriter(path, angles, solved_coords.shape[1], format, float_format, kinematics) as writer:
+        for start in range(0, len(solved_coords), chunk_frames):
+            frames = slice(start, start + chunk_frames)
+            if kinematics:
+                writer.write(solved_coords[frames], velocities[frames], accelerations[frames])
+            else:
+                writer.write(solved_coords[frames])
+    return path
+
+def export_sweep(solver, angles, path, format=None, chunk_frames=None, float_format=CSV_FLOAT_FORMAT, crank_speed=None):
+    # solves and writes the sweep chunk by chunk (angles in degrees),
+    # with a crank speed (rad/s) the joint velocities and accelerations are computed per chunk and exported as well
+    angles = np.asarray(angles, dtype=float)
+    num_joints = solver.mechanism.n
+    chunk_frames = chunk_frames or chunk_frames_for(num_joints)
+    kinematics = None if crank_speed is None else Kinematics(solver.mechanism)
+    with TrajectoryWriter(path, angles, num_joints, format, float_format, kinematics is not None) as writer:
+        for start, coords in zip(range(0, len(angles), chunk_frames), iter_sweep(solver, np.deg2rad(angles), chunk_frames)):
+            if kinematics is None:
+                writer.write(coords)
+            else:
+                writer.write(coords, *kinematics.calculate(coords, np.deg2rad(angles[start:start + chunk_frames]), crank_speed))
+    return path
+
+def read_columns(path, format): # csv, parquet or arrow -> (joint_nr, angle, (rows x F) values)
+    if format == "csv":
+        table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+        return table[:, 0].astype(int), table[:, 1], table[:, 2:]
+    import pyarrow as pa
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    names = [name for name in COLUMNS + KINEMATIC_COLUMNS if name in table.column_names and name not in ("joint_nr", "angle")]
+    return table["joint_nr"].to_numpy(), table["angle"].to_numpy(), np.column_stack([table[name].to_numpy() for name in names])
+
+def load_export(path, format=None):
+    # reads an exported file back -> (values (frames x joints x F), angles in degrees or None for .npy),
+    # F is 2 (x, y) or 6 (x, y, vx, vy, ax, ay)
+    format = format or format_from_path(path)
+    if format == "npy":
+        return np.load(path), None
+    if format == "npz":
+        with np.load(path) as archive:
+            arrays = [archive["coords"]] + [archive[name] for name in KINEMATIC_MEMBERS if name in archive.files]
+            return np.concatenate(arrays, axis=2), archive["angles"]
+    joint_nr, angle, values = read_columns(path, format)
+    n = int(joint_nr.max()) + 1 if len(joint_nr) > 0 else 0
+    return values.reshape(-1, n, values.shape[1]), angle[::n] if n > 0 else angle
+
+def load_trajectory(path, format=None): # reads an exported file back -> (coords (frames x joints x 2), angles in degrees)
+    values, angles = load_export(path, format)
+    return values[..., :2], angles
+
+def load_kinematics(path, format=None): # reads the exported kinematics back -> velocities, accelerations (frames x joints x 2)
+    values, _ = load_export(path, format)
+    if values.shape[2] < 6:
+        raise ValueError(f"{path} contains no velocities and accelerations.")
+    return values[..., 2:4], values[..., 4:6]
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/export.py
+    import csv
+    import time
+    from json2config import load_mechanism_from_config
+    from solver import AnalyticSolver
+    from kinematics import calculate_kinematics
+    config_file = "configurations/Strandbeest-Bein-Doppel_configuration.json"
+    angles = np.linspace(0, 360, 3601)
+    coords = AnalyticSolver(load_mechanism_from_config(config_file)).sweep(np.deg2rad(angles))
+
+    # reference: the former row by row csv.writer export
+    reference_path = temp_export_path("csv")
+    start_time = time.perf_counter()
+    with open(reference_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["joint_nr", "angle", "x_pos", "y_pos"])
+        for frame, joints in enumerate(coords):
+            for joint_nr, (x, y) in enumerate(joints):
+                writer.writerow([joint_nr, angles[frame], x, y])
+    print(f"{'csv.writer':10s} {time.perf_counter() - start_time:.3f} s")
+
+    for format in FORMATS:
+        path = temp_export_path(format)
+        start_time = time.perf_counter()
+        export_trajectory(coords, angles, path)
+        print(f"{format:10s} {time.perf_counter() - start_time:.3f} s {os.path.getsize(path) / 1e6:8.2f} MB")
+        loaded_coords, loaded_angles = load_trajectory(path)
+        assert np.allclose(loaded_coords, coords, rtol=0, atol=1e-9), f"{format} coordinates differ!"
+        assert loaded_angles is None or np.allclose(loaded_angles, angles), f"{format} angles differ!"
+        os.remove(path)
+
+    # with repr formatting the CSV is byte for byte the former export
+    path = export_trajectory(coords, angles, temp_export_path("csv"), float_format="%r")
+    with open(path, "rb") as a, open(reference_path, "rb") as b:
+        assert a.read() == b.read(), "CSV differs from the csv.writer export!"
+    os.remove(path)
+    os.remove(reference_path)
+
+    # kinematics columns in every format
+    mechanism = load_mechanism_from_config(config_file)
+    velocities, accelerations = calculate_kinematics(mechanism, coords, np.deg2rad(angles), 2 * np.pi)
+    for format in FORMATS:
+        path = export_trajectory(coords, angles, temp_export_path(format), velocities=velocities, accelerations=accelerations)
+        loaded_velocities, loaded_accelerations = load_kinematics(path)
+        assert np.allclose(load_trajectory(path)[0], coords, rtol=0, atol=1e-9), f"{format} coordinates with kinematics differ!"
+        assert np.allclose(loaded_velocities, velocities) and np.allclose(loaded_accelerations, accelerations), f"{format} kinematics differ!"
+        os.remove(path)
+    path = export_sweep(AnalyticSolver(load_mechanism_from_config(config_file)), angles, temp_export_path("npz"), chunk_frames=500, crank_speed=2 * np.pi)
+    assert np.allclose(load_kinematics(path)[0], velocities), "Streamed kinematics differ!"
+    os.remove(path)
+
+    # streamed while solving gives the same file as the batch export
+    path = temp_export_path("npz")
+    export_sweep(AnalyticSolver(load_mechanism_from_config(config_file)), angles, path, chunk_frames=500)
+    assert np.allclose(load_trajectory(path)[0], coords), "Streamed sweep differs!"
+    os.remove(path)
+    print("All tests passed!")
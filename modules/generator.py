@@ -0,0 +1,196 @@
+import os
+import json
+import numpy as np
+from json2config import load_mechanism_from_dict
+from solver import AnalyticSolver, circle_intersection
+
+# synthetic configurations for load and scaling tests, in the schema that pages/Config.py writes (configuration_name, joints,
+# rotation_center, rods), so they go through the same loading, validation, solving and rendering as the shipped ones:
+#   dyad_chain   crank followed by dyads with random geometry, every dyad hangs on the joint before it and on a new ground
+#                joint or an earlier moving joint
+#   walker       Strandbeest legs on one crank, pairs of mirrored legs on crank pins at equal phase offsets
+# Every dyad of a chain is placed on the paths of its parents over a whole crank revolution, so its rods are chosen such
+# that the two circles intersect at every angle with a margin: the chain assembles for the full revolution and its joints
+# stay away from dead points.
+
+# crank angles per revolution on which the parent distances of a new dyad are checked
+GENERATOR_ANGLES = 72
+CRANK_RADIUS = 10.0
+# the rods of a dyad reach at least this much further than the largest parent distance (no dead point)
+DYAD_MARGIN = 0.15
+# smallest parent distance relative to the largest one, closer parents make a nearly coincident pair of circles
+MIN_DISTANCE_RATIO = 0.25
+# chance that a dyad hangs on an earlier moving joint instead of a new ground joint, and how far back it may look
+MOVING_PARENT_CHANCE = 0.3
+MOVING_PARENT_WINDOW = 8
+# the shipped leg, found relative to this module so the generator works from any working directory
+WALKER_LEG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "configurations", "Strandbeest-Bein_configuration.json")
+# largest phase offset between neighbouring crank pins of a walker (180° would make the pin triangle degenerate)
+MAX_PIN_OFFSET = np.deg2rad(120)
+
+def joint_entry(name: str, position, pinned: bool = False, rotating: bool = False):
+    return {"joint_name": name, "x": round(float(position[0]), 6), "y": round(float(position[1]), 6), "pinned": pinned,
+            "rotating_joint": rotating}
+
+def rod_entry(start: str, end: str):
+    return {"start_joint": start, "end_joint": end}
+
+def place_dyad(rng, path_a, path_b, margin: float = DYAD_MARGIN):
+    # (r_a, r_b, branch) of a joint on the (angles x 2) parent paths, or None if the parents come too close to each other
+    distance = np.linalg.norm(path_b - path_a, axis=1)
+    d_min, d_max = distance.min(), distance.max()
+    if d_min < MIN_DISTANCE_RATIO * d_max:
+        return None
+    # r_a + r_b > (1 + margin) d_max: the circles never lose each other, |r_a - r_b| < (1 - margin) d_min: never inside each other
+    mean = 0.5 * (1 + margin) * d_max * rng.uniform(1.0, 1.3)
+    difference = 0.5 * (1 - margin) * d_min * rng.uniform(-1.0, 1.0)
+    return mean + difference, mean - difference, rng.choice((-1.0, 1.0))
+
+def dyad_chain(num_dyads: int, seed: int = 0, crank_radius: float = CRANK_RADIUS, num_angles: int = GENERATOR_ANGLES):
+    # configuration of a crank and num_dyads dyads (2 to 3 + 2 * num_dyads joints), the same seed gives the same chain
+    rng = np.random.default_rng(seed)
+    start_angle = rng.uniform(0, 2 * np.pi)
+    angles = start_angle + np.linspace(0, 2 * np.pi, num_angles, endpoint=False)
+    crank_path = crank_radius * np.column_stack([np.cos(angles), np.sin(angles)])
+    joints = [joint_entry("rot_cent", (0.0, 0.0), pinned=True), joint_entry("P0", crank_path[0], rotating=True)]
+    rods = []
+    paths = {"P0": crank_path} # path of every moving joint over the revolution, the first angle is the initial pose
+    moving = ["P0"]
+    for k in range(1, num_dyads + 1):
+        parent_a = moving[-1]
+        path_a = paths[parent_a]
+        placement = None
+        if len(moving) > 1 and rng.random() < MOVING_PARENT_CHANCE:
+            parent_b = rng.choice(moving[-MOVING_PARENT_WINDOW - 1:-1])
+            placement = place_dyad(rng, path_a, paths[parent_b])
+        while placement is None:
+            # new ground joint ahead of the parent (the chain grows along x), far enough for a well-conditioned dyad
+            center = path_a.mean(axis=0)
+            extent = np.linalg.norm(path_a - center, axis=1).max() + crank_radius
+            direction = rng.uniform(-np.pi / 3, np.pi / 3)
+            ground = center + extent * rng.uniform(2.0, 3.0) * np.array([np.cos(direction), np.sin(direction)])
+            parent_b = f"G{k}"
+            placement = place_dyad(rng, path_a, np.broadcast_to(ground, path_a.shape))
+            if placement is not None:
+                joints.append(joint_entry(parent_b, ground, pinned=True))
+                paths[parent_b] = np.broadcast_to(ground, path_a.shape)
+        r_a, r_b, branch = placement
+        name = f"P{k}"
+        paths[name], _ = circle_intersection(path_a, paths[parent_b], r_a, r_b, branch)
+        joints.append(joint_entry(name, paths[name][0]))
+        rods += [rod_entry(parent_a, name), rod_entry(parent_b, name)]
+        moving.append(name)
+    return {"configuration_name": f"Dyad-Chain-{num_dyads}-{seed}", "joints": joints, "rotation_center": "rot_cent", "rods": rods}
+
+def walker(num_legs: int, leg_config_path: str = WALKER_LEG):
+    # configuration of num_legs copies of a leg on one crank: legs 2i and 2i + 1 are a leg and its mirror image (about the
+    # vertical through the rotation center) on crank pin i, the pins follow each other at equal phase offsets and every pin
+    # after the first is a dyad on an axle joint in the rotation center and the pin before it
+    with open(leg_config_path, "r") as f:
+        leg = json.load(f)
+    center_name = leg["rotation_center"]
+    leg_joints = {joint["joint_name"]: joint for joint in leg["joints"]}
+    center = np.array([leg_joints[center_name]["x"], leg_joints[center_name]["y"]], dtype=float)
+    crank_name = next(joint["joint_name"] for joint in leg["joints"] if joint["rotating_joint"])
+    grounds = [joint["joint_name"] for joint in leg["joints"] if joint["pinned"] and joint["joint_name"] != center_name]
+    free = [joint["joint_name"] for joint in leg["joints"] if not (joint["pinned"] or joint["rotating_joint"])]
+    mechanism = load_mechanism_from_dict(leg)
+    names = [joint["joint_name"] for joint in leg["joints"] if joint["joint_name"] != center_name] # mechanism joint order
+    crank = mechanism.positions[names.index(crank_name)] - center
+    start_angle = np.arctan2(crank[1], crank[0])
+
+    num_pins = (num_legs + 1) // 2
+    offset = min(2 * np.pi / num_pins, MAX_PIN_OFFSET)
+    pin_angles = start_angle + offset * np.arange(num_pins)
+    # poses of the leg at every pin angle, and at the mirrored angles for the mirror images
+    poses = AnalyticSolver(mechanism).sweep(np.concatenate([pin_angles, np.pi - pin_angles]))
+    poses[num_pins:, :, 0] = 2 * center[0] - poses[num_pins:, :, 0]
+    radius = np.linalg.norm(crank)
+
+    def leg_name(name, i):
+        return name if i == 0 else f"{name}{i}"
+
+    joints = [joint_entry(center_name, center, pinned=True)]
+    if num_pins > 1:
+        joints.append(joint_entry("axle", center, pinned=True))
+    for name in grounds:
+        position = mechanism.positions[names.index(name)]
+        joints.append(joint_entry(name, position, pinned=True))
+        if num_legs > 1:
+            joints.append(joint_entry(f"{name}_m", (2 * center[0] - position[0], position[1]), pinned=True))
+    rods = []
+    for i, angle in enumerate(pin_angles):
+        pin = leg_name(crank_name, i)
+        joints.append(joint_entry(pin, center + radius * np.array([np.cos(angle), np.sin(angle)]), rotating=i == 0))
+        if i > 0:
+            rods += [rod_entry("axle", pin), rod_entry(leg_name(crank_name, i - 1), pin)]
+    for number in range(num_legs):
+        i, mirrored = divmod(number, 2)
+        suffix = f"{i}_m" if mirrored else str(i)
+        pose = poses[num_pins * mirrored + i]
+
+        def copy_name(name):
+            if name == crank_name:
+                return leg_name(crank_name, i)
+            if name in grounds:
+                return f"{name}_m" if mirrored else name
+            return f"{name}{suffix}"
+
+        joints += [joint_entry(copy_name(name), pose[names.index(name)]) for name in free]
+        rods += [rod_entry(copy_name(rod["start_joint"]), copy_name(rod["end_joint"])) for rod in leg["rods"]]
+    return {"configuration_name": f"Walker-{num_legs}", "joints": joints, "rotation_center": center_name, "rods": rods}
+
+def generate(kind: str, num_joints: int, seed: int = 0):
+    # configuration of the kind ("chain" or "walker") with about num_joints joints (the rotation center not counted)
+    if kind == "chain":
+        # a dyad adds its joint and, unless it hangs on a moving joint, a ground joint
+        return dyad_chain(max(1, round((num_joints - 1) / (2 - MOVING_PARENT_CHANCE))), seed)
+    if kind == "walker":
+        # three ground joints, a pin per leg pair and the free joints of every leg
+        return walker(max(1, round((num_joints - 3) / 5.5)))
+    raise ValueError(f"Unknown mechanism kind: {kind}")
+
+def assembly_error(config: dict, num_angles: int = 360):
+    # largest rod length error of the analytic sweep over a full revolution (nan if a pose is undefined)
+    mechanism = load_mechanism_from_dict(config)
+    solver = AnalyticSolver(mechanism)
+    poses = solver.sweep(np.linspace(0, 2 * np.pi, num_angles + 1))
+    rods = poses[:, mechanism.rod_indices[:, 0]] - poses[:, mechanism.rod_indices[:, 1]]
+    return np.abs(np.hypot(rods[..., 0], rods[..., 1]) - solver.ref_rod_lengths).max()
+
+if __name__ == "__main__":
+    import tempfile
+    from json2config import load_mechanism_from_config
+    import benchmark
+
+    # chains of several seeds and walkers with an odd and an even number of legs assemble over the full revolution
+    for config in [dyad_chain(num_dyads, seed) for num_dyads in (1, 20, 300) for seed in range(3)] + [walker(n) for n in (1, 2, 3, 8)]:
+        error = assembly_error(config)
+        print(f"{config['configuration_name']:20s} {len(config['joints']):5d} joints {len(config['rods']):5d} rods, max rod error {error:.1e}")
+        assert error < 1e-9, "Generated mechanism does not assemble!"
+    assert dyad_chain(50, 7) == dyad_chain(50, 7) and dyad_chain(50, 7) != dyad_chain(50, 8), "Seed does not fix the chain!"
+    # the walker with one leg moves like the shipped leg
+    with open(WALKER_LEG, "r") as f:
+        leg = json.load(f)
+    single = walker(1)
+    angles = np.deg2rad(np.arange(0, 360, 30.0))
+    for config, suffix in ((leg, ""), (single, "0")):
+        names = [joint["joint_name"] for joint in config["joints"] if joint["joint_name"] != config["rotation_center"]]
+        poses = AnalyticSolver(load_mechanism_from_dict(config)).sweep(angles)
+        foot = poses[:, names.index("N" + suffix)]
+        reference = foot if suffix == "" else reference
+    assert np.allclose(foot, reference), "Single leg walker differs from the leg!"
+
+    # the written JSON loads like a configuration of the Config page
+    config_path = os.path.join(tempfile.mkdtemp(), "chain_configuration.json")
+    with open(config_path, "w") as f:
+        json.dump(dyad_chain(10), f, indent=4)
+    assert load_mechanism_from_config(config_path).n == len(dyad_chain(10)["joints"]) - 1, "Written configuration differs!"
+    os.remove(config_path)
+    os.rmdir(os.path.dirname(config_path))
+
+    # scaling from 10 to 1000 joints (python -m modules.cli scale goes on to 10000)
+    report = benchmark.run_scaling(joints=(10, 100, 1000), warmup=0, repeats=1)
+    print()
+    benchmark.print_scaling(report)
+    print("All tests passed!")
@@ -0,0 +1,305 @@
+import os
+import time
+import hashlib
+import threading
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import render
+import raster
+from cache import TrajectoryCache
+from artifact import hash_config_file, load_mechanism
+from solver import AnalyticSolver, COARSE_STEP, iter_progressive, spaced_frames
+from kinematics import calculate_kinematics
+from diagnostics import SweepDiagnostics
+from export import export_trajectory, temp_export_path
+
+# background jobs of the pages: solves, animation renders and exports run on a worker pool that all sessions share, a page only
+# submits a job and polls its state. Identical requests (same configuration content and parameters) get the same job while it
+# is queued or running, and afterwards as long as its result is kept (the last JOB_HISTORY finished jobs). The files of a
+# dropped job are removed only at the prune after the one that dropped it, so a page that still shows it can read them.
+# Threads instead of processes: the trajectory cache is shared in memory, and the renderers and encoders spend most of
+# their time in NumPy, Pillow and Agg, which release the GIL.
+
+# jobs that run at the same time, further jobs wait in the queue
+JOB_WORKERS = 2
+# finished jobs whose results are kept; older ones are dropped with their files
+JOB_HISTORY = 32
+RENDER_BACKENDS = {"matplotlib": render, "raster": raster}
+
+def job_id(key: tuple): # short stable id of a job key, e.g. for the session state of a page
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+
+class Job:
+    def __init__(self, key: tuple, total: int = 0):
+        self.key = key
+        self.id = job_id(key)
+        self.kind = key[0]
+        self.status = "queued" # queued -> running -> done or failed
+        self.stage = None # what the job is doing, e.g. "solving" or "encoding"
+        self.done = 0 # frames done of total (of the stage)
+        self.total = total
+        self.preview = None # path of a preview image while the job is running
+        self.result = None
+        self.error = None
+        self.request = None # (function, args) of the job, to submit it again
+        self.files = [] # files of the result, removed when the job is dropped
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.finished_event = threading.Event()
+
+    def report(self, done: int, total: int = None): # progress callback of the job functions
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    @property
+    def progress(self): # 0 to 1
+        if self.status == "done":
+            return 1.0
+        return min(self.done / self.total, 1.0) if self.total > 0 else 0.0
+
+    @property
+    def pending(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self): # seconds from the submission until now or until the job finished
+        return (self.finished or time.time()) - self.submitted
+
+    def wait(self, timeout: float = None): # True if the job finished within the timeout
+        return self.finished_event.wait(timeout)
+
+    def remove_files(self):
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+
+def solve_trajectory(cache: TrajectoryCache, config_path: str, start_deg: float, end_deg: float, num_frames: int,
+                     solver_name: str = "analytic"):
+    # the sweep from the trajectory cache, solved on a miss -> {"coords", "angles", "cached"}
+    cached = cache.contains(cache.make_key(config_path, start_deg, end_deg, num_frames, solver_name))
+    coords, angles = cache.get_or_solve(config_path, start_deg, end_deg, num_frames, solver_name)
+    return {"coords": coords, "angles": angles, "cached": cached}
+
+def solve_job(job: Job, cache: TrajectoryCache, config_path: str, start_deg: float, end_deg: float, num_frames: int,
+              solver_name: str = "analytic"):
+    # the batched sweep has no progress per frame, the job reports all frames at once
+    solved = solve_trajectory(cache, config_path, start_deg, end_deg, num_frames, solver_name)
+    job.report(len(solved["coords"]), len(solved["coords"]))
+    return solved
+
+def temp_gif_path(job: Job, prefix: str): # file of its own for every job, removed with the job
+    handle, gif_path = tempfile.mkstemp(suffix=".gif", prefix=prefix)
+    os.close(handle)
+    job.files.append(gif_path)
+    return gif_path
+
+def solve_progressive(job: Job, cache: TrajectoryCache, config_path: str, start_deg: float, end_deg: float, num_frames: int,
+                      interval: float):
+    # the sweep with a coarse pass first: as soon as it is solved, a raster preview animation of the whole cycle (same
+    # duration) becomes the job preview; then the other frames are solved in order and the sweep goes into the cache
+    mechanism = load_mechanism(config_path)
+    angles = np.linspace(start_deg, end_deg, num_frames)
+    coords = np.empty((num_frames, mechanism.n, 2))
+    coarse = spaced_frames(np.deg2rad(angles), COARSE_STEP)
+    job.stage = "solving"
+    for solved, (frame, _, pose) in enumerate(iter_progressive(AnalyticSolver(mechanism), np.deg2rad(angles)), start=1):
+        coords[frame] = pose
+        job.report(solved, num_frames)
+        if solved == len(coarse):
+            preview_path = temp_gif_path(job, "preview_")
+            raster.generate_animation(mechanism, coords[coarse], interval * num_frames / len(coarse), preview_path)
+            job.preview = preview_path
+    cache.put(cache.make_key(config_path, start_deg, end_deg, num_frames), coords, angles)
+    return {"coords": coords, "angles": angles, "cached": False}
+
+def render_job(job: Job, cache: TrajectoryCache, config_path: str, start_deg: float, end_deg: float, num_frames: int,
+               interval: float, backend: str = "matplotlib"):
+    # the sweep (from the cache if possible, otherwise progressively with a preview) with its diagnostics (dead points,
+    # branch flips, failed frames), then the GIF encoded into a file of its own, with progress per frame
+    if cache.contains(cache.make_key(config_path, start_deg, end_deg, num_frames)):
+        solved = solve_trajectory(cache, config_path, start_deg, end_deg, num_frames)
+    else:
+        solved = solve_progressive(job, cache, config_path, start_deg, end_deg, num_frames, interval)
+    mechanism = load_mechanism(config_path)
+    # computed once with the job, the pages only read the summary and the index of the result
+    diagnostics = SweepDiagnostics(AnalyticSolver(mechanism), np.deg2rad(solved["angles"]), solved["coords"])
+    job.stage = "encoding"
+    job.report(0, len(solved["coords"]))
+    gif_path = temp_gif_path(job, "animation_")
+    RENDER_BACKENDS[backend].generate_animation(mechanism, solved["coords"], interval, gif_path, progress=job.report)
+    return {**solved, "path": gif_path, "diagnostics": {"summary": diagnostics.summary(), "index": diagnostics.index()}}
+
+def export_job(job: Job, cache: TrajectoryCache, config_path: str, start_deg: float, end_deg: float, num_frames: int,
+               format: str, crank_speed: float = None):
+    # the sweep (from the cache if possible) written to a file of its own, with the kinematics if a crank speed is given
+    solved = solve_trajectory(cache, config_path, start_deg, end_deg, num_frames)
+    velocities, accelerations = None, None
+    if crank_speed is not None:
+        mechanism = load_mechanism(config_path)
+        velocities, accelerations = calculate_kinematics(mechanism, solved["coords"], np.deg2rad(solved["angles"]), crank_speed)
+    export_path = temp_export_path(format)
+    job.files.append(export_path)
+    export_trajectory(solved["coords"], solved["angles"], export_path, format, velocities=velocities, accelerations=accelerations)
+    return {**solved, "path": export_path, "format": format}
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, cache: TrajectoryCache = None, history: int = JOB_HISTORY):
+        self.cache = cache if cache is not None else TrajectoryCache()
+        self.history = history
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.jobs = OrderedDict() # id -> Job, least recently requested first
+        self.dropped = [] # jobs dropped by the last prune, their files are removed by the next one
+        self.lock = threading.Lock()
+        self.submitted = 0 # jobs started (requests answered by an existing job are not counted)
+
+    def submit(self, key: tuple, function, *args, total: int = 0):
+        # the job of the key: the existing one unless it failed, otherwise a new job that calls function(job, cache, *args)
+        with self.lock:
+            job = self.jobs.get(job_id(key))
+            if job is not None and job.status != "failed":
+                self.jobs.move_to_end(job.id)
+                return job
+            job = Job(key, total)
+            job.request = (function, args)
+            self.jobs[job.id] = job
+            self.jobs.move_to_end(job.id)
+            self.submitted += 1
+            self.prune()
+        self.executor.submit(self.run, job, function, args)
+        return job
+
+    def run(self, job: Job, function, args):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = function(job, self.cache, *args)
+            job.status = "done"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+            job.remove_files()
+        finally:
+            job.finished = time.time()
+            job.finished_event.set()
+
+    def prune(self):
+        # drop the least recently requested finished jobs beyond the history (pending jobs always stay), and remove the files
+        # of the jobs that the prune before dropped
+        for job in self.dropped:
+            job.remove_files()
+        finished = [job for job in self.jobs.values() if not job.pending]
+        self.dropped = finished[:max(0, len(finished) - self.history)]
+        for job in self.dropped:
+            del self.jobs[job.id]
+
+    def resubmit(self, job: Job):
+        # the same request as a new job, e.g. for a page whose job lost its files (the job is replaced if it is still kept)
+        with self.lock:
+            if self.jobs.get(job.id) is job:
+                del self.jobs[job.id]
+                self.dropped.append(job)
+        function, args = job.request
+        return self.submit(job.key, function, *args, total=job.total)
+
+    def get(self, job_id: str): # the job or None (unknown or dropped)
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def solve(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, solver_name: str = "analytic"):
+        key = ("solve", hash_config_file(config_path), float(start_deg), float(end_deg), int(num_frames), solver_name)
+        return self.submit(key, solve_job, config_path, start_deg, end_deg, num_frames, solver_name)
+
+    def render(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, interval: float, backend: str = "matplotlib"):
+        key = ("render", hash_config_file(config_path), float(start_deg), float(end_deg), int(num_frames), float(interval), backend)
+        return self.submit(key, render_job, config_path, start_deg, end_deg, num_frames, interval, backend, total=num_frames)
+
+    def export(self, config_path: str, start_deg: float, end_deg: float, num_frames: int, format: str, crank_speed: float = None):
+        key = ("export", hash_config_file(config_path), float(start_deg), float(end_deg), int(num_frames), format,
+               None if crank_speed is None else float(crank_speed))
+        return self.submit(key, export_job, config_path, start_deg, end_deg, num_frames, format, crank_speed)
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+        with self.lock:
+            for job in list(self.jobs.values()) + self.dropped:
+                job.remove_files()
+            self.jobs.clear()
+            self.dropped = []
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/jobs.py
+    from json2config import load_mechanism_from_config
+    from export import load_trajectory
+    config_path = "configurations/Strandbeest-Bein_configuration.json"
+    queue = JobQueue(workers=2)
+
+    # two sessions asking for the same animation share one job, the page polls its progress
+    start_time = time.perf_counter()
+    first = queue.render(config_path, 0, 360, 72, 1000 / 240)
+    second = queue.render(config_path, 0, 360, 72, 1000 / 240)
+    assert first is second and queue.submitted == 1, "Identical jobs not deduplicated!"
+    progress, preview_time = [], None
+    while not first.wait(0.002):
+        if first.stage == "encoding":
+            progress.append(first.progress)
+        if preview_time is None and first.preview is not None:
+            preview_time = time.perf_counter() - start_time
+    assert first.status == "done" and os.path.getsize(first.result["path"]) > 0, f"Render job failed: {first.error}"
+    assert first.done == first.total == 72 and progress == sorted(progress), "Progress not reported per frame!"
+    assert os.path.getsize(first.preview) > 0, "No preview of the coarse pass!"
+    assert first.result["diagnostics"]["index"] == [], "Diagnostics of the render job missing!"
+    print(f"render job: {time.perf_counter() - start_time:.2f} s, preview after {preview_time:.3f} s, {len(progress)} polls "
+          f"while encoding, trajectory cached: {first.result['cached']}")
+    solved, _ = queue.cache.get_or_solve(config_path, 0, 360, 72)
+    assert np.allclose(solved, AnalyticSolver(load_mechanism_from_config(config_path)).sweep(np.deg2rad(np.linspace(0, 360, 72)))), \
+        "Progressive sweep differs!"
+
+    # the preview of a fine sweep of the double leg needs only the coarse pass
+    start_time = time.perf_counter()
+    fine = queue.render("configurations/Strandbeest-Bein-Doppel_configuration.json", 0, 360, 721, 1000 / 240, backend="raster")
+    while fine.preview is None and not fine.wait(0.002):
+        pass
+    preview_time = time.perf_counter() - start_time
+    fine.wait()
+    print(f"double leg, 721 frames: preview after {preview_time:.3f} s, animation after {fine.elapsed:.2f} s")
+    assert fine.status == "done" and preview_time < 1.0, "Preview too late!"
+
+    # a finished job answers new requests right away; different parameters are a new job that reuses the cached sweep
+    assert queue.render(config_path, 0, 360, 72, 1000 / 240) is first and queue.submitted == 2, "Finished job not reused!"
+    raster_job = queue.render(config_path, 0, 360, 72, 1000 / 240, backend="raster")
+    export = queue.export(config_path, 0, 360, 72, "npz", crank_speed=2 * np.pi)
+    for job in (raster_job, export):
+        job.wait()
+        assert job.status == "done" and job.result["cached"], "Trajectory of the first job not reused!"
+    coords, angles = load_trajectory(export.result["path"])
+    assert (coords == first.result["coords"]).all() and queue.submitted == 4, "Export job differs!"
+
+    # failed jobs keep the error and are submitted again on the next request
+    failed = queue.submit(("render", "missing"), render_job, "configurations/missing.json", 0, 360, 72, 1.0)
+    failed.wait()
+    assert failed.status == "failed" and isinstance(failed.error, FileNotFoundError), "Error not kept!"
+    assert queue.submit(("render", "missing"), render_job, "configurations/missing.json", 0, 360, 72, 1.0) is not failed, "Failed job reused!"
+
+    # the history keeps only the most recently requested finished jobs and removes the files of the dropped ones
+    small_queue = JobQueue(workers=1, cache=queue.cache, history=1)
+    old = small_queue.export(config_path, 0, 360, 72, "csv")
+    old.wait()
+    new = small_queue.export(config_path, 0, 360, 72, "npy")
+    new.wait()
+    small_queue.export(config_path, 0, 180, 36, "npy").wait()
+    # a page that still shows the dropped job can read its file until the next prune
+    assert small_queue.get(old.id) is None and os.path.exists(old.result["path"]), "Files of a dropped job removed too early!"
+    small_queue.export(config_path, 0, 90, 18, "npy").wait()
+    assert not os.path.exists(old.result["path"]), "Dropped job not cleaned up!"
+    # after that it is submitted again
+    again = small_queue.resubmit(old)
+    again.wait()
+    assert again is not old and again.status == "done" and os.path.exists(again.result["path"]), "Dropped job not submitted again!"
+    small_queue.shutdown()
+    queue.shutdown()
+    assert not os.path.exists(first.result["path"]), "Files left after the shutdown!"
+    print("All tests passed!")
@@ -5,23 +5,26 @@ def load_mechanism_from_config(file_path: str):
     # open json file from file_path
     with open(file_path, "r") as f:
         config = json.load(f)
-    
+    return load_mechanism_from_dict(config)
+
+def load_mechanism_from_dict(config: dict):
+    # same as load_mechanism_from_config for an already parsed configuration (e.g. a generated design variant)
     rotation_center_name = config.get("rotation_center")
     rotation_center_coords = None
-    # filter out the coords of the rotation center
+    # one pass over the joints: the coords of the rotation center, and the other joints, which become mechanism joints
+    joint_confs = []
     for joint_conf in config["joints"]:
         if joint_conf["joint_name"] == rotation_center_name:
             rotation_center_coords = (joint_conf["x"], joint_conf["y"])
-            break
+        else:
+            joint_confs.append(joint_conf)
     if rotation_center_coords is None:
         raise ValueError("Rotation center not found in joints configuration.")
 
     joints_dict = {}
     # create joints
-    for joint_conf in config["joints"]: # iterate over all joints in the json
+    for joint_conf in joint_confs:
         name = joint_conf["joint_name"]
-        if name == rotation_center_name:
-            continue  # Skip adding the rotation center as a joint.
         x = joint_conf["x"]
         y = joint_conf["y"]
         pinned = joint_conf["pinned"]
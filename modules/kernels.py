@@ -0,0 +1,202 @@
+import numpy as np
+
+try:
+    from numba import njit # optional, compiles the kernels below to machine code
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# kernels of the numeric solver for small (dense) mechanisms: rod length residuals, their jacobian and a levenberg-marquardt
+# loop per pose and over whole sweeps. With numba the loops are compiled, so a solve has no python or numpy call overhead per
+# iteration; without it the same levenberg-marquardt loop runs in python on the vectorized numpy kernels.
+#   column      (joints,) column of every joint in the free coordinate vector, -1 for pinned, rotating or otherwise fixed joints
+#   positions   (joints x 2) pose, the free joints are updated in place
+
+# levenberg-marquardt damping relative to the trace of J^T J: start (and smallest) value, and the value at which a pose gives up
+DAMPING_START = 1e-12
+DAMPING_MAX = 1e8
+
+def joint_columns(num_joints: int, free_joints):
+    column = np.full(num_joints, -1, dtype=np.int64)
+    column[np.asarray(free_joints, dtype=np.int64)] = np.arange(len(free_joints))
+    return column
+
+def rod_residuals_numpy(positions, rod_start, rod_end, ref_rod_lengths, out):
+    L = positions[rod_start] - positions[rod_end]
+    out[:] = np.hypot(L[:, 0], L[:, 1]) - ref_rod_lengths
+
+def rod_jacobian_numpy(positions, column, rod_start, rod_end, out):
+    # (m x 2k) derivative of the rod lengths with respect to the free coordinates
+    L = positions[rod_start] - positions[rod_end]
+    lengths = np.hypot(L[:, 0], L[:, 1])
+    units = np.divide(L, lengths[:, None], out=np.zeros_like(L), where=lengths[:, None] > 0)
+    out[:] = 0.0
+    rods = np.arange(len(rod_start))
+    for joints, sign in ((rod_start, 1.0), (rod_end, -1.0)):
+        free = column[joints] >= 0
+        out[rods[free], 2 * column[joints[free]]] += sign * units[free, 0]
+        out[rods[free], 2 * column[joints[free]] + 1] += sign * units[free, 1]
+
+def rod_residuals_loop(positions, rod_start, rod_end, ref_rod_lengths, out):
+    for r in range(len(rod_start)):
+        dx = positions[rod_start[r], 0] - positions[rod_end[r], 0]
+        dy = positions[rod_start[r], 1] - positions[rod_end[r], 1]
+        out[r] = np.sqrt(dx * dx + dy * dy) - ref_rod_lengths[r]
+
+def rod_jacobian_loop(positions, column, rod_start, rod_end, out):
+    out[:] = 0.0
+    for r in range(len(rod_start)):
+        s, e = rod_start[r], rod_end[r]
+        dx = positions[s, 0] - positions[e, 0]
+        dy = positions[s, 1] - positions[e, 1]
+        length = np.sqrt(dx * dx + dy * dy)
+        if length == 0.0:
+            continue # direction undefined, the damping keeps the system regular
+        if column[s] >= 0:
+            out[r, 2 * column[s]] += dx / length
+            out[r, 2 * column[s] + 1] += dy / length
+        if column[e] >= 0:
+            out[r, 2 * column[e]] -= dx / length
+            out[r, 2 * column[e] + 1] -= dy / length
+
+if NUMBA_AVAILABLE:
+    # cache=True keeps the machine code in __pycache__, a new python process only loads it
+    rod_residuals = njit(cache=True)(rod_residuals_loop)
+    rod_jacobian = njit(cache=True)(rod_jacobian_loop)
+else:
+    rod_residuals, rod_jacobian = rod_residuals_numpy, rod_jacobian_numpy
+
+def levenberg_marquardt(positions, free_joints, column, rod_start, rod_end, ref_rod_lengths, max_iterations, tolerance):
+    # damped gauss-newton on the free joints of one pose, in place -> jacobian evaluations; the damping grows
+    # until a step lowers the squared error, so far initial guesses converge like with a trust region
+    k, m = len(free_joints), len(rod_start)
+    residuals = np.empty(m)
+    trial = np.empty(m)
+    J = np.zeros((m, 2 * k))
+    rod_residuals(positions, rod_start, rod_end, ref_rod_lengths, residuals)
+    cost = residuals @ residuals
+    damping = DAMPING_START
+    evaluations = 0
+    for _ in range(max_iterations):
+        if k == 0 or np.max(np.abs(residuals)) <= tolerance:
+            break
+        rod_jacobian(positions, column, rod_start, rod_end, J)
+        evaluations += 1
+        H = J.T @ J
+        gradient = J.T @ residuals
+        scale = 1.0 + np.trace(H)
+        previous = positions[free_joints].copy()
+        while damping < DAMPING_MAX:
+            delta = np.linalg.solve(H + damping * scale * np.eye(2 * k), gradient)
+            positions[free_joints] = previous - delta.reshape(k, 2)
+            rod_residuals(positions, rod_start, rod_end, ref_rod_lengths, trial)
+            trial_cost = trial @ trial
+            if trial_cost < cost:
+                residuals[:] = trial
+                cost = trial_cost
+                damping = max(damping / 10.0, DAMPING_START)
+                break
+            damping *= 10.0
+        else:
+            positions[free_joints] = previous # no step lowers the error any more (local minimum)
+            break
+    return evaluations
+
+if NUMBA_AVAILABLE:
+    levenberg_marquardt = njit(cache=True)(levenberg_marquardt)
+
+def levenberg_marquardt_sweep(positions, free_joints, column, rod_start, rod_end, ref_rod_lengths, max_iterations, tolerance):
+    # every frame (frames x joints x 2) solved in place from its own initial guess -> jacobian evaluations per frame
+    evaluations = np.zeros(len(positions), dtype=np.int64)
+    for frame in range(len(positions)):
+        evaluations[frame] = levenberg_marquardt(positions[frame], free_joints, column, rod_start, rod_end, ref_rod_lengths,
+                                                 max_iterations, tolerance)
+    return evaluations
+
+if NUMBA_AVAILABLE:
+    levenberg_marquardt_sweep = njit(cache=True)(levenberg_marquardt_sweep)
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/kernels.py
+    # parity with the current solvers on all configurations, for the numpy kernels and (if numba is installed) the compiled ones
+    import os
+    import sys
+    import time
+    import importlib.util
+    from json2config import load_mechanism_from_config
+    from solver import AnalyticSolver, NumericSolver
+    variants = {"numba" if NUMBA_AVAILABLE else "numpy": sys.modules[__name__]}
+    if NUMBA_AVAILABLE:
+        # the numpy fallback: this file imported a second time with the numba import blocked
+        numba_module, sys.modules["numba"] = sys.modules["numba"], None
+        spec = importlib.util.spec_from_file_location("kernels_numpy", __file__)
+        variants["numpy"] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(variants["numpy"])
+        sys.modules["numba"] = numba_module
+        assert not variants["numpy"].NUMBA_AVAILABLE, "Numba import not blocked!"
+    print(f"numba available: {NUMBA_AVAILABLE}")
+    config_dir = "configurations"
+    angles = np.deg2rad(np.arange(0, 361, 1.0))
+    rng = np.random.default_rng(0)
+    for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+        config_path = os.path.join(config_dir, config_file)
+        reference = AnalyticSolver(load_mechanism_from_config(config_path)).sweep(angles)
+        solver = NumericSolver(load_mechanism_from_config(config_path), decompose=False)
+        free_joints = solver.kernel_free_joints
+        column = solver.kernel_columns
+        m, k = solver.mechanism.m, len(free_joints)
+
+        for name, kernels in variants.items():
+            residual_kernel, jacobian_kernel = kernels.rod_residuals, kernels.rod_jacobian
+            pose_kernel, sweep_kernel = kernels.levenberg_marquardt, kernels.levenberg_marquardt_sweep
+            # residuals and jacobian of disturbed poses against the sparse matrix formulation of the solver
+            for pose in reference[::45] + rng.normal(scale=0.5, size=(len(reference[::45]), *reference.shape[1:])):
+                solver.mechanism.set_joint_coords_array(pose)
+                solver.update_fixed_differences()
+                free_positions = solver.get_free_joint_positions()
+                residuals, J = np.empty(m), np.empty((m, 2 * k))
+                residual_kernel(pose, solver.rod_start, solver.rod_end, solver.ref_rod_lengths, residuals)
+                jacobian_kernel(pose, column, solver.rod_start, solver.rod_end, J)
+                assert np.allclose(residuals, solver.calculate_differences(free_positions), atol=1e-12), f"Residuals differ ({name})!"
+                assert np.allclose(J, solver.calculate_jacobian(free_positions), atol=1e-12), f"Jacobian differs ({name})!"
+
+            # every frame from a disturbed guess, one after the other and as a sweep
+            guesses = reference.copy()
+            guesses[:, free_joints] += rng.normal(scale=0.05, size=(len(angles), k, 2))
+            poses = guesses.copy()
+            pose_kernel(poses[0], free_joints, column, solver.rod_start, solver.rod_end, solver.ref_rod_lengths, 50, 1e-10) # compiles
+            start_time = time.perf_counter()
+            for pose in poses:
+                pose_kernel(pose, free_joints, column, solver.rod_start, solver.rod_end, solver.ref_rod_lengths, 50, 1e-10)
+            pose_time = time.perf_counter() - start_time
+            sweep_poses = guesses.copy()
+            evaluations = sweep_kernel(sweep_poses, free_joints, column, solver.rod_start, solver.rod_end, solver.ref_rod_lengths, 50, 1e-10)
+            pose_error = np.abs(poses - reference).max()
+            sweep_error = np.abs(sweep_poses - reference).max()
+            print(f"{config_file:45s} {name:6s} {len(angles) / pose_time:8.0f} poses/s, {evaluations.mean():.1f} jacobians per pose, "
+                  f"max error {pose_error:.1e} / sweep {sweep_error:.1e}")
+            assert pose_error < 1e-6 and sweep_error < 1e-6, f"Kernel solve differs from the analytic solver ({name})!"
+
+        # the solver with kernels against the least_squares solver: continuation and sweep
+        for kernels in (False, True):
+            solver = NumericSolver(load_mechanism_from_config(config_path), continuation=True, decompose=False, kernels=kernels)
+            start_time = time.perf_counter()
+            poses = []
+            for angle in angles:
+                solver.solve(angle)
+                poses.append(solver.mechanism.get_joint_coords_array())
+            solve_time = time.perf_counter() - start_time
+            sweep = NumericSolver(load_mechanism_from_config(config_path), decompose=False, kernels=kernels).sweep(angles)
+            error = max(np.abs(np.array(poses) - reference).max(), np.abs(sweep - reference).max())
+            print(f"{config_file:45s} NumericSolver(kernels={kernels}): {solve_time:.3f} s for {len(angles)} solves, max error {error:.1e}")
+            assert error < 1e-6, "Solver with kernels differs from the analytic solver!"
+
+    # the kernels solve dense systems, a sparse mechanism asking for them is refused instead of silently using least_squares
+    from generator import dyad_chain
+    from json2config import load_mechanism_from_dict
+    try:
+        NumericSolver(load_mechanism_from_dict(dyad_chain(150)), kernels=True)
+        raise AssertionError("Kernels accepted for a sparse mechanism!")
+    except ValueError as e:
+        print(e)
+    print("All tests passed!")
@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import splu
+from mechanism import Mechanism
+from solver import SPARSE_THRESHOLD, NEWTON_MEMORY
+
+# joint velocities and accelerations of solved poses from the linearized rod constraints |p_s - p_e| = const:
+#   velocity:      u · (v_s - v_e) = 0
+#   acceleration:  u · (a_s - a_e) = -|v_s - v_e|² / L
+# with the rod unit vector u and length L; rod differences are taken with the connectivity matrix A (Δv = A v).
+# The crank turns with constant angular speed omega (rad/s) and angular acceleration alpha (rad/s²).
+
+def crank_kinematics(mechanism: Mechanism, angles, omega: float, alpha: float = 0.0):
+    # (indices, velocities, accelerations) of the rotating joints for all angles, (angles x rotating joints x 2) each
+    rotating, positions = mechanism.calculate_rotating_joint_positions(angles)
+    relative = positions - mechanism.rotation_centers
+    perpendicular = relative[..., ::-1] * (-1.0, 1.0)
+    return rotating, omega * perpendicular, alpha * perpendicular - omega ** 2 * relative
+
+class Kinematics:
+    def __init__(self, mechanism: Mechanism):
+        self.mechanism = mechanism
+        self.free_joints = np.flatnonzero(~(mechanism.pinned | mechanism.rotating))
+        self.k, self.m = len(self.free_joints), mechanism.m
+        free_columns = np.stack([2 * self.free_joints, 2 * self.free_joints + 1], axis=1).ravel()
+        # rod differences of the free coordinates (2m x 2k), sparse for large mechanisms like in the solver
+        self.A_free = mechanism.A[:, free_columns]
+        self.use_sparse = 2 * self.k > SPARSE_THRESHOLD
+        if not self.use_sparse:
+            self.A_free = self.A_free.toarray().reshape(self.m, 2, 2 * self.k)
+
+    def rod_differences(self, vectors): # (N x joints x 2) -> (N x m x 2) start minus end of every rod, Δ = A x
+        N = len(vectors)
+        return (self.mechanism.A @ vectors.reshape(N, -1).T).T.reshape(N, self.m, 2)
+
+    def calculate(self, positions, angles, omega: float, alpha: float = 0.0):
+        # positions (N x joints x 2) solved at the crank angles (N,) -> velocities, accelerations (N x joints x 2)
+        positions = np.asarray(positions, dtype=float)
+        angles = np.asarray(angles, dtype=float)
+        velocities = np.zeros_like(positions)
+        accelerations = np.zeros_like(positions)
+        rotating, crank_velocities, crank_accelerations = crank_kinematics(self.mechanism, angles, omega, alpha)
+        velocities[:, rotating] = crank_velocities
+        accelerations[:, rotating] = crank_accelerations
+        if self.k == 0 or len(positions) == 0:
+            return velocities, accelerations
+
+        L = self.rod_differences(positions)
+        lengths = np.linalg.norm(L, axis=2)
+        units = np.divide(L, lengths[..., None], out=np.zeros_like(L), where=lengths[..., None] > 0)
+        if self.use_sparse:
+            for frame in range(len(positions)):
+                self.solve_frame_sparse(frame, units, lengths, velocities, accelerations)
+            return velocities, accelerations
+
+        # dense batched systems, split into chunks of frames to bound the jacobian memory (as in the solver sweep)
+        chunk_size = max(1, NEWTON_MEMORY // (8 * self.m * 2 * self.k * 3))
+        for start in range(0, len(positions), chunk_size):
+            frames = slice(start, start + chunk_size)
+            self.solve_frames_dense(units[frames], lengths[frames], velocities[frames], accelerations[frames])
+        return velocities, accelerations
+
+    def solve_frames_dense(self, units, lengths, velocities, accelerations):
+        # constraint jacobian of the free coordinates (frames x m x 2k) = rod unit vectors times A_free
+        J = np.einsum("fmc,mcj->fmj", units, self.A_free)
+        JT = J.transpose(0, 2, 1)
+        H = JT @ J
+        H += 1e-12 * np.eye(2 * self.k) * (1 + np.trace(H, axis1=1, axis2=2)[:, None, None])
+        # least squares projector (frames x 2k x m), factorized once for the velocity and the acceleration system
+        P = np.linalg.solve(H, JT)
+
+        # known part: crank and pinned joints (free joints are still zero)
+        rhs = -np.sum(units * self.rod_differences(velocities), axis=2)
+        velocities[:, self.free_joints] = (P @ rhs[..., None]).reshape(len(J), self.k, 2)
+        dv = self.rod_differences(velocities)
+        rhs = -np.sum(dv * dv, axis=2) / np.where(lengths > 0, lengths, 1.0) - np.sum(units * self.rod_differences(accelerations), axis=2)
+        accelerations[:, self.free_joints] = (P @ rhs[..., None]).reshape(len(J), self.k, 2)
+
+    def solve_frame_sparse(self, frame, units, lengths, velocities, accelerations):
+        rows = np.repeat(np.arange(self.m), 2)
+        U = csr_matrix((units[frame].ravel(), (rows, np.arange(2 * self.m))), shape=(self.m, 2 * self.m))
+        J = U @ self.A_free
+        lu = splu((J.T @ J + identity(2 * self.k, format="csc") * 1e-12).tocsc())
+        rhs = -np.sum(units[frame] * self.rod_differences(velocities[frame][None])[0], axis=1)
+        velocities[frame, self.free_joints] = lu.solve(J.T @ rhs).reshape(self.k, 2)
+        dv = self.rod_differences(velocities[frame][None])[0]
+        rhs = -np.sum(dv * dv, axis=1) / np.where(lengths[frame] > 0, lengths[frame], 1.0) \
+              - np.sum(units[frame] * self.rod_differences(accelerations[frame][None])[0], axis=1)
+        accelerations[frame, self.free_joints] = lu.solve(J.T @ rhs).reshape(self.k, 2)
+
+def calculate_kinematics(mechanism: Mechanism, positions, angles, omega: float, alpha: float = 0.0):
+    # velocities and accelerations (N x joints x 2) of a solved sweep, angles in radians
+    return Kinematics(mechanism).calculate(positions, angles, omega, alpha)
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/kinematics.py
+    import os
+    import time
+    from json2config import load_mechanism_from_config
+    from solver import AnalyticSolver
+    config_dir = "configurations"
+    omega = 2 * np.pi # one revolution per second
+    for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+        mechanism = load_mechanism_from_config(os.path.join(config_dir, config_file))
+        angles = np.linspace(0, 2 * np.pi, 36001)
+        positions = AnalyticSolver(mechanism).sweep(angles)
+        start_time = time.perf_counter()
+        velocities, accelerations = calculate_kinematics(mechanism, positions, angles, omega)
+        time_taken = time.perf_counter() - start_time
+
+        # central differences of the dense sweep in time (dt = dangle / omega)
+        dt = (angles[1] - angles[0]) / omega
+        fd_velocities = (positions[2:] - positions[:-2]) / (2 * dt)
+        fd_accelerations = (positions[2:] - 2 * positions[1:-1] + positions[:-2]) / dt ** 2
+        velocity_error = np.abs(fd_velocities - velocities[1:-1]).max() / np.abs(velocities).max()
+        acceleration_error = np.abs(fd_accelerations - accelerations[1:-1]).max() / np.abs(accelerations).max()
+        print(f"{config_file:45s} {len(angles) / time_taken:10.0f} frames/s, relative error v {velocity_error:.1e}, a {acceleration_error:.1e}")
+        assert velocity_error < 1e-5 and acceleration_error < 1e-4, "Kinematics differ from finite differences!"
+
+        # the rod lengths do not change: u · Δv = 0
+        kinematics = Kinematics(mechanism)
+        L = kinematics.rod_differences(positions)
+        units = L / np.linalg.norm(L, axis=2)[..., None]
+        rate = np.sum(units * kinematics.rod_differences(velocities), axis=2)
+        assert np.abs(rate).max() < 1e-9 * np.abs(velocities).max(), "Velocities violate the rods!"
+    print("All tests passed!")
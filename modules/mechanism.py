@@ -1,10 +1,180 @@
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import maximum_bipartite_matching, connected_components
+
+# relative singular value below which the rod constraints of a group count as dependent (rank check at the initial pose)
+RANK_TOLERANCE = 1e-9
+# joints in more rigid clusters than this (the ground joints of many legs) are not scanned in a full rigid cluster search
+RIGID_HUB_DEGREE = 32
+
+class RigidClusters:
+    # rigid bodies of a linkage, found by merging clusters of joints: every rod starts as a cluster and the pinned joints are
+    # one more (the ground). Two clusters that share two joints are one body, and so are three clusters that pairwise share
+    # a joint (a triangle). The clusters are searched for a merge one at a time from a work queue until none is left.
+    def __init__(self, rod_indices, pinned, hub_degree: int = RIGID_HUB_DEGREE):
+        self.clusters = {i: {int(s_idx), int(e_idx)} for i, (s_idx, e_idx) in enumerate(rod_indices.tolist())}
+        if pinned.sum() >= 2:
+            self.clusters[len(self.clusters)] = set(np.flatnonzero(pinned).tolist())
+        self.joint_clusters = {j: set() for j in range(len(pinned))} # ids of the clusters at every joint
+        for i, cluster in self.clusters.items():
+            for j in cluster:
+                self.joint_clusters[j].add(i)
+        # joints in very many clusters (the ground joints of many legs): scanning one from each of its clusters would cost
+        # its degree squared, so full searches skip them and look merges through them up from the other side
+        self.hubs = {j for j, found in self.joint_clusters.items() if len(found) > hub_degree}
+
+    def components(self):
+        # merge until no cluster finds a merge any more -> sorted joint lists of the remaining clusters
+        queue = list(self.clusters)
+        unsearched = set(self.clusters)
+        focus = {} # joints that moved into an already searched cluster, a new merge of it has to go through one of them
+        while queue:
+            a = queue.pop()
+            if a not in self.clusters: # merged into another cluster meanwhile
+                continue
+            if a in unsearched:
+                unsearched.discard(a)
+                joints, restricted = sorted(self.clusters[a]), False
+            elif a in focus:
+                joints, restricted = sorted(focus.pop(a)), True
+            else:
+                continue
+            merge, searched = self.find_merge(a, joints, restricted)
+            if merge is None:
+                continue
+            largest, moved = self.merge(merge)
+            for i in merge - {largest}:
+                focus.pop(i, None)
+            if largest == a: # the joints of a after the one that found the merge were not searched yet
+                moved |= set(joints[searched:])
+            if largest not in unsearched:
+                focus[largest] = focus.get(largest, set()) | moved
+                queue.append(largest)
+        return sorted(sorted(cluster) for cluster in self.clusters.values())
+
+    def merge(self, merge):
+        # the smaller clusters move into the largest one (every joint moves at most log n times)
+        # -> (id of the merged cluster, joints that are new in it)
+        largest = max(merge, key=lambda i: len(self.clusters[i]))
+        moved = set()
+        for i in merge - {largest}:
+            for j in self.clusters.pop(i):
+                self.joint_clusters[j].discard(i)
+                if j not in self.clusters[largest]:
+                    self.clusters[largest].add(j)
+                    self.joint_clusters[j].add(largest)
+                    moved.add(j)
+        return largest, moved
+
+    def find_merge(self, a, joints, restricted: bool = False):
+        # (ids of the clusters that form one body with cluster a, position in joints at which the merge was found), or
+        # (None, len(joints)); only merges through the given joints of a are searched. A full search (all joints of a)
+        # skips the hubs of a, a restricted one (the joints that moved into a) does not.
+        cluster_a = self.clusters[a]
+        skipped = [] if restricted else [j for j in joints if j in self.hubs]
+        merge = self.merge_at_hubs(a, skipped)
+        if merge is not None:
+            return merge, 0
+        # a triangle of a with clusters b (at joint j of a) and c (at another joint of a) closes at a joint l outside of a
+        # that b and c share; in a full search every such l is reached from two different joints of a
+        reached = {} # joint l outside of a -> (joint j of a, neighbour b) through which it was listed first
+        probed = {} # neighbour -> joint of a, for the neighbours that were probed instead of listed
+        for position, j in enumerate(joints):
+            if j in self.hubs and not restricted:
+                continue
+            for b in self.joint_clusters[j]:
+                if b == a:
+                    continue
+                if len(cluster_a & self.clusters[b]) >= 2:
+                    return {a, b}, position
+                # a neighbour larger than all that was listed so far (the ground of a long chain) is probed instead, so
+                # a search costs the size of a and its small neighbours and not the size of the largest cluster every time
+                if not restricted and len(self.clusters[b]) > len(cluster_a) + len(reached):
+                    c = self.probe_neighbour(a, b, j, reached, probed, skipped)
+                    if c is None:
+                        probed[b] = j
+                else:
+                    c = self.list_neighbour(a, b, j, reached, probed, skipped, restricted)
+                if c is not None:
+                    return {a, b, c}, position
+        return None, len(joints)
+
+    def merge_at_hubs(self, a, hubs):
+        # merge of a through two of its skipped hubs: another cluster at both of them, or a triangle of a with a cluster
+        # at each of them -> set of cluster ids or None
+        cluster_a = self.clusters[a]
+        for i, h in enumerate(hubs):
+            for y in hubs[i + 1:]:
+                b = next(iter(self.joint_clusters[h] & self.joint_clusters[y] - {a}), None)
+                if b is not None:
+                    return {a, b}
+                owner = {} # joints outside of a of the clusters at h -> one of those clusters
+                for b in self.joint_clusters[h] - {a}:
+                    for l in self.clusters[b] - cluster_a:
+                        owner.setdefault(l, b)
+                for c in self.joint_clusters[y] - {a}:
+                    for l in self.clusters[c] - cluster_a:
+                        if l in owner:
+                            return {a, owner[l], c}
+        return None
+
+    def probe_neighbour(self, a, b, j, reached, probed, hubs):
+        # third cluster of a triangle of a and the large neighbour b (at joint j), mostly without listing the joints of b:
+        # b contains a joint listed from another joint of a, shares a joint outside of a with a neighbour probed at
+        # another joint, or with a cluster at a skipped hub -> cluster id or None
+        cluster_a, cluster_b = self.clusters[a], self.clusters[b]
+        for l, (k, c) in reached.items():
+            if k != j and l in cluster_b:
+                return c
+        for c, k in probed.items():
+            if k != j and (cluster_b & self.clusters[c]) - cluster_a:
+                return c
+        for h in hubs:
+            # the clusters at h or the joints of b, whichever are fewer
+            if len(self.joint_clusters[h]) <= len(cluster_b):
+                for c in self.joint_clusters[h] - {a}:
+                    if (self.clusters[c] & cluster_b) - cluster_a:
+                        return c
+            else:
+                for l in cluster_b - cluster_a:
+                    c = next(iter(self.joint_clusters[h] & self.joint_clusters[l]), None)
+                    if c is not None:
+                        return c
+        return None
+
+    def list_neighbour(self, a, b, j, reached, probed, hubs, restricted):
+        # third cluster of a triangle of a and the neighbour b (at joint j), found from the joints l of b outside of a:
+        # a probed neighbour or a cluster at a skipped hub contains l, or l was listed from another joint of a before
+        # -> cluster id or None (the joints of b are entered into reached)
+        cluster_a = self.clusters[a]
+        for l in self.clusters[b] - cluster_a:
+            if probed:
+                # the probed neighbours or the clusters at l, whichever are fewer
+                for c in (probed if len(probed) < len(self.joint_clusters[l]) else self.joint_clusters[l]):
+                    if probed.get(c, j) != j and l in self.clusters[c]:
+                        return c
+            for h in hubs:
+                c = next(iter(self.joint_clusters[h] & self.joint_clusters[l]), None)
+                if c is not None:
+                    return c
+            k, c = reached.setdefault(l, (j, b))
+            if k != j:
+                return c
+            if restricted:
+                # the third cluster can touch a at a joint that is not searched
+                for c in self.joint_clusters[l]:
+                    if c != a and c != b and (self.clusters[c] & cluster_a) - {j}:
+                        return c
+        return None
 
 class Mechanism:
     class Joint:
+        # thin view onto one row of the position array of the mechanism (own 1 x 2 array until bound)
+        __slots__ = ("_coords", "_index", "pinned", "rotate_center", "initial_x", "initial_y", "initial_relative", "initial_angle")
+
         def __init__(self, x: float, y: float, pinned: bool = False, rotates_around: tuple = None):
-            self.x = x
-            self.y = y
+            self._coords = np.array([[x, y]], dtype=float)
+            self._index = 0
             self.pinned = pinned
             self.rotate_center = rotates_around
 
@@ -21,6 +191,28 @@ class Mechanism:
                 self.initial_relative = None
                 self.initial_angle = None
 
+        @property
+        def x(self):
+            return self._coords[self._index, 0]
+
+        @x.setter
+        def x(self, value):
+            self._coords[self._index, 0] = value
+
+        @property
+        def y(self):
+            return self._coords[self._index, 1]
+
+        @y.setter
+        def y(self, value):
+            self._coords[self._index, 1] = value
+
+        def bind(self, coords: np.ndarray, index: int):
+            # move the position into row index of the shared position array
+            coords[index] = self._coords[self._index]
+            self._coords = coords
+            self._index = index
+
         def rotate(self, absolute_angle):
             if self.rotate_center is None:
                 raise ValueError("Rotation center not defined for this joint.")
@@ -45,38 +237,75 @@ class Mechanism:
             return f"Joint(X:{self.x:.8f} | Y:{self.y:.8f} | Pinned:{self.pinned} | Rotates around:{self.rotate_center})"
 
     class Rod:
+        # start and end index are set when the rod is added to a mechanism
+        __slots__ = ("start", "end", "start_index", "end_index")
+
         def __init__(self, start: 'Mechanism.Joint', end: 'Mechanism.Joint'):
             self.start = start
             self.end = end
+            self.start_index = None
+            self.end_index = None
 
         def __repr__(self):
-            start_index = joints.index(self.start)
-            end_index = joints.index(self.end)
-            return f"Rod(Start:{start_index} | End:{end_index})"
-            #return f"Rod(Start:{self.start} | End:{self.end})"
+            if self.start_index is None:
+                return f"Rod(Start:{self.start} | End:{self.end})"
+            return f"Rod(Start:{self.start_index} | End:{self.end_index})"
         
     def __init__(self, joints: list['Mechanism.Joint'], rods: list['Mechanism.Rod']):
         self.joints = joints
         self.rods = rods
         self.n = len(joints)  # number of joints
         self.m = len(rods)    # number of rods
+
+        # all joint positions live in one contiguous (n x 2) array, the joints are views onto its rows
+        self.positions = np.zeros((self.n, 2))
+        for i, joint in enumerate(joints):
+            joint.bind(self.positions, i)
+
+        # rods as (m x 2) array of joint indices, resolved once with a dictionary instead of list.index
+        joint_index = {id(joint): i for i, joint in enumerate(joints)}
+        try:
+            self.rod_indices = np.array([(joint_index[id(rod.start)], joint_index[id(rod.end)]) for rod in rods], dtype=int).reshape(-1, 2)
+        except KeyError:
+            raise ValueError("Rod specified joint not part of the mechanism.")
+        for rod, (start_index, end_index) in zip(rods, self.rod_indices.tolist()):
+            rod.start_index = start_index
+            rod.end_index = end_index
+
+        # joint flags and rotation data as arrays
+        self.pinned = np.array([bool(joint.pinned) for joint in joints], dtype=bool)
+        self.rotating = np.array([joint.rotate_center is not None for joint in joints], dtype=bool)
+        self.rotating_indices = np.flatnonzero(self.rotating)
+        self.rotation_centers = np.array([joints[i].rotate_center for i in self.rotating_indices], dtype=float).reshape(-1, 2)
+        self.rotation_radii = np.array([np.linalg.norm(joints[i].initial_relative) for i in self.rotating_indices])
         self.A = self.calculate_connectivity_matrix()
+        self.structure = None # structural analysis, computed once by analyze_structure()
+        self.solve_order = None # dyad solve order of the initial pose, precomputed by a compiled artifact (see artifact.py)
+
+    @classmethod
+    def from_arrays(cls, positions, rod_indices, pinned, rotating, rotation_centers):
+        # mechanism from its arrays (e.g. a compiled artifact) instead of joint and rod objects,
+        # rotation_centers (rotating joints x 2) in the order of the rotating joints
+        centers = iter(np.asarray(rotation_centers, dtype=float).reshape(-1, 2).tolist())
+        joints = [cls.Joint(x, y, is_pinned, tuple(next(centers)) if is_rotating else None)
+                  for (x, y), is_pinned, is_rotating in zip(np.asarray(positions, dtype=float).tolist(),
+                                                            np.asarray(pinned).tolist(), np.asarray(rotating).tolist())]
+        rods = [cls.Rod(joints[s_idx], joints[e_idx]) for s_idx, e_idx in np.asarray(rod_indices).tolist()]
+        return cls(joints, rods)
 
     def calculate_connectivity_matrix(self):
-        A = np.zeros((2 * self.m, 2 * self.n))
-        for i, rod in enumerate(self.rods):
-            p1 = self.joints.index(rod.start)
-            p2 = self.joints.index(rod.end)
-            A[2 * i, 2 * p1] = 1
-            A[2 * i, 2 * p2] = -1
-            A[2 * i + 1, 2 * p1 + 1] = 1
-            A[2 * i + 1, 2 * p2 + 1] = -1
-        return A
+        # sparse (2m x 2n) CSR matrix, every rod has four nonzeros: +1/-1 for x and for y
+        rows = np.arange(self.m)
+        p1, p2 = self.rod_indices[:, 0], self.rod_indices[:, 1]
+        row_indices = np.concatenate([2 * rows, 2 * rows, 2 * rows + 1, 2 * rows + 1])
+        column_indices = np.concatenate([2 * p1, 2 * p2, 2 * p1 + 1, 2 * p2 + 1])
+        data = np.concatenate([np.ones(self.m), -np.ones(self.m), np.ones(self.m), -np.ones(self.m)])
+        return csr_matrix((data, (row_indices, column_indices)), shape=(2 * self.m, 2 * self.n))
     
     def calculate_joint_differences(self):
         # calculate: l^ = A * x
-        x = np.array([coord for joint in self.joints for coord in (joint.x, joint.y)])
-        return np.dot(self.A, x)
+        x = self.positions.ravel()
+        return self.A @ x
     
     def calculate_joint_difference_matrix(self, l_hat):
         # format l^ into L (m x 2) as described on the SWD-Slides page 15
@@ -87,9 +316,174 @@ class Mechanism:
         return np.linalg.norm(L, axis=1)
     
     def update_rotating_joint_position(self, new_angle):
-        for joint in self.joints:
-            if joint.rotate_center is not None:
-                joint.rotate(new_angle)
+        # every rotating joint is moved to the absolute angle (same as Joint.rotate)
+        direction = np.array([np.cos(new_angle), np.sin(new_angle)])
+        self.positions[self.rotating_indices] = self.rotation_centers + self.rotation_radii[:, None] * direction
+
+    def get_joint_coords_array(self):
+        # copy of the positions of all joints as (n x 2) array
+        return self.positions.copy()
+
+    def set_joint_coords_array(self, coords):
+        # write (n x 2) positions back into the position array
+        self.positions[:] = coords
+
+    def calculate_rotating_joint_positions(self, angles):
+        # positions of the rotating joints for all angles at once: (indices, (angles x rotating joints x 2))
+        angles = np.asarray(angles, dtype=float)[:, None]
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        return self.rotating_indices, self.rotation_centers + self.rotation_radii[:, None] * directions
+
+    def analyze_structure(self):
+        # structural analysis of the rod graph, cached on the mechanism (the topology never changes):
+        #   pinned and rotating joints are driven (known for every crank angle), the free joints have to follow from the rods.
+        #   The rods with a free end are matched to the free joint coordinates (maximum bipartite matching); unmatched rods
+        #   are redundant (over-constrained), unmatched coordinates are free to move (under-constrained). The matched part is
+        #   split into its irreducible blocks (Dulmage-Mendelsohn), the Assur groups, in solve order: a dyad is one joint
+        #   with two rods, larger groups have to be solved together. The degree of freedom is 2k minus the rank of the
+        #   constraint jacobian at the initial pose, taken block by block.
+        if self.structure is not None:
+            return self.structure
+        driven = self.pinned | self.rotating
+        free_joints = np.flatnonzero(~driven)
+        column_of = np.full(self.n, -1)
+        column_of[free_joints] = np.arange(len(free_joints))
+        initial = np.array([(joint.initial_x, joint.initial_y) for joint in self.joints], dtype=float).reshape(-1, 2)
+
+        # rods between two driven joints do not constrain anything, but a crank joint must not be tied to the ground
+        start, end = self.rod_indices[:, 0], self.rod_indices[:, 1]
+        ground_rods = np.flatnonzero(driven[start] & driven[end])
+        angles = np.linspace(0, 2 * np.pi, 7)[:-1]
+        rotating, crank_positions = self.calculate_rotating_joint_positions(angles)
+        sweep_positions = np.repeat(initial[None], len(angles), axis=0)
+        sweep_positions[:, rotating] = crank_positions
+        ground_lengths = np.linalg.norm(sweep_positions[:, start[ground_rods]] - sweep_positions[:, end[ground_rods]], axis=2)
+        locked_rods = ground_rods[np.ptp(ground_lengths, axis=0) > RANK_TOLERANCE * (1 + ground_lengths.max(axis=0))].tolist()
+
+        # bipartite graph rods (with a free end) x free joint coordinates (2 per joint)
+        rods = np.flatnonzero(~(driven[start] & driven[end]))
+        rod_joints = [[j for j in (start[r], end[r]) if not driven[j]] for r in rods]
+        rows = np.repeat(np.arange(len(rods)), [2 * len(joints) for joints in rod_joints])
+        columns = np.array([2 * column_of[j] + c for joints in rod_joints for j in joints for c in (0, 1)], dtype=int)
+        graph = csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(rods), 2 * len(free_joints)))
+        row_match = maximum_bipartite_matching(graph, perm_type="column") # matched coordinate of every rod or -1
+        column_match = np.full(2 * len(free_joints), -1)
+        column_match[row_match[row_match >= 0]] = np.flatnonzero(row_match >= 0)
+
+        # alternating paths from unmatched rods reach the over-constrained part, from unmatched coordinates the under-constrained part
+        graph_t = graph.T.tocsr()
+        over_rows, over_columns = self.alternating_reach(np.flatnonzero(row_match < 0), graph, column_match)
+        under_columns, under_rows = self.alternating_reach(np.flatnonzero(column_match < 0), graph_t, row_match)
+
+        # irreducible blocks of the square part: coordinate c depends on the coordinates of the rod matched to it
+        square = np.ones(2 * len(free_joints), dtype=bool)
+        square[list(over_columns | under_columns)] = False
+        square &= column_match >= 0
+        dependency = graph[column_match[square]] if square.any() else csr_matrix((0, graph.shape[1]))
+        dependency_rows = np.repeat(np.flatnonzero(square), np.diff(dependency.indptr))
+        keep = square[dependency.indices]
+        dependency = csr_matrix((np.ones(keep.sum()), (dependency_rows[keep], dependency.indices[keep])), shape=(graph.shape[1],) * 2)
+        num_blocks, labels = connected_components(dependency, directed=True, connection="strong")
+        groups = self.order_groups(num_blocks, labels, square, dependency, free_joints, rods, column_match)
+
+        # numeric rank block by block (block triangular jacobian), the irregular parts count with their structural rank
+        rank = len(over_columns) + len(under_rows)
+        for group in groups:
+            rank += self.numeric_rank(self.constraint_jacobian(initial, group["rods"], group["joints"]))
+
+        self.structure = {
+            "free_joints": free_joints.tolist(),
+            "grubler": 2 * len(free_joints) - len(rods), # counting formula: free coordinates minus constraining rods
+            "rank": rank,
+            "dof": 2 * len(free_joints) - rank,
+            # over-constrained subgraph (any of its rods could be left out) and the number of rods too many
+            "overconstrained_rods": sorted(set(rods[sorted(over_rows)].tolist()) | set(locked_rods)),
+            "redundant": int(np.sum(row_match < 0)) + len(locked_rods),
+            "overconstrained_joints": sorted({int(free_joints[c // 2]) for c in over_columns}),
+            "underconstrained_joints": sorted({int(free_joints[c // 2]) for c in under_columns}),
+            "groups": groups,
+            "rigid_components": self.rigid_components(),
+        }
+        return self.structure
+
+    @staticmethod
+    def alternating_reach(starts, graph, match):
+        # vertices reached by alternating paths: from a vertex over any edge (row of graph) to the other side, back over the matching
+        reached, other = set(starts.tolist()), set()
+        stack = list(starts)
+        while stack:
+            vertex = stack.pop()
+            for neighbour in graph.indices[graph.indptr[vertex]:graph.indptr[vertex + 1]].tolist():
+                if neighbour in other:
+                    continue
+                other.add(neighbour)
+                partner = match[neighbour]
+                if partner >= 0 and partner not in reached:
+                    reached.add(partner)
+                    stack.append(partner)
+        return reached, other
+
+    @staticmethod
+    def order_groups(num_blocks, labels, square, dependency, free_joints, rods, column_match):
+        # blocks of the square part as groups {"joints", "rods", "depends"} in solve order (a group after the groups it depends on)
+        blocks = sorted(set(labels[square].tolist()))
+        depends = {block: set() for block in blocks}
+        coo = dependency.tocoo()
+        for row, column in zip(coo.row.tolist(), coo.col.tolist()):
+            if labels[row] != labels[column]:
+                depends[labels[row]].add(labels[column])
+        order, done = [], set()
+        def visit(block): # depth first topological order, the dependency graph of the blocks is acyclic
+            stack, on_stack = [(block, iter(sorted(depends[block])))], {block}
+            while stack:
+                current, children = stack[-1]
+                child = next((c for c in children if c not in done), None)
+                if child is None:
+                    stack.pop()
+                    on_stack.discard(current)
+                    if current not in done:
+                        done.add(current)
+                        order.append(current)
+                elif child not in on_stack:
+                    stack.append((child, iter(sorted(depends[child]))))
+                    on_stack.add(child)
+        for block in blocks:
+            if block not in done:
+                visit(block)
+        position = {block: i for i, block in enumerate(order)}
+        groups = []
+        for block in order:
+            columns = np.flatnonzero(square & (labels == block))
+            groups.append({
+                "joints": sorted({int(free_joints[c // 2]) for c in columns}),
+                "rods": sorted(int(rods[column_match[c]]) for c in columns),
+                "depends": sorted(position[d] for d in depends[block]),
+            })
+        return groups
+
+    def constraint_jacobian(self, positions, rods, joints):
+        # dense jacobian (rods x 2 joints) of the given rod lengths with respect to the coordinates of the given joints
+        column_of = {joint: i for i, joint in enumerate(joints)}
+        jacobian = np.zeros((len(rods), 2 * len(joints)))
+        for row, rod in enumerate(rods):
+            s_idx, e_idx = self.rod_indices[rod]
+            direction = positions[s_idx] - positions[e_idx]
+            direction = direction / max(np.linalg.norm(direction), 1e-300)
+            for joint, sign in ((s_idx, 1.0), (e_idx, -1.0)):
+                if joint in column_of:
+                    jacobian[row, 2 * column_of[joint]:2 * column_of[joint] + 2] = sign * direction
+        return jacobian
+
+    @staticmethod
+    def numeric_rank(matrix):
+        if matrix.size == 0:
+            return 0
+        singular_values = np.linalg.svd(matrix, compute_uv=False)
+        return int(np.sum(singular_values > RANK_TOLERANCE * max(singular_values[0], 1.0)))
+
+    def rigid_components(self, hub_degree: int = RIGID_HUB_DEGREE):
+        # rigid bodies of the linkage (ground = all pinned joints) as sorted joint lists, see RigidClusters
+        return RigidClusters(self.rod_indices, self.pinned, hub_degree).components()
 
     def config_check(self):
         # Check if there is exactly one rotating joint
@@ -103,29 +497,25 @@ class Mechanism:
             raise ValueError("There must be at least one pinned joint in the mechanism.")
         
         # Check if every joint is connected to at least one rod
-        unconnected_joints = [
-            joint for joint in self.joints 
-            if joint not in [rod.start for rod in self.rods] and joint not in [rod.end for rod in self.rods]
-        ]
+        connected = np.zeros(self.n, dtype=bool)
+        connected[self.rod_indices.ravel()] = True
+        unconnected_joints = [joint for joint, is_connected in zip(self.joints, connected) if not is_connected]
         if len(unconnected_joints) > 0:
             raise ValueError(f"The following joints are not connected to any rod: {unconnected_joints}")
         
-        # Correct calculation of links:
-        num_links = len(self.rods)
-        num_revolute_joints = len(self.rods)
-        #num_rotating_joints = len(rotating_joints)
-        num_joints = len(self.joints)
-        num_moving_joints = num_joints - len(pinned_joints)
-        
-        # Use the planar DoF formula for mechanisms:
-        # f = 3*(L - 1) - 2*(number of revolute joints) - (number of rotating joints)
-        #dof = 3 * (num_links - 1) - 2 * num_revolute_joints - num_rotating_joints
-        degree_check = num_links == num_moving_joints
-
-        #if not degree_check:
-            #raise ValueError(f"The mechanism must have exactly 1 degree of freedom, but it has {dof} degrees of freedom.")
-            #raise ValueError(f"Mechanismus ist nicht valide. Anzahl der Glieder: {num_links}, Anzahl der beweglichen Gelenke: {num_moving_joints}")
-        # Somehow the check is not consistent with the diverse configurations, but we have limitations in the config creator to only build valid mechanisms.
+        # Degree of freedom: with the crank angle given, every free joint has to be determined by the rods.
+        # The counting formula (free coordinates minus rods) misses redundant rods in one place and missing rods in another,
+        # so the rod graph is matched and the rank of the constraint jacobian is checked (see analyze_structure).
+        structure = self.analyze_structure()
+        if structure["redundant"] > 0:
+            raise ValueError(f"The mechanism is over-constrained, {structure['redundant']} of the following rods are redundant or lock the crank: "
+                             f"{[self.rods[i] for i in structure['overconstrained_rods']]}")
+        if structure["underconstrained_joints"]:
+            raise ValueError(f"The mechanism is under-constrained, the following joints can move freely: "
+                             f"{[self.joints[i] for i in structure['underconstrained_joints']]}")
+        if structure["dof"] != 0:
+            raise ValueError(f"The mechanism must be determined by the crank angle, but it has {structure['dof']} degrees of freedom "
+                             f"at its initial pose (rank {structure['rank']} of {2 * len(structure['free_joints'])}).")
         return True
 
     def simulate_mechanism(self):
@@ -268,6 +658,72 @@ if __name__ == "__main__":
         ic(e)
         error_counter += 1
     
-    assert error_counter == 3 or 4, "Test 3 failed!"
+    assert error_counter == 4, "Test 3 failed!"
+
+    # Test 4: Structural analysis
+    print("\n--- Test 4: Structural analysis ---")
+    structure = mechanism.analyze_structure()
+    ic(structure)
+    assert structure["dof"] == 0 and structure["grubler"] == 0 and structure["groups"] == [{"joints": [1], "rods": [0, 1], "depends": []}], "Test 4 failed!"
+    assert mechanism.analyze_structure() is structure, "Structure is not cached!"
+
+    # 4.1: redundant rod (two rods between the same joints) and a rod from the crank to the ground
+    joints_redundant = [Mechanism.Joint(0, 0, True), Mechanism.Joint(10, 35), Mechanism.Joint(-25, 10, rotates_around=(-30, 0))]
+    rods_redundant = [Mechanism.Rod(joints_redundant[0], joints_redundant[1]), Mechanism.Rod(joints_redundant[1], joints_redundant[2]),
+                      Mechanism.Rod(joints_redundant[1], joints_redundant[2]), Mechanism.Rod(joints_redundant[0], joints_redundant[2])]
+    structure = Mechanism(joints_redundant, rods_redundant).analyze_structure()
+    ic(structure["redundant"], structure["overconstrained_rods"])
+    assert structure["redundant"] == 2 and structure["overconstrained_rods"] == [0, 1, 2, 3], "Test 4.1 failed!"
+
+    # 4.2: counting formula satisfied, but one part over- and the other under-constrained
+    joints_mixed = [Mechanism.Joint(0, 0, True), Mechanism.Joint(10, 0), Mechanism.Joint(20, 0), Mechanism.Joint(0, 10, rotates_around=(-5, 10)),
+                    Mechanism.Joint(20, 10, True)]
+    rods_mixed = [Mechanism.Rod(joints_mixed[0], joints_mixed[1]), Mechanism.Rod(joints_mixed[1], joints_mixed[3]),
+                  Mechanism.Rod(joints_mixed[1], joints_mixed[4]), Mechanism.Rod(joints_mixed[2], joints_mixed[4])]
+    structure = Mechanism(joints_mixed, rods_mixed).analyze_structure()
+    ic(structure["grubler"], structure["overconstrained_joints"], structure["underconstrained_joints"])
+    assert structure["grubler"] == 0 and structure["overconstrained_joints"] == [1] and structure["underconstrained_joints"] == [2], "Test 4.2 failed!"
+
+    # 4.3: triad (class II Assur group of three joints) and a dyad that hangs on it
+    g1, g2, c = Mechanism.Joint(0, 0, True), Mechanism.Joint(30, 0, True), Mechanism.Joint(15, -5, rotates_around=(15, -10))
+    a, b, d, e = Mechanism.Joint(5, 12), Mechanism.Joint(25, 14), Mechanism.Joint(16, 20), Mechanism.Joint(-8, 18)
+    rods_triad = [Mechanism.Rod(a, b), Mechanism.Rod(b, d), Mechanism.Rod(d, a), Mechanism.Rod(a, g1), Mechanism.Rod(b, g2),
+                  Mechanism.Rod(d, c), Mechanism.Rod(e, a), Mechanism.Rod(e, g1)]
+    triad = Mechanism([g1, g2, c, a, b, d, e], rods_triad)
+    structure = triad.analyze_structure()
+    ic(structure["groups"], structure["rigid_components"])
+    assert triad.config_check() and structure["groups"] == [{"joints": [3, 4, 5], "rods": [0, 1, 2, 3, 4, 5], "depends": []},
+                                                            {"joints": [6], "rods": [6, 7], "depends": [0]}], "Test 4.3 failed!"
+    assert [3, 4, 5] in structure["rigid_components"] and [0, 1] in structure["rigid_components"], "Test 4.3 failed!"
+
+    # 4.4: the configurations are determined, the Strandbeest leg decomposes into dyads and rigid triangles
+    from json2config import load_mechanism_from_config
+    for config_file in ("Viergelenkkette", "Strandbeest-Bein", "Strandbeest-Bein-Doppel"):
+        structure = load_mechanism_from_config(f"configurations/{config_file}_configuration.json").analyze_structure()
+        ic(config_file, [group["joints"] for group in structure["groups"]], structure["rigid_components"])
+        assert structure["dof"] == 0 and sum(len(group["joints"]) for group in structure["groups"]) == len(structure["free_joints"]), "Test 4.4 failed!"
+
+    # 4.5: the check of every load scales with the joint count, also around hub joints that many legs share
+    # (the time is only printed, python -m modules.cli scale benchmarks generated configurations)
+    import time
+    def dyad_chain(num_dyads, rng):
+        # crank 0, dyads k = 1 .. num_dyads on joint k - 1 and their own ground joint num_dyads + k
+        rods = [(k - 1, k) for k in range(1, num_dyads + 1)] + [(num_dyads + k, k) for k in range(1, num_dyads + 1)]
+        pinned = np.arange(2 * num_dyads + 1) > num_dyads
+        return Mechanism.from_arrays(rng.uniform(-100, 100, (2 * num_dyads + 1, 2)), rods, pinned, np.arange(2 * num_dyads + 1) == 0, [(0, 0)])
+    def legs(num_legs, rng):
+        # crank 0 and ground joints 1 and 2 shared by all legs, every leg a rigid triangle (1, p, q) and a dyad r on q and 2
+        rods = [rod for p in range(3, 3 + 3 * num_legs, 3) for rod in ((0, p), (1, p), (p, p + 1), (1, p + 1), (p + 1, p + 2), (2, p + 2))]
+        n = 3 + 3 * num_legs
+        return Mechanism.from_arrays(rng.uniform(-100, 100, (n, 2)), rods, np.isin(np.arange(n), (1, 2)), np.arange(n) == 0, [(0, 0)])
+    rng = np.random.default_rng(0)
+    for build, size in ((dyad_chain, 5000), (legs, 3333)):
+        large = build(size, rng)
+        start_time = time.perf_counter()
+        assert large.config_check(), "Test 4.5 failed!"
+        print(f"{build.__name__} with {large.n} joints checked in {time.perf_counter() - start_time:.2f} s")
+        # hubs change how the clusters are searched, not the clusters
+        small = build(size // 20, rng)
+        assert small.rigid_components(hub_degree=small.m) == small.analyze_structure()["rigid_components"], "Test 4.5 failed!"
 
     print("\nAll tests passed!")
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw
+from render import GifWriter, VideoWriter, get_axis_limits
+
+# matplotlib free renderer: rods, joints and the crank circle are rasterized straight into Pillow image buffers
+# (no axes, ticks or title), for animations where the frame throughput matters more than the decorations
+
+# output size in pixels, same as the matplotlib figure
+IMAGE_SIZE = (640, 480)
+# every frame is drawn at this multiple of the output size and box filtered down (anti-aliasing)
+SUPERSAMPLE = 3
+# free border around the axis limits in output pixels
+MARGIN = 16
+# coverage levels per color, the fixed palette holds the blends background -> rod and background -> crank
+LEVELS = 128
+
+BACKGROUND = np.array([255, 255, 255])
+ROD_COLOR = np.array([0, 0, 255])
+CRANK_COLOR = np.array([255, 0, 0])
+
+def world_to_pixel_transform(x_lim, y_lim, width, height, margin): # scale and offset with equal aspect, the y axis points up
+    scale = min((width - 2 * margin) / (x_lim[1] - x_lim[0]), (height - 2 * margin) / (y_lim[1] - y_lim[0]))
+    # center the axis limits in the image
+    offset_x = width / 2 - scale * (x_lim[0] + x_lim[1]) / 2
+    offset_y = height / 2 + scale * (y_lim[0] + y_lim[1]) / 2
+    return np.array([scale, -scale]), np.array([offset_x, offset_y])
+
+def create_palette(): # (2 * LEVELS x 3) uint8, index 0 is the background
+    t = np.linspace(0, 1, LEVELS)[:, None]
+    rod = BACKGROUND * (1 - t) + ROD_COLOR * t
+    crank = BACKGROUND * (1 - t) + CRANK_COLOR * t
+    return np.rint(np.vstack([rod, crank])).astype(np.uint8)
+
+class RasterRenderer:
+    # frames are drawn as 8 bit coverage masks and mapped straight to indices of a fixed palette,
+    # so no color quantization is needed before the GIF encoder
+    def __init__(self, mechanism, x_lim, y_lim, size=IMAGE_SIZE, supersample=SUPERSAMPLE, rod_width=2, joint_radius=3):
+        self.mechanism = mechanism
+        self.size = size
+        self.supersample = supersample
+        self.canvas_size = (size[0] * supersample, size[1] * supersample)
+        self.scale, self.offset = world_to_pixel_transform(x_lim, y_lim, *self.canvas_size, MARGIN * supersample)
+        self.rod_width = max(1, round(rod_width * supersample))
+        self.joint_radius = joint_radius * supersample
+        self.rod_joints = np.unique(mechanism.rod_indices)
+        self.palette = create_palette()
+        self.level_shift = 8 - int(np.log2(LEVELS))
+        self.blank = Image.new("L", self.canvas_size, 0)
+        self.background = self.draw_background()
+
+    def to_pixels(self, coords): # world coordinates (... x 2) -> supersampled pixel coordinates
+        return np.asarray(coords) * self.scale + self.offset
+
+    def reduce(self, image): # box filter the supersampled mask down to the output size
+        if self.supersample > 1:
+            image = image.reduce(self.supersample)
+        return np.asarray(image)
+
+    def draw_background(self): # static part of every frame as palette indices: rotation center and crank circle
+        image = self.blank.copy()
+        draw = ImageDraw.Draw(image)
+        if len(self.mechanism.rotating_indices) > 0:
+            cx, cy = self.to_pixels(self.mechanism.rotation_centers[0])
+            radius = self.mechanism.rotation_radii[0] * self.scale[0]
+            draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), outline=255, width=self.supersample)
+            dot = 2.5 * self.supersample
+            draw.ellipse((cx - dot, cy - dot, cx + dot, cy + dot), fill=255)
+        coverage = self.reduce(image) >> self.level_shift
+        return np.where(coverage > 0, LEVELS + coverage, 0).astype(np.uint8)
+
+    def render(self, coords): # one frame (height x width) as uint8 palette indices
+        pixels = self.to_pixels(coords)
+        image = self.blank.copy()
+        draw = ImageDraw.Draw(image)
+        for start, end in pixels[self.mechanism.rod_indices].tolist():
+            draw.line((*start, *end), fill=255, width=self.rod_width)
+        r = self.joint_radius
+        for x, y in pixels[self.rod_joints].tolist():
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=255)
+        coverage = self.reduce(image) >> self.level_shift
+        # rods are drawn on top of the crank circle
+        return np.where(coverage > 0, coverage, self.background)
+
+    def to_rgb(self, indices): # palette indices -> (height x width x 3) uint8 RGB
+        return self.palette[indices]
+
+    def render_frames(self, solved_coords, workers=None): # yields the frames in order, rendered by a thread pool
+        # Pillow and NumPy release the GIL while filtering, so the threads overlap; the batches bound the look ahead
+        workers = workers or min(8, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch = 4 * workers
+            for start in range(0, len(solved_coords), batch):
+                yield from executor.map(self.render, solved_coords[start:start + batch])
+
+def draw_frame(mechanism, coords, x_lim, y_lim, img_path="outputs/frame.png"): # same call as render.draw_frame
+    renderer = RasterRenderer(mechanism, x_lim, y_lim)
+    Image.fromarray(renderer.to_rgb(renderer.render(coords))).save(img_path)
+    return img_path
+
+def generate_animation(mechanism, solved_coords, interval, gif_path="outputs/animation.gif", workers=None, progress=None): # same call as render.generate_animation
+    x_lim, y_lim = get_axis_limits(solved_coords)
+    renderer = RasterRenderer(mechanism, x_lim, y_lim)
+    writer = GifWriter(gif_path, interval, palette=renderer.palette)
+    try:
+        for frame, indices in enumerate(renderer.render_frames(solved_coords, workers)):
+            writer.write(indices)
+            if progress is not None:
+                progress(frame + 1, len(solved_coords))
+    except BaseException:
+        writer.discard() # the error of the drawing is raised, not the one of a GIF that has no frames yet
+        raise
+    writer.close()
+    return gif_path
+
+def generate_video(mechanism, solved_coords, framerate, video_path="outputs/animation.mp4", workers=None, progress=None): # same call as render.generate_video
+    x_lim, y_lim = get_axis_limits(solved_coords)
+    renderer = RasterRenderer(mechanism, x_lim, y_lim)
+    writer = VideoWriter(video_path, framerate, *renderer.size, pix_fmt="rgb24")
+    try:
+        for frame, indices in enumerate(renderer.render_frames(solved_coords, workers)):
+            writer.write(renderer.to_rgb(indices))
+            if progress is not None:
+                progress(frame + 1, len(solved_coords))
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close()
+    return video_path
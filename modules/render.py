@@ -0,0 +1,206 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+from PIL import Image, GifImagePlugin
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from export import export_trajectory
+
+# simulation, export and rendering helpers shared by the Visualization page and the command line (no streamlit import)
+
+def get_joint_coords(mechanism):
+    return mechanism.get_joint_coords_array()
+
+def calculate_solved_coords(mechanism, solver, start_deg, end_deg, num_frames): # returns array (frames x joints x 2) of joint positions
+    angles = np.linspace(start_deg, end_deg, num_frames)
+    solved = solver.sweep(np.deg2rad(angles))
+    return solved, angles
+
+def save_moving_coords_csv(solved_coords, angles, csv_path="outputs/moving_coords.csv"): # saves moving coordinates to a CSV file
+    return export_trajectory(solved_coords, angles, csv_path, "csv")
+
+def get_axis_limits(solved_coords): # reads in solved coordinates and returns axis limits rounded to the next multiple of 5
+    if hasattr(solved_coords, "bounds"): # on-disk sweeps (TrajectoryStore) keep their bounds in the index, no frame is read
+        (x_min, y_min), (x_max, y_max) = solved_coords.bounds()
+    else:
+        solved_coords = np.asarray(solved_coords) # (might be making erros at specific configurations when the fixed joint is further away than the moving joint -> test?)
+        x_min, x_max = solved_coords[..., 0].min(), solved_coords[..., 0].max()
+        y_min, y_max = solved_coords[..., 1].min(), solved_coords[..., 1].max()
+    x_lim = (int(x_min // 5 * 5), int((x_max // 5 + 1) * 5))
+    y_lim = (int(y_min // 5 * 5), int((y_max // 5 + 1) * 5))
+    return x_lim, y_lim
+
+def create_figure(mechanism, x_lim, y_lim, title): # figure with axes, rotation center and crank circle (pyplot free, so it is thread safe)
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_aspect('equal')
+    ax.set_xlim(x_lim)
+    ax.set_ylim(y_lim)
+    ax.set_title(title)
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+
+    # Plot rotation center
+    if len(mechanism.rotating_indices) > 0:
+        rotation_center = mechanism.rotation_centers[0]
+        ax.plot(rotation_center[0], rotation_center[1], 'ro', markersize=5)
+        circle = Circle(rotation_center, mechanism.rotation_radii[0], color='r', fill=False)
+        ax.add_patch(circle)
+    return fig, ax
+
+def draw_frame(mechanism, coords, x_lim, y_lim, img_path="outputs/frame.png"): # draws a single frame of the mechanism at the given joint coordinates
+    fig, ax = create_figure(mechanism, x_lim, y_lim, "Mechanism Frame")
+    
+    # Plot rods as blue lines.
+    for s_idx, e_idx in mechanism.rod_indices:
+        sx, sy = coords[s_idx]
+        ex, ey = coords[e_idx]
+        ax.plot([sx, ex], [sy, ey], 'bo-', lw=2)
+
+    # Plot joints as green dots. (deactivated to match animation)
+    #for (x, y) in coords:
+    #    ax.plot(x, y, 'go')
+    
+    fig.savefig(img_path)
+    return img_path
+
+def render_frames(mechanism, solved_coords, x_lim, y_lim, title="Mechanism Animation"): # yields every frame as (height x width x 4) RGBA array
+    fig, ax = create_figure(mechanism, x_lim, y_lim, title)
+    rod_joints = np.unique(mechanism.rod_indices)
+
+    # all rods in one collection, the rod ends as one marker line (same look as 'bo-')
+    rods = LineCollection([], colors='b', linewidths=2, animated=True)
+    ax.add_collection(rods)
+    joints, = ax.plot([], [], 'bo', animated=True)
+
+    # draw the static background once and blit the moving artists onto it for every frame
+    canvas = fig.canvas
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    # frames are read one at a time, so trajectory stores on disk are rendered without loading them
+    for frame in range(len(solved_coords)):
+        canvas.restore_region(background)
+        coords = np.asarray(solved_coords[frame])
+        rods.set_segments(coords[mechanism.rod_indices])
+        joints.set_data(coords[rod_joints, 0], coords[rod_joints, 1])
+        ax.draw_artist(rods)
+        ax.draw_artist(joints)
+        # the buffer is overwritten by the next frame, consumers have to encode or copy it right away
+        yield np.asarray(canvas.buffer_rgba())
+
+class GifWriter: # streams frames into a GIF file, every frame is quantized to the palette of the first frame
+    def __init__(self, gif_path, duration, colors=256, palette=None):
+        # palette: optional fixed (colors x 3) RGB palette, frames are then passed as (height x width) palette index arrays
+        self.file = open(gif_path, "wb")
+        self.duration = duration
+        self.colors = colors
+        self.fixed_palette = None if palette is None else np.asarray(palette, dtype=np.uint8).ravel().tolist()
+        self.palette = None
+
+    def write(self, frame):
+        if frame.ndim == 2:
+            image = Image.fromarray(frame, "P")
+            image.putpalette(self.fixed_palette)
+        elif self.palette is None:
+            image = Image.fromarray(frame[..., :3]).quantize(colors=self.colors, method=Image.Quantize.MEDIANCUT)
+        else:
+            image = Image.fromarray(frame[..., :3]).quantize(palette=self.palette, dither=Image.Dither.NONE)
+        indices = np.asarray(image)
+        if self.palette is None:
+            # the global color table of the first frame is used by all following frames
+            self.palette = image
+            header, _ = GifImagePlugin.getheader(image, info={"loop": 0, "duration": self.duration})
+            self.file.write(b"".join(header))
+            offset = (0, 0)
+        else:
+            # frames are not disposed, so only the rectangle that changed since the previous frame is encoded
+            changed = indices != self.previous
+            rows, columns = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            if len(rows) == 0:
+                rows, columns = np.array([0]), np.array([0])
+            box = (columns[0], rows[0], columns[-1] + 1, rows[-1] + 1)
+            image = image.crop(box)
+            offset = box[:2]
+        self.previous = indices
+        self.file.write(b"".join(GifImagePlugin.getdata(image, offset=offset, duration=self.duration)))
+
+    def close(self):
+        if self.palette is None: # a GIF without any frame is only a header, no valid file is left behind
+            self.discard()
+            raise ValueError("The animation has no frames, a GIF needs at least one.")
+        self.file.write(b";") # GIF trailer
+        self.file.close()
+
+    def discard(self): # stop writing after an error and remove the unfinished file
+        self.file.close()
+        os.remove(self.file.name)
+
+class VideoWriter: # streams raw RGBA (or RGB) frames to a local ffmpeg (MP4 with H.264 or WebM with VP9)
+    def __init__(self, video_path, framerate, width, height, pix_fmt="rgba"):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg was not found, video export is not available.")
+        codec = ["-c:v", "libvpx-vp9"] if video_path.endswith(".webm") else ["-c:v", "libx264"]
+        command = [ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{width}x{height}", "-r", str(framerate), "-i", "-",
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", *codec, "-pix_fmt", "yuv420p", video_path]
+        self.video_path = video_path
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, rgba):
+        self.process.stdin.write(rgba.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode the video.")
+
+    def discard(self): # stop ffmpeg after an error and remove the unfinished file
+        self.process.kill()
+        self.process.wait()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError: # frames still buffered for the killed process
+            pass
+        if os.path.exists(self.video_path):
+            os.remove(self.video_path)
+
+def generate_animation(mechanism, solved_coords, interval, gif_path="outputs/animation.gif", colors=256, progress=None): # generates an animation of the mechanism
+    # progress: optional callback (encoded frames, total frames), called after every frame
+    x_lim, y_lim = get_axis_limits(solved_coords)
+    writer = GifWriter(gif_path, interval, colors)
+    try:
+        for frame, rgba in enumerate(render_frames(mechanism, solved_coords, x_lim, y_lim)):
+            writer.write(rgba)
+            if progress is not None:
+                progress(frame + 1, len(solved_coords))
+    except BaseException:
+        writer.discard() # the error of the drawing is raised, not the one of a GIF that has no frames yet
+        raise
+    writer.close()
+    return gif_path
+
+def generate_video(mechanism, solved_coords, framerate, video_path="outputs/animation.mp4", progress=None): # MP4/WebM through a local ffmpeg
+    x_lim, y_lim = get_axis_limits(solved_coords)
+    writer = None
+    try:
+        for frame, rgba in enumerate(render_frames(mechanism, solved_coords, x_lim, y_lim)):
+            if writer is None:
+                writer = VideoWriter(video_path, framerate, rgba.shape[1], rgba.shape[0])
+            writer.write(rgba)
+            if progress is not None:
+                progress(frame + 1, len(solved_coords))
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    if writer is not None:
+        writer.close()
+    return video_path
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
@@ -1,61 +1,777 @@
 import numpy as np
 from scipy.optimize import least_squares
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import spsolve
 from mechanism import Mechanism
+from kernels import NUMBA_AVAILABLE, joint_columns, levenberg_marquardt, levenberg_marquardt_sweep
+
+# number of free coordinates from which on the jacobian is handled as a sparse matrix
+SPARSE_THRESHOLD = 200
+# memory budget in bytes for the jacobians of one batch of frames in a sweep
+NEWTON_MEMORY = 64 * 1024 ** 2
+# angle step of the sequentially solved seed poses of a sweep
+SEED_STEP = np.deg2rad(5)
+# condition number of the jacobian above which a pose counts as near singular (dead point)
+SINGULAR_CONDITION = 1e3
+# largest rod length error that is accepted as converged during continuation
+CONTINUATION_TOLERANCE = 1e-8
+# frames per chunk when a long sweep is solved piece by piece
+SWEEP_CHUNK_FRAMES = 4096
+# angle step of the coarse first pass of a progressive sweep (a preview of the whole cycle)
+COARSE_STEP = np.deg2rad(20)
+# a kept block factorization is renewed when a newton step reduces the residual by less than this factor
+CHORD_CONTRACTION = 0.1
+# longest joint move of one block newton step as a fraction of the shortest rod of the group
+MAX_MOVE = 0.25
+# largest number of dependency levels solved block by block, longer chains of groups are solved as one system
+BLOCK_LEVELS = 16
+# largest rod length error at which the levenberg-marquardt kernels stop (like the batched sweep)
+KERNEL_TOLERANCE = 1e-10
+# gap between two dyad circles (relative to the sum of their radii) up to which they still count as touching (toggle position)
+ASSEMBLY_TOLERANCE = 1e-9
+
+class SolverBlock:
+    # independent Assur groups of one size from one level of the solve order (see Mechanism.analyze_structure): their free
+    # joints (B x k) and the rods that determine them (B x m, square: m = 2k). All groups are solved together by batched
+    # newton steps, and each group keeps the inverse of its jacobian across angles as long as it still contracts (chord newton)
+    def __init__(self, mechanism: Mechanism, groups: list[dict], ref_rod_lengths):
+        self.joints = np.array([group["joints"] for group in groups], dtype=int)
+        self.rods = np.array([group["rods"] for group in groups], dtype=int)
+        self.rod_start = mechanism.rod_indices[self.rods, 0]
+        self.rod_end = mechanism.rod_indices[self.rods, 1]
+        self.ref_rod_lengths = ref_rod_lengths[self.rods]
+        (self.B, self.k), self.m = self.joints.shape, self.rods.shape[1]
+        # column of the rod ends in their group (-1 for joints placed by earlier groups)
+        column = {joint: i for joints in self.joints.tolist() for i, joint in enumerate(joints)}
+        group_of = {joint: b for b, joints in enumerate(self.joints.tolist()) for joint in joints}
+        start_column = np.array([[column[j] if group_of.get(j) == b else -1 for j in row] for b, row in enumerate(self.rod_start.tolist())], dtype=int)
+        end_column = np.array([[column[j] if group_of.get(j) == b else -1 for j in row] for b, row in enumerate(self.rod_end.tolist())], dtype=int)
+        self.start_entries = (*np.nonzero(start_column >= 0), start_column[start_column >= 0])
+        self.end_entries = (*np.nonzero(end_column >= 0), end_column[end_column >= 0])
+        self.max_move = MAX_MOVE * self.ref_rod_lengths.min(axis=1)
+        # side of every group joint relative to the other ends of two of its rods, a sign change is a jump to the mirrored branch
+        self.branch_triples = np.array([[(j, *np.concatenate([start[end == j], end[start == j]])[:2]) for j in joints]
+                                        for joints, start, end in zip(self.joints.tolist(), self.rod_start, self.rod_end)], dtype=int)
+        self.inverse = np.zeros((self.B, 2 * self.k, self.m)) # kept inverse jacobians
+        self.factored = np.zeros(self.B, dtype=bool)
+        self.factorizations = np.zeros(self.B, dtype=int)
+
+    def residuals(self, positions): # positions (joints x 2) -> (B x m) rod length errors
+        L = positions[self.rod_start] - positions[self.rod_end]
+        return np.hypot(L[..., 0], L[..., 1]) - self.ref_rod_lengths
+
+    def jacobian(self, positions, groups): # (groups x m x 2k) derivative of the rod lengths with respect to the group coordinates
+        L = positions[self.rod_start[groups]] - positions[self.rod_end[groups]]
+        lengths = np.hypot(L[..., 0], L[..., 1])
+        units = np.divide(L, lengths[..., None], out=np.zeros_like(L), where=lengths[..., None] > 0)
+        selected = np.zeros(self.B, dtype=bool)
+        selected[groups] = True
+        position = np.cumsum(selected) - 1 # row of every selected group in the result
+        J = np.zeros((len(groups), self.m, self.k, 2))
+        for (b, rods, columns), sign in ((self.start_entries, 1.0), (self.end_entries, -1.0)):
+            keep = selected[b]
+            J[position[b[keep]], rods[keep], columns[keep]] += sign * units[position[b[keep]], rods[keep]]
+        return J.reshape(len(groups), self.m, 2 * self.k)
+
+    def factorize(self, positions, groups):
+        # damped least squares inverse (J^T J + eps I)^-1 J^T, equal to J^-1 for regular groups and finite at dead points
+        J = self.jacobian(positions, groups)
+        JT = J.transpose(0, 2, 1)
+        H = JT @ J
+        H += 1e-12 * np.eye(2 * self.k) * (1 + np.trace(H, axis1=1, axis2=2)[:, None, None])
+        self.inverse[groups] = np.linalg.solve(H, JT)
+        self.factored[groups] = True
+        self.factorizations[groups] += 1
+
+    def branch(self, positions): # (B x k) sign of the cross product (pb - pa) x (p - pa) for every branch triple
+        p, pa, pb = (positions[self.branch_triples[..., i]] for i in range(3))
+        return np.sign((pb - pa)[..., 0] * (p - pa)[..., 1] - (pb - pa)[..., 1] * (p - pa)[..., 0])
+
+    def solve(self, positions, branch, max_iterations: int = 20, tolerance: float = 1e-12):
+        # newton in place on the group joints, the joints of earlier levels are already placed; branch: expected signs
+        # of self.branch -> (B,) largest rod length error and jacobian evaluations of every group
+        factorizations = self.factorizations.copy()
+        start_positions = positions[self.joints].copy()
+        residuals = self.residuals(positions)
+        errors = np.abs(residuals).max(axis=1)
+        active = np.flatnonzero(errors > tolerance)
+        fresh = np.zeros(self.B, dtype=bool)
+        for _ in range(max_iterations):
+            if len(active) == 0:
+                break
+            stale = active[~self.factored[active]]
+            if len(stale) > 0:
+                self.factorize(positions, stale)
+                fresh[stale] = True
+            previous = positions[self.joints[active]]
+            delta = (self.inverse[active] @ residuals[active][..., None]).reshape(len(active), self.k, 2)
+            # steps longer than a fraction of the shortest rod are shortened, a far newton step can land on the other branch
+            move = np.hypot(delta[..., 0], delta[..., 1]).max(axis=1)
+            delta *= np.minimum(1.0, self.max_move[active] / np.maximum(move, 1e-300))[:, None, None]
+            positions[self.joints[active]] = previous - delta
+            new_residuals = self.residuals(positions)[active]
+            new_errors = np.abs(new_residuals).max(axis=1)
+
+            # a kept inverse that does not contract (any more) is renewed for the next step, a step that made it worse is undone;
+            # a new inverse that does not help means a dead point: the caller falls back to least squares
+            worse = new_errors >= errors[active]
+            positions[self.joints[active[worse]]] = previous[worse]
+            self.factored[active[new_errors > CHORD_CONTRACTION * errors[active]]] = False
+            improved = active[~worse]
+            # good broyden update of the kept inverses with the step just taken, so they follow the jacobian without new evaluations
+            step = -delta[~worse].reshape(len(improved), 2 * self.k)
+            change = new_residuals[~worse] - residuals[improved]
+            H = self.inverse[improved]
+            H_change = (H @ change[..., None])[..., 0]
+            step_H = (step[:, None, :] @ H)[:, 0]
+            denominator = np.sum(step * H_change, axis=1)
+            usable = np.abs(denominator) > 1e-12 * np.sum(step * step, axis=1)
+            H[usable] += (step - H_change)[usable, :, None] * step_H[usable, None, :] / denominator[usable, None, None]
+            self.inverse[improved] = H
+            residuals[improved], errors[improved] = new_residuals[~worse], new_errors[~worse]
+            failed = worse & fresh[active]
+            fresh[active] = False
+            active = active[~failed & (errors[active] > tolerance)]
+
+        # groups that jumped to the other assembly branch go back to their start
+        jumped = np.any(self.branch(positions) * branch < 0, axis=1)
+        positions[self.joints[jumped]] = start_positions[jumped]
+        errors[jumped] = np.abs(self.residuals(positions)[jumped]).max(axis=1, initial=np.inf)
+        return errors, self.factorizations - factorizations
+
+    def sweep(self, positions, max_iterations: int = 20, tolerance: float = 1e-10):
+        # damped gauss-newton on all frames and all groups of the batch at once, positions (frames x joints x 2) in place
+        # (like newton_frames_dense, with the groups as a second batch dimension)
+        chunk_size = max(1, NEWTON_MEMORY // (8 * self.B * self.m * 2 * self.k * 3))
+        eye = np.eye(2 * self.k)
+        for chunk_start in range(0, len(positions), chunk_size):
+            chunk = positions[chunk_start:chunk_start + chunk_size]
+            active = np.arange(len(chunk))
+            for _ in range(max_iterations):
+                L = chunk[active][:, self.rod_start] - chunk[active][:, self.rod_end]
+                lengths = np.hypot(L[..., 0], L[..., 1])
+                residuals = lengths - self.ref_rod_lengths
+                # only the (frame, group) pairs that are not converged take a step, converged near singular poses stay put
+                frames, groups = np.nonzero(np.abs(residuals).max(axis=2) > tolerance)
+                if len(frames) == 0:
+                    break
+                units = np.divide(L, lengths[..., None], out=np.zeros_like(L), where=lengths[..., None] > 0)
+                J = np.zeros((len(active), self.B, self.m, self.k, 2))
+                for (b, rods, columns), sign in ((self.start_entries, 1.0), (self.end_entries, -1.0)):
+                    J[:, b, rods, columns] += sign * units[:, b, rods]
+                J = J[frames, groups].reshape(len(frames), self.m, 2 * self.k)
+                JT = J.transpose(0, 2, 1)
+                H = JT @ J
+                H += 1e-12 * eye * (1 + np.trace(H, axis1=1, axis2=2)[:, None, None])
+                delta = np.linalg.solve(H, JT @ residuals[frames, groups][..., None])[..., 0]
+                chunk[active[frames][:, None], self.joints[groups]] -= delta.reshape(len(frames), self.k, 2)
+                active = np.unique(active[frames])
+        return positions
+
+    def solve_least_squares(self, positions, group: int):
+        # damped fallback for one group where newton fails (dead points), in place -> jacobian evaluations
+        joints = self.joints[group]
+        def residual_function(x):
+            positions[joints] = x.reshape(self.k, 2)
+            return self.residuals(positions)[group]
+        def jacobian_function(x):
+            positions[joints] = x.reshape(self.k, 2)
+            return self.jacobian(positions, [group])[0]
+        result = least_squares(residual_function, positions[joints].ravel(), jac=jacobian_function)
+        positions[joints] = result.x.reshape(self.k, 2)
+        self.factored[group] = False
+        return result.njev
+
+    def mirror(self, positions, group: int):
+        # the other assembly branch of a dyad: its joint mirrored at the line through its two rod partners
+        j, a, b = self.branch_triples[group, 0]
+        line = positions[b] - positions[a]
+        relative = positions[j] - positions[a]
+        positions[j] = positions[a] + 2 * (relative @ line) / (line @ line) * line - relative
+
+    def is_singular(self, positions): # (B,) near dead point flags of the groups
+        singular_values = np.linalg.svd(self.jacobian(positions, np.arange(self.B)), compute_uv=False)
+        return singular_values[:, -1] * SINGULAR_CONDITION < singular_values[:, 0]
 
 class NumericSolver:
-    def __init__(self, mechanism: Mechanism):
+    def __init__(self, mechanism: Mechanism, free_joints: list[int] = None, continuation: bool = False,
+                 max_step: float = np.deg2rad(10), min_step: float = np.deg2rad(0.25), decompose: bool = True,
+                 kernels: bool = False):
         self.mechanism = mechanism
         # Store the reference rod lengths (assumed constant)
         joint_differences = self.mechanism.calculate_joint_differences()
         joint_difference_matrix = self.mechanism.calculate_joint_difference_matrix(joint_differences)
         self.ref_rod_lengths = self.mechanism.calculate_rod_lengths(joint_difference_matrix)
         
-        # filter free joints
-        self.moveable_joints = [
-            i for i, joint in enumerate(self.mechanism.joints)
-            if (not joint.pinned) and (joint.rotate_center is None)
-        ]
-    
+        # filter free joints (or use the given subset, all other joints are treated as fixed)
+        all_free = free_joints is None
+        if free_joints is None:
+            free_joints = [
+                i for i, joint in enumerate(self.mechanism.joints)
+                if (not joint.pinned) and (joint.rotate_center is None)
+            ]
+        self.moveable_joints = list(free_joints)
+
+        # split the connectivity matrix into the columns of the free coordinates and the columns of the
+        # fixed (pinned or rotating) coordinates: l^ = A_free * x_free + A_fixed * x_fixed
+        free_columns = np.array([2 * i + c for i in self.moveable_joints for c in (0, 1)], dtype=int)
+        fixed_columns = np.setdiff1d(np.arange(2 * self.mechanism.n), free_columns)
+        A = self.mechanism.A.tocsc()
+        self.free_columns = free_columns
+        self.fixed_columns = fixed_columns
+        # sparse products only pay off for large mechanisms, small ones are converted to dense arrays
+        self.use_sparse = len(free_columns) > SPARSE_THRESHOLD
+        self.A_free = A[:, free_columns].tocsr()
+        self.A_fixed = A[:, fixed_columns].tocsr()
+        if not self.use_sparse:
+            self.A_free = self.A_free.toarray()
+            self.A_fixed = self.A_fixed.toarray()
+        self.fixed_differences = np.zeros(2 * self.mechanism.m)
+
+        # start and end joint of every rod
+        self.rod_start = self.mechanism.rod_indices[:, 0]
+        self.rod_end = self.mechanism.rod_indices[:, 1]
+
+        # continuation along the crank angle: last two solutions (angle, free positions) and adaptive step
+        self.continuation = continuation
+        self.max_step = max_step
+        self.min_step = min_step
+        self.step = max_step
+        self.near_singular = False
+        self.evaluations = 0  # jacobian evaluations of the last solve
+        self.history = []
+        if len(self.mechanism.rotating_indices) > 0:
+            # the initial configuration is the solution at the initial crank angle
+            initial_angle = self.mechanism.joints[self.mechanism.rotating_indices[0]].initial_angle
+            self.history.append((initial_angle, self.get_free_joint_positions()))
+
+        # sparsity pattern of the block matrix U (m x 2m) that holds the unit vector of every rod,
+        # the jacobian of the residual is then J = U * A_free
+        self._unit_indices = np.arange(2 * self.mechanism.m)
+        self._unit_indptr = np.arange(0, 2 * self.mechanism.m + 1, 2)
+
+        # levenberg-marquardt kernels (compiled with numba if it is installed, numpy otherwise) instead of scipy's least_squares
+        # on the whole mechanism, for dense mechanisms only (the kernels solve dense systems)
+        if kernels and self.use_sparse:
+            raise ValueError(f"The solver kernels solve dense systems, this mechanism has {len(free_columns)} free coordinates "
+                             f"(sparse above {SPARSE_THRESHOLD}).")
+        self.kernels = kernels
+        self.kernel_free_joints = np.array(self.moveable_joints, dtype=np.int64)
+        self.kernel_columns = joint_columns(self.mechanism.n, self.moveable_joints)
+
+        # independent subassemblies: the Assur groups are solved level by level in dependency order, the groups of one level
+        # (and one size) together in one batch, so the cost of a solve grows with the largest group instead of the whole mechanism
+        self.groups, self.blocks = self.create_blocks() if decompose and all_free and not self.kernels else (None, None)
+
+    def create_blocks(self):
+        # -> (groups in solve order, batches of independent groups), or (None, None) if the mechanism is not determined
+        # or a monolithic solve is cheaper (a group too large for dense systems, too many levels one after the other)
+        structure = self.mechanism.analyze_structure()
+        groups = structure["groups"]
+        if structure["redundant"] or structure["underconstrained_joints"] or not groups \
+                or max(2 * len(group["joints"]) for group in groups) > SPARSE_THRESHOLD:
+            return None, None
+        level = []
+        for group in groups:
+            level.append(1 + max((level[d] for d in group["depends"]), default=-1))
+        if max(level) + 1 > BLOCK_LEVELS:
+            return None, None
+        blocks = []
+        for l in range(max(level) + 1):
+            sizes = sorted({len(group["joints"]) for group, group_level in zip(groups, level) if group_level == l})
+            for size in sizes:
+                batch = [group for group, group_level in zip(groups, level) if group_level == l and len(group["joints"]) == size]
+                blocks.append(SolverBlock(self.mechanism, batch, self.ref_rod_lengths))
+        return groups, blocks
+
+    def get_coordinate_vector(self):
+        # flat coordinate vector x = [x0, y0, x1, y1, ...] of all joints
+        return self.mechanism.positions.ravel()
+
+    def update_fixed_differences(self):
+        # the pinned and rotating joints do not change during one solve, so their part of l^ is constant
+        x = self.get_coordinate_vector()
+        self.fixed_differences = self.A_fixed @ x[self.fixed_columns]
+
+    def calculate_rod_vectors(self, free_joint_positions):
+        # L (m x 2) for the given free joint positions in one sparse matrix product
+        l_hat = self.A_free @ free_joint_positions + self.fixed_differences
+        return l_hat.reshape(self.mechanism.m, 2)
+
     def calculate_differences(self, free_joint_positions):
-        # update free joints with the current free_joint_positions 
-        for idx, joint_index in enumerate(self.moveable_joints):
-            self.mechanism.joints[joint_index].x = free_joint_positions [2 * idx]
-            self.mechanism.joints[joint_index].y = free_joint_positions [2 * idx + 1]
-        
-        differences = []
         # For each rod, enforce: current_length - ref_length = 0.
-        for i, rod in enumerate(self.mechanism.rods):
-            pos_start = np.array([rod.start.x, rod.start.y])
-            pos_end = np.array([rod.end.x, rod.end.y])
-            current_length = np.linalg.norm(pos_start - pos_end)
-            differences.append(current_length - self.ref_rod_lengths[i])
-        return differences
+        L = self.calculate_rod_vectors(free_joint_positions)
+        return np.linalg.norm(L, axis=1) - self.ref_rod_lengths
+
+    def calculate_jacobian(self, free_joint_positions):
+        # d|L_i|/dx = L_i / |L_i| * A_i, where A_i are the two rows of A that belong to rod i
+        L = self.calculate_rod_vectors(free_joint_positions)
+        lengths = np.linalg.norm(L, axis=1)
+        # guard against rods of length zero (direction is undefined there)
+        units = np.divide(L, lengths[:, None], out=np.zeros_like(L), where=lengths[:, None] > 0)
+        if not self.use_sparse:
+            return np.einsum("ij,ijk->ik", units, self.A_free.reshape(self.mechanism.m, 2, -1))
+        U = csr_matrix((units.ravel(), self._unit_indices, self._unit_indptr), shape=(self.mechanism.m, 2 * self.mechanism.m))
+        return U @ self.A_free
+
+    def get_free_joint_positions(self):
+        # flat vector [x, y, ...] of the free joints
+        return self.mechanism.positions[self.moveable_joints].ravel()
+
+    def set_free_joint_positions(self, solution):
+        # Update the mechanism with the obtained solution (rows x, y of the free joints).
+        positions = self.mechanism.positions
+        positions[self.moveable_joints] = np.reshape(solution, (-1, 2))
+        
+        # Return a dictionary mapping free joint index to its (x, y) coordinates.
+        free_coords = {
+            joint_index: (positions[joint_index, 0], positions[joint_index, 1])
+            for joint_index in self.moveable_joints
+        }
+        return free_coords
 
     def solve(self, angle: float):
+        if self.continuation and self.history:
+            return self.solve_continuation(angle)
         # Update rotating joints of the mechanism to the desired angle.
         self.mechanism.update_rotating_joint_position(angle)
+        return self.solve_free_joints()
+
+    def solve_free_joints(self):
+        # solve the free joints for the current positions of all other joints
+        self.update_fixed_differences()
 
         # Build an initial guess from the current free joints positions.
-        initial_guess = []
-        for i in self.moveable_joints:
-            joint = self.mechanism.joints[i]
-            initial_guess.extend([joint.x, joint.y])
+        initial_guess = self.get_free_joint_positions()
         
         # Use a least-squares optimizer to solve for free joints positions.
-        result = least_squares(self.calculate_differences , initial_guess)
+        solution, _, self.evaluations = self.correct(initial_guess)
+        return self.set_free_joint_positions(solution)
+
+    def correct(self, initial_guess):
+        # solve the free joints for the current fixed joints -> (solution, residuals, jacobian evaluations)
+        if self.blocks is not None:
+            return self.correct_blocks(initial_guess)
+        if self.kernels:
+            positions = self.mechanism.positions.copy()
+            positions[self.moveable_joints] = np.reshape(initial_guess, (-1, 2))
+            evaluations = levenberg_marquardt(positions, self.kernel_free_joints, self.kernel_columns, self.rod_start, self.rod_end,
+                                              self.ref_rod_lengths, 50, KERNEL_TOLERANCE)
+            solution = positions[self.moveable_joints].ravel()
+            residuals = self.calculate_differences(solution)
+            if np.max(np.abs(residuals), initial=0) <= CONTINUATION_TOLERANCE:
+                return solution, residuals, evaluations
+        if self.use_sparse:
+            solution, evaluations = gauss_newton_sparse(self.calculate_differences, self.calculate_jacobian, initial_guess)
+            residuals = self.calculate_differences(solution)
+            if np.max(np.abs(residuals), initial=0) <= CONTINUATION_TOLERANCE:
+                return solution, residuals, evaluations
+        result = least_squares(self.calculate_differences, initial_guess, jac=self.calculate_jacobian)
+        return result.x, result.fun, result.njev
+
+    def correct_blocks(self, initial_guess):
+        # batch by batch in dependency order, evaluations are those of the slowest group (like one monolithic solve)
+        positions = self.mechanism.positions
+        positions[self.moveable_joints] = np.reshape(initial_guess, (-1, 2))
+        # assembly branch of every group in the last solved pose (a predicted guess can overshoot a dead point),
+        # otherwise in the guess, where all free joints still lie consistently to each other
+        reference = positions
+        if self.continuation and self.history:
+            last_angle, last_solution = self.history[-1]
+            reference = positions.copy()
+            reference[self.moveable_joints] = np.reshape(last_solution, (-1, 2))
+            rotating, rotating_positions = self.mechanism.calculate_rotating_joint_positions(np.array([last_angle]))
+            reference[rotating] = rotating_positions[0]
+        branches = [block.branch(reference) for block in self.blocks]
+        evaluations = 0
+        for block, branch in zip(self.blocks, branches):
+            errors, block_evaluations = block.solve(positions, branch)
+            for group in np.flatnonzero(errors > CONTINUATION_TOLERANCE):
+                block_evaluations[group] += block.solve_least_squares(positions, group)
+                if block.k == 1 and np.any(block.branch(positions)[group] * branch[group] < 0):
+                    block.mirror(positions, group)
+            evaluations = max(evaluations, block_evaluations.max())
+        solution = self.get_free_joint_positions()
+        return solution, self.calculate_differences(solution), int(evaluations)
+
+    def predict(self, angle: float):
+        # predictor: follow the tangent through the last two solutions (or keep the last one)
+        last_angle, last_solution = self.history[-1]
+        if len(self.history) < 2:
+            return last_solution
+        previous_angle, previous_solution = self.history[-2]
+        tangent = (last_solution - previous_solution) / (last_angle - previous_angle)
+        return last_solution + tangent * (angle - last_angle)
+
+    def check_singularity(self, solution):
+        # near a dead point the smallest singular value of the jacobian goes to zero
+        # (with blocks: the jacobian is block triangular, so it is singular if one of the group jacobians is)
+        if self.blocks is not None:
+            positions = self.mechanism.positions.copy()
+            positions[self.moveable_joints] = np.reshape(solution, (-1, 2))
+            return any(block.is_singular(positions).any() for block in self.blocks)
+        if self.use_sparse:
+            return False
+        singular_values = np.linalg.svd(self.calculate_jacobian(solution), compute_uv=False)
+        return singular_values[-1] * SINGULAR_CONDITION < singular_values[0]
+
+    def solve_continuation(self, angle: float):
+        # march from the last solution to the target angle with predictor-corrector steps
+        current = self.history[-1][0]
+        # the crank position is periodic, so walk the shorter way around
+        target = current + (angle - current + np.pi) % (2 * np.pi) - np.pi
+        self.evaluations = 0
+        while abs(target - current) > 1e-12:
+            step = min(self.step, abs(target - current))
+            if self.near_singular:
+                step = min(step, self.min_step)
+            next_angle = current + np.sign(target - current) * step
+
+            self.mechanism.update_rotating_joint_position(next_angle)
+            self.update_fixed_differences()
+            solution, residuals, evaluations = self.correct(self.predict(next_angle))
+            self.evaluations += evaluations
+
+            # corrector failed: retry with a smaller step
+            if np.max(np.abs(residuals), initial=0) > CONTINUATION_TOLERANCE and step > self.min_step:
+                self.step = max(step / 2, self.min_step)
+                continue
+
+            # adapt the step to the number of corrector iterations
+            if evaluations <= 2:
+                self.step = min(step * 1.5, self.max_step)
+            elif evaluations > 4:
+                self.step = max(step / 2, self.min_step)
+            self.near_singular = self.check_singularity(solution)
+            self.history = [self.history[-1], (next_angle, solution)]
+            current = next_angle
+
+        # the requested angle itself is used for the rotating joints (not the unwrapped one)
+        self.mechanism.update_rotating_joint_position(angle)
+        return self.set_free_joint_positions(self.history[-1][1])
+
+    def sweep(self, angles):
+        # solve all angles at once -> (angles x joints x 2)
+        angles = np.asarray(angles, dtype=float)
+        positions = np.tile(self.mechanism.get_joint_coords_array(), (len(angles), 1, 1))
+        if len(angles) == 0:
+            return positions
+        rotating, rotating_positions = self.mechanism.calculate_rotating_joint_positions(angles)
+        positions[:, rotating] = rotating_positions
+
+        # coarse warm started solves as initial guess, then newton on the whole batch (group by group with blocks)
+        seed_sweep(self, angles, positions, self.moveable_joints)
+        if self.blocks is not None:
+            for block in self.blocks:
+                block.sweep(positions)
+        elif self.kernels and NUMBA_AVAILABLE:
+            # frame by frame in compiled code, without numba the batched numpy newton below is the faster one
+            levenberg_marquardt_sweep(positions, self.kernel_free_joints, self.kernel_columns, self.rod_start, self.rod_end,
+                                      self.ref_rod_lengths, 20, KERNEL_TOLERANCE)
+        else:
+            newton_sweep(positions, self.moveable_joints, self.rod_start, self.rod_end, self.ref_rod_lengths)
+        self.mechanism.set_joint_coords_array(positions[-1])
+        return positions
+
+class AnalyticSolver:
+    def __init__(self, mechanism: Mechanism):
+        self.mechanism = mechanism
+        self.numeric_solver = NumericSolver(mechanism)
+        self.ref_rod_lengths = self.numeric_solver.ref_rod_lengths
+        self.moveable_joints = self.numeric_solver.moveable_joints
+
+        # solve order of the dyads: (joint, parent a, parent b, length a, length b, branch), precomputed by compiled artifacts
+        self.solve_order = mechanism.solve_order if mechanism.solve_order is not None else self.calculate_solve_order()
+
+        # joints that can not be placed by a dyad are solved numerically after the dyads
+        placed = {step[0] for step in self.solve_order}
+        remaining = [i for i in self.moveable_joints if i not in placed]
+        self.fallback_solver = NumericSolver(mechanism, remaining) if remaining else None
+
+    def calculate_solve_order(self):
+        # neighbours of every joint as (neighbour index, rod index)
+        neighbours = {i: [] for i in range(self.mechanism.n)}
+        for r, (s_idx, e_idx) in enumerate(self.mechanism.rod_indices.tolist()):
+            neighbours[s_idx].append((e_idx, r))
+            neighbours[e_idx].append((s_idx, r))
+
+        known = set(range(self.mechanism.n)) - set(self.moveable_joints)
+        unknown = list(self.moveable_joints)
+        order = []
+        progress = True
+        while unknown and progress:
+            progress = False
+            for joint_index in unknown:
+                known_neighbours = [(n, r) for n, r in neighbours[joint_index] if n in known]
+                if len(known_neighbours) < 2:
+                    continue
+                step = self.create_dyad(joint_index, known_neighbours)
+                order.append(step)
+                known.add(joint_index)
+                unknown.remove(joint_index)
+                progress = True
+                break
+        return order
+
+    def create_dyad(self, joint_index, known_neighbours):
+        positions = self.mechanism.positions
+        p = positions[joint_index]
+        # use the pair of parents that spans the best conditioned triangle in the initial configuration
+        best = None
+        for u in range(len(known_neighbours)):
+            for v in range(u + 1, len(known_neighbours)):
+                a, rod_a = known_neighbours[u]
+                b, rod_b = known_neighbours[v]
+                pa, pb = positions[a], positions[b]
+                cross = (pb - pa)[0] * (p - pa)[1] - (pb - pa)[1] * (p - pa)[0]
+                base = np.linalg.norm(pb - pa)
+                height = abs(cross) / base if base > 0 else 0.0
+                if best is None or height > best[0]:
+                    best = (height, a, b, rod_a, rod_b, cross)
+        _, a, b, rod_a, rod_b, cross = best
+        # the side of the line a->b on which the joint lies defines the assembly branch
+        branch = 1.0 if cross >= 0 else -1.0
+        return (joint_index, a, b, self.ref_rod_lengths[rod_a], self.ref_rod_lengths[rod_b], branch)
+
+    def solve(self, angle: float):
+        # Update rotating joints of the mechanism to the desired angle.
+        self.mechanism.update_rotating_joint_position(angle)
+
+        # place every dyad joint at the intersection of the two circles around its parents
+        positions = self.mechanism.positions
+        for joint_index, a, b, r_a, r_b, branch in self.solve_order:
+            positions[joint_index], assembled = circle_intersection(positions[a], positions[b], r_a, r_b, branch)
+            check_assembly(joint_index, assembled, [angle])
+
+        if self.fallback_solver is not None:
+            self.fallback_solver.solve_free_joints()
 
-        # Update the mechanism with the obtained solution.
-        solution = result.x
-        for idx, joint_index in enumerate(self.moveable_joints):
-            self.mechanism.joints[joint_index].x = solution[2 * idx]
-            self.mechanism.joints[joint_index].y = solution[2 * idx + 1] # +1 to get the y coordinate
-        
         # Return a dictionary mapping free joint index to its (x, y) coordinates.
-        free_coords = {
-            joint_index: (self.mechanism.joints[joint_index].x, self.mechanism.joints[joint_index].y)
-            for joint_index in self.moveable_joints
-        }
-        return free_coords
+        return {joint_index: (positions[joint_index, 0], positions[joint_index, 1]) for joint_index in self.moveable_joints}
+
+    def sweep(self, angles):
+        # solve all angles at once -> (angles x joints x 2)
+        angles = np.asarray(angles, dtype=float)
+        positions = np.tile(self.mechanism.get_joint_coords_array(), (len(angles), 1, 1))
+        if len(angles) == 0:
+            return positions
+        rotating, rotating_positions = self.mechanism.calculate_rotating_joint_positions(angles)
+        positions[:, rotating] = rotating_positions
+
+        # every dyad step is one vectorized circle intersection over all angles
+        for joint_index, a, b, r_a, r_b, branch in self.solve_order:
+            positions[:, joint_index], assembled = circle_intersection(positions[:, a], positions[:, b], r_a, r_b, branch)
+            check_assembly(joint_index, assembled, angles)
+
+        if self.fallback_solver is not None:
+            free_joints = self.fallback_solver.moveable_joints
+            seed_sweep(self, angles, positions, free_joints)
+            newton_sweep(positions, free_joints, self.numeric_solver.rod_start, self.numeric_solver.rod_end, self.ref_rod_lengths)
+        self.mechanism.set_joint_coords_array(positions[-1])
+        return positions
+
+def create_solver(mechanism: Mechanism, solver_name: str = "analytic"):
+    # "analytic": dyads by circle intersection, "numeric": least squares with continuation along the crank angle
+    if solver_name == "analytic":
+        return AnalyticSolver(mechanism)
+    if solver_name == "numeric":
+        return NumericSolver(mechanism, continuation=True)
+    raise ValueError(f"Unknown solver: {solver_name}")
+
+def iter_sweep(solver, angles, chunk_frames: int = SWEEP_CHUNK_FRAMES):
+    # solve a long sweep piece by piece -> yields (chunk angles x joints x 2) arrays, so the whole sweep never has to be in memory;
+    # every sweep continues from the last pose of the one before, so the chunks stay on one assembly branch
+    angles = np.asarray(angles, dtype=float)
+    for start in range(0, len(angles), chunk_frames):
+        yield solver.sweep(angles[start:start + chunk_frames])
+
+def iter_poses(solver, angles, chunk_frames: int = SWEEP_CHUNK_FRAMES):
+    # the sweep as a generator over (angle, coords (joints x 2)) in angle order, solved chunk by chunk
+    angles = np.asarray(angles, dtype=float)
+    for start, coords in zip(range(0, len(angles), chunk_frames), iter_sweep(solver, angles, chunk_frames)):
+        yield from zip(angles[start:start + len(coords)], coords)
+
+def iter_progressive(solver, angles, coarse_step: float = COARSE_STEP, chunk_frames: int = SWEEP_CHUNK_FRAMES):
+    # coarse pass first (the frames closest to every coarse_step of the swept angle, a preview of the whole cycle), then all
+    # other frames in angle order -> yields (frame index, angle, coords (joints x 2)), every frame exactly once
+    angles = np.asarray(angles, dtype=float)
+    if len(angles) == 0:
+        return
+    coarse = spaced_frames(angles, coarse_step)
+    coarse_coords = solver.sweep(angles[coarse])
+    for frame, coords in zip(coarse, coarse_coords):
+        yield frame, angles[frame], coords
+    # the refinement continues from the first pose again, so the continuation of the numeric solver stays on its branch
+    restart_solver(solver, angles[0], coarse_coords[0])
+    is_coarse = np.zeros(len(angles), dtype=bool)
+    is_coarse[coarse] = True
+    for frame, (angle, coords) in enumerate(iter_poses(solver, angles, chunk_frames)):
+        if not is_coarse[frame]:
+            yield frame, angle, coords
+
+def restart_solver(solver, angle: float, coords):
+    # continue the next solves from a known pose (the continuation of the numeric solver starts there as well)
+    solver.mechanism.set_joint_coords_array(coords)
+    if getattr(solver, "continuation", False):
+        solver.history = [(angle, solver.get_free_joint_positions())]
+        solver.step = solver.max_step
+
+def spaced_frames(angles, step: float):
+    # indices of the frames at every step of the swept angle (along the path, so any direction works), the last frame included
+    path = np.concatenate([[0.0], np.cumsum(np.abs(np.diff(angles)))])
+    return np.unique(np.append(np.searchsorted(path, np.arange(0, path[-1], step)), len(angles) - 1))
+
+def circle_intersection(pa, pb, r_a, r_b, branch, tolerance: float = ASSEMBLY_TOLERANCE):
+    # intersection of the circles (pa, r_a) and (pb, r_b) on the side of pa->pb given by branch,
+    # pa and pb are (..., 2) arrays so a whole sweep can be placed at once -> (positions (..., 2), assembled (...,)),
+    # where the circles do not intersect (mechanism can not be assembled) assembled is False and the position is only the
+    # point of the toggle position closest to both circles
+    d_vec = np.asarray(pb, dtype=float) - np.asarray(pa, dtype=float)
+    d = np.hypot(d_vec[..., 0], d_vec[..., 1])
+    if np.any(d == 0):
+        raise ValueError("Dyad parents coincide, joint position is undefined.")
+    gap = tolerance * (r_a + r_b)
+    assembled = (d <= r_a + r_b + gap) & (d >= np.abs(r_a - r_b) - gap)
+    along = (r_a ** 2 - r_b ** 2 + d ** 2) / (2 * d)
+    height = np.sqrt(np.maximum(r_a ** 2 - along ** 2, 0.0))
+    e = d_vec / d[..., None]
+    normal = e[..., ::-1] * (-1.0, 1.0)
+    return pa + along[..., None] * e + (branch * height)[..., None] * normal, assembled
+
+def check_assembly(joint_index: int, assembled, angles):
+    # raise for the first angle (radians) at which the dyad of the joint can not be assembled, a numeric solve can not
+    # close the rods there either
+    failed = np.flatnonzero(~np.asarray(assembled))
+    if len(failed) > 0:
+        raise ValueError(f"Mechanism can not be assembled: the rods of joint {joint_index} do not reach each other at "
+                         f"{np.rad2deg(angles[failed[0]]):.2f}° ({len(failed)} of {len(angles)} angles).")
+
+def seed_sweep(solver, angles, positions, free_joints, seed_step=SEED_STEP):
+    # solve a coarse subset of the angles one by one (warm started) and interpolate the free joints in between
+    path = np.concatenate([[0.0], np.cumsum(np.abs(np.diff(angles)))])
+    seeds = spaced_frames(angles, seed_step)
+    seed_positions = []
+    for i in seeds:
+        solver.solve(angles[i])
+        seed_positions.append(solver.mechanism.get_joint_coords_array()[free_joints])
+    seed_positions = np.array(seed_positions)
+    if len(seeds) == 1:
+        positions[:, free_joints] = seed_positions[0]
+        return positions
+
+    # linear interpolation along the swept angle between neighbouring seeds
+    seed_path = path[seeds]
+    segment = np.clip(np.searchsorted(seed_path, path, side="right") - 1, 0, len(seeds) - 2)
+    width = seed_path[segment + 1] - seed_path[segment]
+    weight = np.divide(path - seed_path[segment], width, out=np.zeros_like(path), where=width > 0)
+    delta = seed_positions[segment + 1] - seed_positions[segment]
+    positions[:, free_joints] = seed_positions[segment] + weight[:, None, None] * delta
+    return positions
+
+def newton_sweep(positions, free_joints, rod_start, rod_end, ref_rod_lengths, max_iterations=20, tolerance=1e-10):
+    # damped gauss-newton on all frames of a sweep at once, positions (frames x joints x 2) is updated in place
+    free_joints = np.asarray(free_joints, dtype=int)
+    k, m = len(free_joints), len(rod_start)
+    if k == 0 or len(positions) == 0:
+        return positions
+
+    # column of every joint in the free coordinate vector (-1 for fixed joints)
+    column = np.full(positions.shape[1], -1)
+    column[free_joints] = np.arange(k)
+    start_column, end_column = column[rod_start], column[rod_end]
+    start_rods, end_rods = np.flatnonzero(start_column >= 0), np.flatnonzero(end_column >= 0)
+    pattern = (start_rods, start_column[start_rods], end_rods, end_column[end_rods])
+
+    if 2 * k > SPARSE_THRESHOLD:
+        # large mechanisms: one sparse system per frame keeps memory and time linear in the rod count
+        for frame in range(len(positions)):
+            newton_frame_sparse(positions[frame], free_joints, rod_start, rod_end, ref_rod_lengths, pattern, max_iterations, tolerance)
+        return positions
+
+    # small mechanisms: dense batched systems, split into chunks of frames to bound the jacobian memory
+    chunk_size = max(1, NEWTON_MEMORY // (8 * m * 2 * k * 3))
+    for chunk_start in range(0, len(positions), chunk_size):
+        chunk = positions[chunk_start:chunk_start + chunk_size]
+        newton_frames_dense(chunk, free_joints, rod_start, rod_end, ref_rod_lengths, pattern, max_iterations, tolerance)
+    return positions
+
+def newton_frames_dense(positions, free_joints, rod_start, rod_end, ref_rod_lengths, pattern, max_iterations, tolerance):
+    k, m = len(free_joints), len(rod_start)
+    start_rods, start_columns, end_rods, end_columns = pattern
+    active = np.arange(len(positions))
+    for _ in range(max_iterations):
+        L = positions[active][:, rod_start] - positions[active][:, rod_end]
+        lengths = np.linalg.norm(L, axis=2)
+        residuals = lengths - ref_rod_lengths
+        not_converged = np.max(np.abs(residuals), axis=1) > tolerance
+        active, L, lengths, residuals = active[not_converged], L[not_converged], lengths[not_converged], residuals[not_converged]
+        if len(active) == 0:
+            break
+
+        # jacobian (frames x m x 2k) built from the unit vectors of the rods
+        units = np.divide(L, lengths[..., None], out=np.zeros_like(L), where=lengths[..., None] > 0)
+        J = np.zeros((len(active), m, k, 2))
+        J[:, start_rods, start_columns] += units[:, start_rods]
+        J[:, end_rods, end_columns] -= units[:, end_rods]
+        J = J.reshape(len(active), m, 2 * k)
+
+        # normal equations with a small levenberg damping for singular poses
+        JT = J.transpose(0, 2, 1)
+        H = JT @ J
+        H += 1e-12 * np.eye(2 * k) * (1 + np.trace(H, axis1=1, axis2=2)[:, None, None])
+        delta = np.linalg.solve(H, JT @ residuals[..., None])[..., 0]
+        positions[active[:, None], free_joints[None, :]] -= delta.reshape(-1, k, 2)
+    return positions
+
+def newton_frame_sparse(position, free_joints, rod_start, rod_end, ref_rod_lengths, pattern, max_iterations, tolerance):
+    k, m = len(free_joints), len(rod_start)
+    start_rods, start_columns, end_rods, end_columns = pattern
+    # sparsity pattern of the jacobian (m x 2k), only the values change between iterations
+    rows = np.concatenate([start_rods, start_rods, end_rods, end_rods])
+    columns = np.concatenate([2 * start_columns, 2 * start_columns + 1, 2 * end_columns, 2 * end_columns + 1])
+
+    def rod_vectors(free_joint_positions):
+        position[free_joints] = free_joint_positions.reshape(k, 2)
+        return position[rod_start] - position[rod_end]
+
+    def residual_function(free_joint_positions):
+        return np.linalg.norm(rod_vectors(free_joint_positions), axis=1) - ref_rod_lengths
+
+    def jacobian_function(free_joint_positions):
+        L = rod_vectors(free_joint_positions)
+        lengths = np.linalg.norm(L, axis=1)
+        units = np.divide(L, lengths[:, None], out=np.zeros_like(L), where=lengths[:, None] > 0)
+        data = np.concatenate([units[start_rods, 0], units[start_rods, 1], -units[end_rods, 0], -units[end_rods, 1]])
+        return csr_matrix((data, (rows, columns)), shape=(m, 2 * k))
+
+    solution, _ = gauss_newton_sparse(residual_function, jacobian_function, position[free_joints].ravel(), max_iterations, tolerance)
+    position[free_joints] = solution.reshape(k, 2)
+    return position
+
+def gauss_newton_sparse(residual_function, jacobian_function, initial_guess, max_iterations=50, tolerance=1e-10):
+    # gauss-newton with a sparse direct solve of the normal equations and backtracking on the step length,
+    # the iterative lsmr solver of least_squares converges far too slowly on large linkages
+    x = np.array(initial_guess, dtype=float)
+    residuals = residual_function(x)
+    cost = residuals @ residuals
+    damping = identity(len(x), format="csc") * 1e-12
+    evaluations = 0
+    for _ in range(max_iterations):
+        if np.max(np.abs(residuals), initial=0) <= tolerance:
+            break
+        J = csr_matrix(jacobian_function(x))
+        evaluations += 1
+        delta = spsolve((J.T @ J + damping).tocsc(), J.T @ residuals)
+        step = 1.0
+        while True:
+            candidate = x - step * delta
+            candidate_residuals = residual_function(candidate)
+            candidate_cost = candidate_residuals @ candidate_residuals
+            if candidate_cost < cost or step < 1e-4:
+                break
+            step /= 2
+        x, residuals, cost = candidate, candidate_residuals, candidate_cost
+    return x, evaluations
 
 if __name__ == "__main__":
     from icecream import ic
@@ -101,9 +817,13 @@ if __name__ == "__main__":
     ]
     mechanism = Mechanism(joints, rods)
 
-    #!! Confiuration check is not working for this case, but should...
-    #configuration_check = mechanism.config_check()
-    #ic(configuration_check)
+    # the rod from the crank to the pinned joint locks the crank and the chain 1-2-3 is one rod short,
+    # the numeric solver still finds a least squares pose
+    try:
+        mechanism.config_check()
+        raise AssertionError("Test 2 failed!")
+    except ValueError as e:
+        ic(e)
 
     solver = NumericSolver(mechanism)
     
@@ -113,4 +833,129 @@ if __name__ == "__main__":
 
     test2_angle = test1_angle + np.deg2rad(10)
     coords = solver.solve(test2_angle)
-    ic(test2_angle, coords)
\ No newline at end of file
+    ic(test2_angle, coords)
+
+    print("\n--- Test 3: Analytic Solver vs Numeric Solver (Strandbeest-Bein) ---")
+    from json2config import load_mechanism_from_config
+    config_file = "configurations/Strandbeest-Bein_configuration.json"
+    numeric_mechanism = load_mechanism_from_config(config_file)
+    analytic_mechanism = load_mechanism_from_config(config_file)
+    numeric_solver = NumericSolver(numeric_mechanism)
+    analytic_solver = AnalyticSolver(analytic_mechanism)
+    ic(len(analytic_solver.solve_order), analytic_solver.fallback_solver)
+
+    max_error = 0
+    for angle in np.deg2rad(np.arange(0, 361, 5)):
+        numeric_coords = numeric_solver.solve(angle)
+        analytic_coords = analytic_solver.solve(angle)
+        for joint_index, (x, y) in numeric_coords.items():
+            max_error = max(max_error, np.hypot(x - analytic_coords[joint_index][0], y - analytic_coords[joint_index][1]))
+    ic(max_error)
+    assert max_error < 1e-6, "Test 3 failed!"
+
+    print("\n--- Test 4: Sweep vs single solves (Strandbeest-Bein) ---")
+    angles = np.deg2rad(np.linspace(0, 360, 721))
+    for solver_class in (NumericSolver, AnalyticSolver):
+        sweep_solver = solver_class(load_mechanism_from_config(config_file))
+        swept = sweep_solver.sweep(angles)
+        single_solver = solver_class(load_mechanism_from_config(config_file))
+        single = []
+        for angle in angles:
+            single_solver.solve(angle)
+            single.append(single_solver.mechanism.get_joint_coords_array())
+        max_error = np.max(np.abs(swept - np.array(single)))
+        ic(solver_class.__name__, swept.shape, max_error)
+        assert max_error < 1e-6, "Test 4 failed!"
+
+    print("\n--- Test 5: Continuation (Strandbeest-Bein) ---")
+    angles = np.deg2rad(np.arange(0, 361, 1))
+    reference = AnalyticSolver(load_mechanism_from_config(config_file)).sweep(angles)
+    for continuation in (False, True):
+        continuation_solver = NumericSolver(load_mechanism_from_config(config_file), continuation=continuation)
+        evaluations, max_error = 0, 0
+        for i, angle in enumerate(angles):
+            continuation_solver.solve(angle)
+            evaluations += continuation_solver.evaluations
+            max_error = max(max_error, np.max(np.abs(continuation_solver.mechanism.get_joint_coords_array() - reference[i])))
+        ic(continuation, evaluations / len(angles), max_error)
+        assert max_error < 1e-6, "Test 5 failed!"
+
+    # a large jump to an arbitrary angle has to stay on the assembly branch
+    jump_solver = NumericSolver(load_mechanism_from_config(config_file), continuation=True)
+    jump_solver.solve(np.deg2rad(250))
+    max_error = np.max(np.abs(jump_solver.mechanism.get_joint_coords_array() - reference[250]))
+    ic(max_error)
+    assert max_error < 1e-6, "Test 5 failed!"
+
+    print("\n--- Test 6: Block decomposition (Strandbeest-Bein-Doppel) ---")
+    import time
+    config_file = "configurations/Strandbeest-Bein-Doppel_configuration.json"
+    reference = AnalyticSolver(load_mechanism_from_config(config_file)).sweep(angles)
+    block_solver = NumericSolver(load_mechanism_from_config(config_file))
+    ic([block.joints.tolist() for block in block_solver.blocks])
+    assert len(block_solver.groups) == 10 and len(block_solver.blocks) == 4, "Test 6 failed!"
+    for decompose in (False, True):
+        solver = NumericSolver(load_mechanism_from_config(config_file), continuation=True, decompose=decompose)
+        start_time = time.perf_counter()
+        evaluations, max_error = 0, 0
+        for i, angle in enumerate(angles):
+            solver.solve(angle)
+            evaluations += solver.evaluations
+            max_error = max(max_error, np.max(np.abs(solver.mechanism.get_joint_coords_array() - reference[i])))
+        time_taken = time.perf_counter() - start_time
+        sweep_error = np.max(np.abs(NumericSolver(load_mechanism_from_config(config_file), decompose=decompose).sweep(angles) - reference))
+        ic(decompose, time_taken, evaluations / len(angles), max_error, sweep_error)
+        assert max_error < 1e-6 and sweep_error < 1e-6, "Test 6 failed!"
+
+    print("\n--- Test 7: Triad (one group of three joints) and a dyad on top of it ---")
+    def triad_mechanism():
+        g1, g2, c = Mechanism.Joint(0, 0, True), Mechanism.Joint(30, 0, True), Mechanism.Joint(15, -5, rotates_around=(15, -10))
+        a, b, d, e = Mechanism.Joint(5, 12), Mechanism.Joint(25, 14), Mechanism.Joint(16, 20), Mechanism.Joint(-8, 18)
+        rods = [Mechanism.Rod(a, b), Mechanism.Rod(b, d), Mechanism.Rod(d, a), Mechanism.Rod(a, g1), Mechanism.Rod(b, g2),
+                Mechanism.Rod(d, c), Mechanism.Rod(e, a), Mechanism.Rod(e, g1)]
+        return Mechanism([g1, g2, c, a, b, d, e], rods)
+    triad_angles = np.deg2rad(np.arange(90, 431, 2))
+    monolithic = NumericSolver(triad_mechanism(), continuation=True, decompose=False)
+    block_solver = NumericSolver(triad_mechanism(), continuation=True)
+    max_error = 0
+    for angle in triad_angles:
+        monolithic.solve(angle)
+        block_solver.solve(angle)
+        max_error = max(max_error, np.max(np.abs(monolithic.mechanism.positions - block_solver.mechanism.positions)))
+    factorizations = [block.factorizations.tolist() for block in block_solver.blocks]
+    ic([block.joints.tolist() for block in block_solver.blocks], factorizations, max_error)
+    assert max_error < 1e-6 and np.max(np.concatenate(factorizations)) < len(triad_angles), "Test 7 failed!"
+
+    print("\n--- Test 8: Progressive sweep (coarse pass first, then the other frames) ---")
+    angles = np.deg2rad(np.arange(0, 360.5, 0.5))
+    for solver in (AnalyticSolver(load_mechanism_from_config(config_file)),
+                   NumericSolver(load_mechanism_from_config(config_file), continuation=True)):
+        reference = type(solver)(load_mechanism_from_config(config_file)).sweep(angles)
+        frames, coords = [], np.empty_like(reference)
+        for frame, angle, pose in iter_progressive(solver, angles):
+            assert angle == angles[frame], "Angle does not belong to the frame!"
+            frames.append(frame)
+            coords[frame] = pose
+        coarse = spaced_frames(angles, COARSE_STEP)
+        max_error = np.max(np.abs(coords - reference))
+        ic(type(solver).__name__, len(coarse), max_error)
+        assert frames[:len(coarse)] == coarse.tolist() and sorted(frames) == list(range(len(angles))), "Test 8 failed!"
+        assert max_error < 1e-6, "Test 8 failed!"
+    poses = list(iter_poses(AnalyticSolver(load_mechanism_from_config(config_file)), angles, chunk_frames=100))
+    assert np.allclose([pose for _, pose in poses], reference, atol=1e-6) and poses[-1][0] == angles[-1], "Test 8 failed!"
+
+    print("\n--- Test 9: Mechanism that can not be assembled over the whole revolution ---")
+    import json
+    from json2config import load_mechanism_from_dict
+    with open("configurations/Viergelenkkette_configuration.json", "r") as f:
+        config = json.load(f)
+    config["joints"][1].update(x=3, y=4) # the rocker joint: the rods no longer reach each other for most crank angles
+    for run in (lambda solver: solver.sweep(np.deg2rad(np.arange(0, 361, 5.0))), lambda solver: solver.solve(np.pi)):
+        try:
+            run(AnalyticSolver(load_mechanism_from_dict(config)))
+            raise AssertionError("Test 9 failed!")
+        except ValueError as e:
+            ic(e)
+            assert "joint 1" in str(e), "Test 9 failed!"
+    # at the initial angle the rods still reach each other
+    AnalyticSolver(load_mechanism_from_dict(config)).sweep([np.arctan2(10, 5)])
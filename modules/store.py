@@ -0,0 +1,206 @@
+import os
+import json
+import numpy as np
+from solver import iter_sweep
+
+# on-disk trajectory store for sweeps that do not fit into memory: a folder with chunked .npy files and a small JSON index
+#   index.json          shape, chunk size, chunk files, coordinate bounds and free metadata
+#   angles.npy          crank angles of all frames (degrees)
+#   chunk_00000.npy     coords of frames [0, chunk_frames), ...
+# chunks are written through memory maps and read back as read-only memory maps, so a slice inside one chunk is a zero-copy
+# view and only the chunks in use are mapped; the peak memory does not grow with the sweep length
+
+# bytes per chunk file
+STORE_CHUNK_BYTES = 4 * 1024 ** 2
+INDEX_FILE = "index.json"
+ANGLES_FILE = "angles.npy"
+
+def chunk_frames_for(num_joints, chunk_bytes=STORE_CHUNK_BYTES):
+    return max(1, chunk_bytes // (num_joints * 2 * 8))
+
+class TrajectoryStore:
+    def __init__(self, directory: str, index: dict):
+        # use TrajectoryStore.create or TrajectoryStore.open
+        self.directory = directory
+        self.index = index
+        self.shape = tuple(index["shape"])
+        self.chunk_frames = index["chunk_frames"]
+        self.frames_written = index["frames_written"]
+        self.angles = np.load(os.path.join(directory, ANGLES_FILE), mmap_mode="r")
+        self.current = None # chunk memory map that is being written
+        self.mapped = (None, None) # (chunk, read-only memory map) of the chunk read last, frame by frame access reuses it
+        self.bounds_min = np.full(2, np.inf) if index["bounds"] is None else np.array(index["bounds"][0])
+        self.bounds_max = np.full(2, -np.inf) if index["bounds"] is None else np.array(index["bounds"][1])
+
+    @classmethod
+    def create(cls, directory: str, angles, num_joints: int, chunk_frames: int = None, metadata: dict = None):
+        # empty store for a sweep over the given angles (degrees), filled with write() in frame order
+        os.makedirs(directory, exist_ok=True)
+        angles = np.asarray(angles, dtype=float)
+        np.save(os.path.join(directory, ANGLES_FILE), angles)
+        chunk_frames = chunk_frames or chunk_frames_for(num_joints)
+        num_chunks = -(-len(angles) // chunk_frames)
+        index = {
+            "shape": [len(angles), num_joints, 2],
+            "chunk_frames": chunk_frames,
+            "chunks": [f"chunk_{i:05d}.npy" for i in range(num_chunks)],
+            "frames_written": 0,
+            "bounds": None,
+            "metadata": metadata or {},
+        }
+        store = cls(directory, index)
+        store.save_index()
+        return store
+
+    @classmethod
+    def open(cls, directory: str):
+        with open(os.path.join(directory, INDEX_FILE), "r") as file:
+            return cls(directory, json.load(file))
+
+    def save_index(self):
+        self.index["frames_written"] = self.frames_written
+        if self.frames_written > 0:
+            self.index["bounds"] = [self.bounds_min.tolist(), self.bounds_max.tolist()]
+        with open(os.path.join(self.directory, INDEX_FILE), "w") as file:
+            json.dump(self.index, file, indent=4)
+
+    @property
+    def complete(self):
+        return self.frames_written == self.shape[0]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.directory, self.index["chunks"][chunk])
+
+    def chunk_length(self, chunk):
+        return min(self.chunk_frames, self.shape[0] - chunk * self.chunk_frames)
+
+    def write(self, coords):
+        # append coords (frames x joints x 2) behind the frames written so far, the chunks can have any size
+        coords = np.asarray(coords, dtype=np.float64)
+        if coords.shape[1:] != self.shape[1:] or self.frames_written + len(coords) > self.shape[0]:
+            raise ValueError(f"Chunk of shape {coords.shape} does not fit the store of shape {self.shape} at frame {self.frames_written}.")
+        if len(coords) > 0:
+            self.bounds_min = np.minimum(self.bounds_min, coords.min(axis=(0, 1)))
+            self.bounds_max = np.maximum(self.bounds_max, coords.max(axis=(0, 1)))
+        position = 0
+        while position < len(coords):
+            chunk, offset = divmod(self.frames_written, self.chunk_frames)
+            if self.current is None:
+                self.current = np.lib.format.open_memmap(self.chunk_path(chunk), mode="w+", dtype=np.float64,
+                                                         shape=(self.chunk_length(chunk), *self.shape[1:]))
+            count = min(len(coords) - position, len(self.current) - offset)
+            self.current[offset:offset + count] = coords[position:position + count]
+            position += count
+            self.frames_written += count
+            if offset + count == len(self.current):
+                # full chunk: flush it and drop the mapping, so its pages can leave memory
+                self.current.flush()
+                self.current = None
+                self.save_index()
+
+    def close(self):
+        if self.current is not None:
+            self.current.flush()
+            self.current = None
+        self.save_index()
+
+    def chunk(self, chunk): # read-only memory map of one chunk (chunk length x joints x 2)
+        if (chunk + 1) * self.chunk_frames > self.frames_written and not self.complete:
+            raise IndexError(f"Chunk {chunk} of {self.directory} is not written yet.")
+        if self.mapped[0] != chunk:
+            self.mapped = (chunk, np.load(self.chunk_path(chunk), mmap_mode="r"))
+        return self.mapped[1]
+
+    def frames(self, start: int, stop: int):
+        # frames [start, stop) -> zero-copy view if they lie in one chunk, otherwise a copy of the requested frames only
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        first, last = start // self.chunk_frames, max(stop - 1, start) // self.chunk_frames
+        if first == last:
+            offset = first * self.chunk_frames
+            return self.chunk(first)[start - offset:stop - offset]
+        return np.concatenate([coords for _, coords in self.iter_chunks(start, stop)])
+
+    def iter_chunks(self, start: int = 0, stop: int = None):
+        # yields (first frame, zero-copy view) for every chunk overlapping [start, stop), one chunk is mapped at a time
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        for chunk in range(start // self.chunk_frames, -(-stop // self.chunk_frames)):
+            offset = chunk * self.chunk_frames
+            first, end = max(start, offset), min(stop, offset + self.chunk_length(chunk))
+            yield first, self.chunk(chunk)[first - offset:end - offset]
+
+    def __getitem__(self, key):
+        # store[i] -> (joints x 2), store[a:b] -> (frames x joints x 2), like the in-memory trajectory arrays
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            frames = self.frames(start, stop)
+            return frames[::step] if step != 1 else frames
+        key = int(key)
+        if key < 0:
+            key += self.shape[0]
+        if not 0 <= key < self.shape[0]:
+            raise IndexError(f"Frame {key} is out of range for {self.shape[0]} frames.")
+        return self.frames(key, key + 1)[0]
+
+    def bounds(self): # ((x_min, y_min), (x_max, y_max)) of all written frames, kept up to date by write()
+        return tuple(self.bounds_min), tuple(self.bounds_max)
+
+    def joint_path(self, joint: int): # (frames x 2) path of one joint, read chunk by chunk
+        return np.concatenate([coords[:, joint] for _, coords in self.iter_chunks()])
+
+def sweep_to_store(solver, angles, directory: str, chunk_frames: int = None, metadata: dict = None):
+    # solve a sweep (angles in degrees) straight into a new store, only one solver chunk is in memory at a time
+    angles = np.asarray(angles, dtype=float)
+    store = TrajectoryStore.create(directory, angles, solver.mechanism.n, chunk_frames, metadata)
+    try:
+        for coords in iter_sweep(solver, np.deg2rad(angles), store.chunk_frames):
+            store.write(coords)
+    finally:
+        store.close()
+    return store
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/store.py
+    import time
+    import shutil
+    import resource
+    import tempfile
+    from json2config import load_mechanism_from_config
+    from solver import AnalyticSolver
+    from render import get_axis_limits
+    from export import export_trajectory, temp_export_path, load_trajectory
+    config_file = "configurations/Strandbeest-Bein-Doppel_configuration.json"
+    directory = tempfile.mkdtemp(prefix="trajectory_store_")
+
+    # one revolution: store content and the in-memory sweep agree
+    angles = np.linspace(0, 360, 3601)
+    coords = AnalyticSolver(load_mechanism_from_config(config_file)).sweep(np.deg2rad(angles))
+    store = sweep_to_store(AnalyticSolver(load_mechanism_from_config(config_file)), angles, os.path.join(directory, "one"), chunk_frames=1000)
+    store = TrajectoryStore.open(store.directory)
+    assert store.complete and len(store) == len(coords), "Store is incomplete!"
+    assert np.allclose(store[0:len(store)], coords) and np.allclose(store[2500], coords[2500]), "Store content differs!"
+    assert isinstance(store[1000:1500], np.memmap), "Slice inside one chunk is not zero-copy!"
+    assert np.allclose(store[950:1050:10], coords[950:1050:10]), "Slice over two chunks differs!"
+    assert get_axis_limits(store) == get_axis_limits(coords), "Axis limits differ!"
+    assert np.allclose(store.joint_path(5), coords[:, 5]), "Joint path differs!"
+    path = export_trajectory(store, store.angles, temp_export_path("npy"))
+    assert np.allclose(load_trajectory(path)[0], coords), "Export from the store differs!"
+    os.remove(path)
+
+    # 10 and then 100 revolutions at 0.1°: the peak memory is set by the chunk size, not by the sweep length
+    # (only the angle array grows with it)
+    peaks = []
+    for revolutions in (10, 100):
+        start_time = time.perf_counter()
+        long_angles = np.linspace(0, 360 * revolutions, 3600 * revolutions + 1)
+        store = sweep_to_store(AnalyticSolver(load_mechanism_from_config(config_file)), long_angles, os.path.join(directory, f"long_{revolutions}"))
+        x_lim, y_lim = get_axis_limits(store)
+        peaks.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024) # kilobytes on linux
+        print(f"{len(store)} frames ({len(store) * store.shape[1] * 16 / 1024 ** 2:.0f} MB) in {time.perf_counter() - start_time:.2f} s, "
+              f"peak memory {peaks[-1] / 1024 ** 2:.0f} MB")
+    assert peaks[1] - peaks[0] < len(store) * store.shape[1] * 16 / 4, "Peak memory grows with the sweep length!"
+    assert np.allclose(store[len(store) - 1], coords[-1]), "Long sweep does not return to the start pose!"
+    shutil.rmtree(directory)
+    print("All tests passed!")
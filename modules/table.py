@@ -0,0 +1,116 @@
+import threading
+import numpy as np
+from scipy.interpolate import CubicSpline
+from mechanism import Mechanism
+from solver import create_solver, restart_solver
+
+# angle step of the dense sweep a table is built from
+TABLE_RESOLUTION = np.deg2rad(0.5)
+# largest rod length error of an interpolated pose, poses above it are solved exactly
+TABLE_TOLERANCE = 1e-6
+
+class TrajectoryTable:
+    # one crank revolution solved once and stored as piecewise cubic polynomials on a uniform angle grid,
+    # pose(angle) is an O(1) lookup: grid cell by division, then one cubic per coordinate
+    def __init__(self, mechanism: Mechanism, solver_name: str = "analytic", resolution: float = TABLE_RESOLUTION,
+                 tolerance: float = TABLE_TOLERANCE):
+        self.mechanism = mechanism
+        self.solver = create_solver(mechanism, solver_name)
+        self.tolerance = tolerance
+        self.num_cells = max(int(round(2 * np.pi / resolution)), 4)
+        self.step = 2 * np.pi / self.num_cells
+        self.lock = threading.Lock() # exact solves move the shared mechanism
+        self.resolves = 0
+
+        # dense sweep over one revolution, the crank angle is absolute, so the table starts at angle 0
+        angles = np.arange(self.num_cells + 1) * self.step
+        coords = self.solver.sweep(angles)
+        self.periodic = np.allclose(coords[0], coords[-1], atol=1e-9)
+        if self.periodic:
+            coords[-1] = coords[0] # exactly periodic for the spline boundary condition
+        # (4 x cells x joints x 2) polynomial coefficients, highest power first
+        spline = CubicSpline(angles, coords, axis=0, bc_type="periodic" if self.periodic else "not-a-knot")
+        self.coefficients = spline.c
+        self.knots = coords
+
+        self.rod_start = mechanism.rod_indices[:, 0]
+        self.rod_end = mechanism.rod_indices[:, 1]
+        self.ref_rod_lengths = self.solver.ref_rod_lengths
+        # interpolation error bound: the rod length error is largest in the middle of the cells
+        self.max_residual = float(self.residuals(self.interpolate(angles[:-1] + self.step / 2)).max(initial=0.0))
+
+    def interpolate(self, angles): # (N,) angles in radians -> (N x joints x 2) interpolated poses
+        angles = np.mod(np.asarray(angles, dtype=float), 2 * np.pi)
+        cells = np.minimum((angles / self.step).astype(int), self.num_cells - 1)
+        t = (angles - cells * self.step)[:, None, None]
+        c = self.coefficients[:, cells]
+        poses = ((c[0] * t + c[1]) * t + c[2]) * t + c[3]
+        # the crank joints are known exactly
+        rotating, rotating_positions = self.mechanism.calculate_rotating_joint_positions(angles)
+        poses[:, rotating] = rotating_positions
+        return poses
+
+    def residuals(self, poses): # (N x joints x 2) -> (N,) largest rod length error of every pose
+        rods = poses[:, self.rod_end] - poses[:, self.rod_start]
+        return np.abs(np.hypot(rods[..., 0], rods[..., 1]) - self.ref_rod_lengths).max(axis=1, initial=0.0)
+
+    def poses(self, angles): # (N,) angles in radians -> (N x joints x 2), interpolated or exact within the tolerance
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        poses = self.interpolate(angles)
+        inexact = np.flatnonzero(self.residuals(poses) > self.tolerance)
+        if len(inexact) > 0:
+            with self.lock:
+                # warm start from the nearest knot, so the exact solve stays on the branch of the table
+                # (the continuation of the numeric solver restarts there instead of following its own history)
+                for i in inexact:
+                    knot = int(round(np.mod(angles[i], 2 * np.pi) / self.step))
+                    restart_solver(self.solver, knot * self.step, self.knots[knot])
+                    self.solver.solve(angles[i])
+                    poses[i] = self.mechanism.get_joint_coords_array()
+                self.resolves += len(inexact)
+        return poses
+
+    def pose(self, angle: float): # angle in radians -> (joints x 2)
+        return self.poses([angle])[0]
+
+if __name__ == "__main__":
+    # run from the repository root: python modules/table.py
+    import os
+    import time
+    from json2config import load_mechanism_from_config
+    from solver import AnalyticSolver
+    config_dir = "configurations"
+    for config_file in sorted(f for f in os.listdir(config_dir) if f.endswith(".json")):
+        config_path = os.path.join(config_dir, config_file)
+        start_time = time.perf_counter()
+        table = TrajectoryTable(load_mechanism_from_config(config_path))
+        build_time = time.perf_counter() - start_time
+
+        # random angles against exact solves
+        angles = np.random.default_rng(0).uniform(-4 * np.pi, 4 * np.pi, 10000)
+        start_time = time.perf_counter()
+        poses = table.poses(angles)
+        query_time = time.perf_counter() - start_time
+        reference = AnalyticSolver(load_mechanism_from_config(config_path))
+        exact = np.array([(reference.solve(angle), reference.mechanism.get_joint_coords_array())[1] for angle in angles[:500]])
+        error = np.abs(poses[:500] - exact).max()
+        print(f"{config_file:45s} build {build_time:.3f} s, {len(angles) / query_time:10.0f} poses/s, "
+              f"residual bound {table.max_residual:.1e}, max error {error:.1e}, re-solved {table.resolves}")
+        assert table.periodic, "Table is not periodic!"
+        assert error < 1e-4, "Interpolated poses differ from the exact solution!"
+        assert table.residuals(poses).max() <= table.tolerance, "Pose outside the tolerance!"
+        assert np.allclose(table.pose(0.0), table.knots[0]), "Pose at a knot differs!"
+
+    # a coarse table has to fall back to exact solves
+    coarse = TrajectoryTable(load_mechanism_from_config(config_path), resolution=np.deg2rad(30), tolerance=1e-9)
+    pose = coarse.pose(np.deg2rad(47))
+    assert coarse.resolves == 1 and coarse.residuals(pose[None]).max() < 1e-9, "Exact re-solve failed!"
+    # the numeric solver continues from the knot, not from the angle it solved before
+    config_path = os.path.join(config_dir, "Strandbeest-Bein_configuration.json")
+    coarse = TrajectoryTable(load_mechanism_from_config(config_path), "numeric", resolution=np.deg2rad(30), tolerance=1e-9)
+    angles = np.deg2rad([47, 200, 13, 331])
+    reference = AnalyticSolver(load_mechanism_from_config(config_path)).sweep(angles)
+    for angle, exact in zip(angles, reference):
+        assert np.abs(coarse.pose(angle) - exact).max() < 1e-6, "Numeric re-solve left the branch of the table!"
+    assert coarse.resolves == len(angles), "Exact re-solve failed!"
+    print("All tests passed!")
@@ -1,17 +1,19 @@
 import os
 import sys
-import csv
-import json
-import time
 import numpy as np
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 
 sys.path.append(os.path.abspath("modules")) # somehow mechanism cannot be found without this code line
 
-from modules.json2config import load_mechanism_from_config
-from modules.solver import NumericSolver
+from modules.artifact import load_mechanism
+from modules.solver import AnalyticSolver, COARSE_STEP
+from modules import render, raster
+from modules.export import FORMATS, MIME_TYPES
+from modules.cache import TrajectoryCache
+from modules.jobs import JobQueue
+
+# seconds between two looks of a page at the job it waits for (short, so the preview of the coarse pass shows up quickly)
+JOB_POLL_INTERVAL = 0.25
 
 # load available JSON configurations from "configurations" folder
 def load_configurations():
@@ -21,144 +23,46 @@ def load_configurations():
         os.makedirs(config_dir)
     return [f for f in os.listdir(config_dir) if f.endswith(".json")]
 
-def get_joint_coords(mechanism):
-    return [(joint.x, joint.y) for joint in mechanism.joints]
-
-def calculate_solved_coords(mechanism, solver, start_deg, end_deg, num_frames): # returns dictionary of frame index to joint position
-    angles = np.linspace(start_deg, end_deg, num_frames)
-    solved = {}
-    for i, angle in enumerate(angles):
-        solver.solve(np.deg2rad(angle))
-        solved[i] = get_joint_coords(mechanism)
-    return solved, angles
-
-def save_moving_coords_csv(solved_coords, angles): # saves moving coordinates to a CSV file
-    csv_path = "outputs/moving_coords.csv"
-    with open(csv_path, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["joint_nr", "angle", "x_pos", "y_pos"])
-        for frame in sorted(solved_coords.keys()):
-            angle = angles[frame]
-            joints = solved_coords[frame]
-            for joint_nr, (x, y) in enumerate(joints):
-                writer.writerow([joint_nr, angle, x, y])
-    return csv_path
-
-def get_axis_limits(solved_coords): # reads in solved coordinates and returns axis limits rounded to the next multiple of 5
-    all_x, all_y = [], []           # (might be making erros at specific configurations when the fixed joint is further away than the moving joint -> test?)
-    for coords in solved_coords.values():
-        for (x, y) in coords:
-            all_x.append(x)
-            all_y.append(y)
-    x_min, x_max = min(all_x), max(all_x)
-    y_min, y_max = min(all_y), max(all_y)
-    x_lim = (int(x_min // 5 * 5), int((x_max // 5 + 1) * 5))
-    y_lim = (int(y_min // 5 * 5), int((y_max // 5 + 1) * 5))
-    return x_lim, y_lim
-
-def draw_frame(mechanism, coords, x_lim, y_lim): # draws a single frame of the mechanism at the given joint coordinates
-    fig, ax = plt.subplots()
-    ax.set_aspect('equal')
-    ax.set_xlim(x_lim)
-    ax.set_ylim(y_lim)
-    ax.set_title("Mechanism Frame")
-    ax.set_xlabel("x")
-    ax.set_ylabel("y")
-    
-    # Plot rotation center
-    rotation_center = None
-    for joint in mechanism.joints:
-        if joint.rotate_center is not None:
-            rotation_center = joint.rotate_center
-            break
-    if rotation_center:
-        ax.plot(rotation_center[0], rotation_center[1], 'ro', markersize=5)
-        circle = plt.Circle(rotation_center, np.linalg.norm(np.array([joint.x, joint.y]) - np.array(rotation_center)), color='r', fill=False)
-        ax.add_patch(circle)
-    
-    # Plot rods as blue lines.
-    for rod in mechanism.rods:
-        s_idx = mechanism.joints.index(rod.start)
-        e_idx = mechanism.joints.index(rod.end)
-        sx, sy = coords[s_idx]
-        ex, ey = coords[e_idx]
-        ax.plot([sx, ex], [sy, ey], 'bo-', lw=2)
-
-    # Plot joints as green dots. (deactivated to match animation)
-    #for (x, y) in coords:
-    #    ax.plot(x, y, 'go')
-    
-    img_path = "outputs/frame.png"
-    fig.savefig(img_path)
-    plt.close(fig)
-    return img_path
-
-def generate_animation(mechanism, solved_coords, interval): # generates an animation of the mechanism
-    frames = len(solved_coords)
-    x_lim, y_lim = get_axis_limits(solved_coords)
-    fig, ax = plt.subplots()
-    ax.set_aspect('equal')
-    ax.set_xlim(x_lim)
-    ax.set_ylim(y_lim)
-    ax.set_title(f"Mechanism Animation")
-    ax.set_xlabel("x")
-    ax.set_ylabel("y")
-    
-    # Plot rotation center
-    rotation_center = None
-    for joint in mechanism.joints:
-        if joint.rotate_center is not None:
-            rotation_center = joint.rotate_center
-            break
-    if rotation_center:
-        ax.plot(rotation_center[0], rotation_center[1], 'ro', markersize=5)
-        circle = plt.Circle(rotation_center, np.linalg.norm(np.array([joint.x, joint.y]) - np.array(rotation_center)), color='r', fill=False)
-        ax.add_patch(circle)
-    
-    # Create a line for each rod.
-    rods_lines = [ax.plot([], [], 'bo-', lw=2)[0] for _ in mechanism.rods]
-    
-    def initialize_lines():
-        for line in rods_lines:
-            line.set_data([], [])
-        return rods_lines
-    
-    def update(frame):
-        coords = solved_coords[frame]
-        for line, rod in zip(rods_lines, mechanism.rods):
-            s_idx = mechanism.joints.index(rod.start)
-            e_idx = mechanism.joints.index(rod.end)
-            sx, sy = coords[s_idx]
-            ex, ey = coords[e_idx]
-            line.set_data([sx, ex], [sy, ey])
-        return rods_lines
-    
-    ani = animation.FuncAnimation(fig, update, frames=frames, init_func=initialize_lines, blit=True, interval=interval)
-    gif_path = "outputs/animation.gif"
-    ani.save(gif_path, writer="pillow")
-    plt.close(fig)
-    return gif_path
-
-def load_leaderboard():
-    leaderboard_path = "leaderboard.json"
-    if os.path.exists(leaderboard_path):
-        with open(leaderboard_path, "r") as file:
-            return json.load(file)
-    return {}
-
-def save_leaderboard(leaderboard):
-    leaderboard_path = "leaderboard.json"
-    with open(leaderboard_path, "w") as file:
-        json.dump(leaderboard, file, indent=4)
-
-def update_leaderboard(config_name, time_taken):
-    leaderboard = load_leaderboard()
-    machine_name = os.getenv('COMPUTERNAME', 'Unknown')
-    if config_name not in leaderboard:
-        leaderboard[config_name] = {}
-    if machine_name not in leaderboard[config_name] or leaderboard[config_name][machine_name] > time_taken:
-        leaderboard[config_name][machine_name] = time_taken
-    save_leaderboard(leaderboard)
+@st.cache_resource
+def get_trajectory_cache(): # one trajectory cache shared by all sessions and buttons
+    return TrajectoryCache()
+
+@st.cache_resource
+def get_job_queue(): # one queue of background jobs for all sessions, identical requests share a job
+    return JobQueue(cache=get_trajectory_cache())
+
+def submit_job(state_key, job, config_path):
+    # the session only remembers which job it waits for (and for which configuration)
+    st.session_state[state_key] = (job.id, config_path)
+
+def show_job(state_key, config_path, label, show_result):
+    # progress of the job of this session, then its result: while the job is pending only this fragment reruns every
+    # JOB_POLL_INTERVAL seconds, the whole page reruns once when it finished (and then stops polling)
+    job_id, job_config = st.session_state.get(state_key, (None, None))
+    job = get_job_queue().get(job_id)
+    if job is None or job_config != config_path:
+        return
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL if job.pending else None)
+    def poll():
+        if job.pending:
+            text = f"{label}: queued" if job.status == "queued" else f"{label}: {job.stage or 'frame'} {job.done} of {job.total}"
+            st.progress(job.progress, text=text)
+            if job.preview is not None: # coarse preview of the whole cycle while the full resolution is still in progress
+                st.image(job.preview, caption=f"Preview (every {np.rad2deg(COARSE_STEP):.0f}°)")
+        elif st.session_state.get(f"{state_key}_polling"):
+            st.session_state[f"{state_key}_polling"] = False
+            st.rerun(scope="app")
+        elif job.status == "failed":
+            st.error(f"{label} failed: {job.error}")
+        else:
+            try:
+                show_result(job)
+            except FileNotFoundError: # the job was dropped with its files meanwhile, the same request is submitted again
+                submit_job(state_key, get_job_queue().resubmit(job), config_path)
+                st.rerun(scope="app")
+    st.session_state[f"{state_key}_polling"] = job.pending
+    poll()
 
 def grafic_engine():
     st.title("Mechanism Visualization")
@@ -173,8 +77,9 @@ def grafic_engine():
     
     # Initialize mechanism and solver.
     try:
-        mechanism = load_mechanism_from_config(config_path)
-        solver = NumericSolver(mechanism)
+        # compiled once per configuration content, later reruns read the artifact from memory
+        mechanism = load_mechanism(config_path)
+        AnalyticSolver(mechanism) # a mechanism that can not be solved is reported here, before any job is submitted
     except Exception as e:
         st.error(f"Error loading configuration: {e}")
         return
@@ -184,18 +89,31 @@ def grafic_engine():
     sim_resolution = st.number_input("Simulation resolution (degrees per step):", min_value=0.1, value=5.0, step=0.1)
     framerate = st.number_input("Framerate (frames per second):", min_value=1, value=240, step=1)
     interval = 1000 / framerate
-
-    # Button to download moving coordinates as CSV.
-    if st.button("Generate Moving Coordinates CSV"):
-        # Compute moving coordinates for a full cycle (0° to 360°)
+    # matplotlib draws axes and titles, the raster renderer skips them and is much faster for long animations
+    backends = {"Matplotlib": "matplotlib", "Raster (fast)": "raster"}
+    backend_name = backends[st.selectbox("Renderer", list(backends))]
+    backend = {"matplotlib": render, "raster": raster}[backend_name]
+    cache = get_trajectory_cache()
+
+    # Button to download moving coordinates.
+    export_format = st.selectbox("Export format", FORMATS)
+    export_kinematics = st.checkbox("Include joint velocities and accelerations")
+    crank_speed = st.number_input("Crank speed (rad/s):", value=2 * np.pi, disabled=not export_kinematics)
+    if st.button("Generate Moving Coordinates"):
+        # Compute moving coordinates for a full cycle (0° to 360°) in the background, every job writes its own file
         num_frames = int((360 - 0) / sim_resolution) + 1
-        solved_coords, angles = calculate_solved_coords(mechanism, solver, 0, 360, num_frames)
-        csv_path = save_moving_coords_csv(solved_coords, angles)
-        with open(csv_path, "rb") as file:
-            st.download_button(label="Download CSV",
-                               data=file,
-                               file_name="moving_coords.csv",
-                               mime="text/csv")
+        job = get_job_queue().export(config_path, 0, 360, num_frames, export_format, crank_speed if export_kinematics else None)
+        submit_job("export_job", job, config_path)
+
+    def show_export(job):
+        export_format = job.result["format"]
+        with open(job.result["path"], "rb") as file:
+            data = file.read()
+        st.download_button(label=f"Download {export_format.upper()}",
+                           data=data,
+                           file_name=f"moving_coords.{export_format}",
+                           mime=MIME_TYPES[export_format])
+    show_job("export_job", config_path, "Export", show_export)
 
     # Render single frame.
     st.markdown("### Render a Single Frame")
@@ -206,15 +124,19 @@ def grafic_engine():
         except ValueError:
             st.error("Invalid frame angle")
             return
-        # Precompute full cycle positions (0° to 360° in 361 frames) to set axis limits.
-        full_coords, _ = calculate_solved_coords(mechanism, solver, 0, 360, 361) # unfortunatly very inefficient for only one frame
-        #full_coords, _ = compute_solved_coords(mechanism, solver, 0, frame_angle, 1) # to set axis limits only for the current frame (mostyl to nerrow)
-        x_lim, y_lim = get_axis_limits(full_coords)
-
-        # Solve for the requested frame.
-        solver.solve(np.deg2rad(frame_angle))
-        curr_coords = get_joint_coords(mechanism)
-        img_path = draw_frame(mechanism, curr_coords, x_lim, y_lim)
+        try:
+            # Full cycle positions (0° to 360° in 361 frames) to set axis limits, solved once and cached.
+            x_lim, y_lim = cache.get_axis_limits(config_path, 0, 360, 361)
+
+            # Take the requested frame from a cached sweep, otherwise interpolate it in the precomputed table of the configuration
+            # (solved exactly only if the interpolation error exceeds the tolerance).
+            curr_coords = cache.lookup_frame(config_path, frame_angle % 360)
+            if curr_coords is None:
+                curr_coords = cache.get_table(config_path).pose(np.deg2rad(frame_angle))
+        except ValueError as e: # the mechanism can not be assembled at some angle of the revolution
+            st.error(f"Frame can not be solved: {e}")
+            return
+        img_path = backend.draw_frame(mechanism, curr_coords, x_lim, y_lim)
         st.image(img_path, caption=f"Frame at {frame_angle}°")
         with open(img_path, "rb") as file:
             st.download_button(label="Download Frame",
@@ -233,22 +155,24 @@ def grafic_engine():
         except ValueError:
             st.error("Invalid start or end angle")
             return
-        num_frames = int((end_angle - start_angle) / sim_resolution)
-        start_time = time.time()
-        solved_coords, angle = calculate_solved_coords(mechanism, solver, start_angle, end_angle, num_frames)
-        x_lim, y_lim = get_axis_limits(solved_coords)
-        gif_path = generate_animation(mechanism, solved_coords, interval)
-        end_time = time.time()
-        time_taken = end_time - start_time
-        st.write(f"Time taken: {time_taken:.2f} seconds")
-        if sim_resolution == 5.0 and framerate == 240:
-            update_leaderboard(selected_config, time_taken)
-        st.image(gif_path, caption="Mechanism Animation")
-        with open(gif_path, "rb") as file:
+        num_frames = max(1, int((end_angle - start_angle) / sim_resolution)) # at least one frame for short angle ranges
+        # solved and encoded in the background, the page shows the progress per frame meanwhile
+        job = get_job_queue().render(config_path, start_angle, end_angle, num_frames, interval, backend_name)
+        submit_job("animation_job", job, config_path)
+
+    def show_animation(job):
+        st.write(f"Time taken: {job.elapsed:.2f} seconds" + (" (cached trajectory)" if job.result["cached"] else ""))
+        # point out dead points, assembly branch flips and failed frames of the animated sweep (found by the render job)
+        diagnostics = job.result["diagnostics"]
+        if len(diagnostics["index"]) > 0:
+            st.warning(f"Check the animation: {diagnostics['summary']}. A finer simulation resolution may help.")
+        st.image(job.result["path"], caption="Mechanism Animation")
+        with open(job.result["path"], "rb") as file:
             st.download_button(label="Download Animation",
                                data=file,
                                file_name="mechanism_animation.gif",
                                mime="image/gif")
+    show_job("animation_job", config_path, "Animation", show_animation)
 
 if __name__ == "__main__":
     grafic_engine()
\ No newline at end of file